@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   BridgeLogger
+# % Description: Asynchronous logger of the bridge. The callers only put a
+# % small tuple (time, level, message, arguments, fields) on a queue. The formatting
+# % ("message % arguments") and the console/file output happen in a background
+# % thread, so slow console I/O never blocks the MIDI ingest or HTTP dispatch.
+# % Optional file output with size based rotation, as text or JSON lines. A
+# % JSON line keeps the format string, its arguments and the named fields of
+# % the record (trigger, target ...) as separate keys next to the text.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import time;
+import queue;
+import threading;
+import atexit;
+
+# % Log levels
+LOG_DEBUG   = 10;
+LOG_INFO    = 20;
+LOG_WARNING = 30;
+LOG_ERROR   = 40;
+LOG_LEVELS  = {"debug":LOG_DEBUG, "info":LOG_INFO, "warning":LOG_WARNING, "error":LOG_ERROR};
+LOG_LEVEL_NAMES = {value:name.upper() for name,value in LOG_LEVELS.items()};
+
+# % Control records of the logger thread
+_CONFIGURE = object();
+_FLUSH     = object();
+_STOP      = object();
+
+
+# ==============================================================
+class BridgeLogger:
+
+    # properties
+        level=LOG_INFO;
+        console=True;
+        filePath="";
+        fileMaxBytes=1024*1024;
+        fileBackups=3;
+        fileFormat="text";
+    # end
+
+    # methods
+        def __init__(L,formatObject=str):
+            # % formatObject - formats the non string messages (objects)
+            L.formatObject = formatObject;
+            L.queue = queue.SimpleQueue();
+            L.file = None;
+            L.thread = threading.Thread(target=L.run, name="bridge-logger", daemon=True);
+            L.thread.start();
+            atexit.register(L.stop);
+        # end
+
+        def log(L,level,msg,args=(),fields=None):
+            # % Called from any thread, only enqueues the record
+            if level >= L.level:
+                L.queue.put((time.time(),level,msg,args,fields));
+            # end
+        # end
+
+        def configure(L,level="info",console=True,filePath="",fileMaxKB=1024,fileBackups=3,fileFormat="text"):
+            # % The level applies straight away, the output settings in order with the queued records
+            L.level = LOG_LEVELS.get(str(level).strip().lower(),LOG_INFO);
+            L.queue.put((0.,_CONFIGURE,None,(console,filePath,int(fileMaxKB)*1024,int(fileBackups),fileFormat.strip().lower()),None));
+        # end
+
+        def flush(L,timeout=2.0):
+            # % Wait until the records queued so far have been written
+            done = threading.Event();
+            L.queue.put((0.,_FLUSH,None,done,None));
+            done.wait(timeout);
+        # end
+
+        def stop(L,timeout=2.0):
+            if L.thread.is_alive():
+                L.queue.put((0.,_STOP,None,(),None));
+                L.thread.join(timeout);
+            # end
+        # end
+
+        def run(L):
+            # % The logger thread
+            while True:
+                record = L.queue.get();
+                level = record[1];
+                if level is _STOP:
+                    break;
+                # end
+                # % An error (a bad log file ...) never ends the logger thread
+                try:
+                    if level is _FLUSH:
+                        L.flushOutput();
+                    elif level is _CONFIGURE:
+                        L.applyConfiguration(*record[3]);
+                    else:
+                        L.write(record);
+                    # end
+                except Exception as err:
+                    sys.stderr.write("Logger error: "+str(err)+os.linesep);
+                finally:
+                    if level is _FLUSH:
+                        record[3].set();
+                    # end
+                # end
+            # end
+            L.flushOutput();
+            if L.file is not None:
+                L.file.close();
+                L.file = None;
+            # end
+        # end
+
+        def formatMessage(L,msg,args):
+            if not(isinstance(msg,str)):
+                return L.formatObject(msg);
+            # end
+            if args:
+                try:
+                    return msg % args;
+                except (TypeError,ValueError):
+                    return msg+" "+repr(args);
+                # end
+            # end
+            return msg;
+        # end
+
+        def write(L,record):
+            timestamp, level, msg, args, fields = record;
+            text = L.formatMessage(msg,args);
+            if L.console:
+                # % To standart output
+                sys.stdout.write(text+os.linesep);
+            # end
+            if L.file is not None:
+                if L.fileFormat == "json":
+                    import json;
+                    entry = dict(fields or {});# % The named fields, never over the keys below
+                    entry.update({"time":timestamp, "level":LOG_LEVEL_NAMES.get(level,str(level)), "msg":text});
+                    if isinstance(msg,str) and args:# % The format and its values, for the log tools
+                        entry["format"] = msg;
+                        entry["args"] = list(args);
+                    # end
+                    line = json.dumps(entry,default=str);
+                else:
+                    line = time.strftime("%Y-%m-%d %H:%M:%S",time.localtime(timestamp))+ \
+                           ".%03i %-7s %s" % (int(timestamp*1000)%1000,LOG_LEVEL_NAMES.get(level,str(level)),text);
+                # end
+                L.file.write(line+"\n");
+                if L.file.tell() >= L.fileMaxBytes:
+                    L.rotate();
+                # end
+            # end
+        # end
+
+        def flushOutput(L):
+            sys.stdout.flush();
+            if L.file is not None:
+                L.file.flush();
+            # end
+        # end
+
+        def applyConfiguration(L,console,filePath,fileMaxBytes,fileBackups,fileFormat):
+            L.console = console;
+            L.fileMaxBytes = max(fileMaxBytes,1024);
+            L.fileBackups = max(fileBackups,0);
+            L.fileFormat = fileFormat;
+            if L.file is not None:
+                L.file.close();
+                L.file = None;
+            # end
+            L.filePath = filePath;
+            if filePath:
+                try:
+                    L.file = open(filePath,"a",encoding="utf-8");
+                except OSError:
+                    L.console = True;# % Keep logging to the console
+                    raise;
+                # end
+            # end
+        # end
+
+        def rotate(L):
+            # % log.txt -> log.txt.1 -> log.txt.2 ... (the oldest is removed)
+            L.file.close();
+            for n in range(L.fileBackups,0,-1):
+                source = L.filePath+("."+str(n-1) if n > 1 else "");
+                if os.path.exists(source):
+                    os.replace(source,L.filePath+"."+str(n));
+                # end
+            # end
+            if L.fileBackups == 0:
+                os.remove(L.filePath);
+            # end
+            L.file = open(L.filePath,"a",encoding="utf-8");
+        # end
+    # end
+# end
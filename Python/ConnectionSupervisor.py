@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   ConnectionSupervisor
+# % Description: Background supervisor of the presentation server connection.
+# % It probes the server (and the autodiscovery) in its own thread with an
+# % exponential backoff with jitter and tracks the connection state:
+# %   "connected" - the server answers, the circuit is closed.
+# %   "degraded"  - recent failed calls, still sending, probing more often.
+# %   "down"      - the circuit is open, the cues fail fast (dropped and
+# %                 counted) until a probe finds the server again.
+# % The HTTP dispatcher reports the outcome of every call and asks the
+# % supervisor before sending, so the MIDI ingest never waits on the server.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import time;
+import random;
+import threading;
+
+from BridgeLogger import LOG_WARNING;
+
+STATE_CONNECTED = "connected";
+STATE_DEGRADED  = "degraded";
+STATE_DOWN      = "down";
+
+
+# ==============================================================
+class ConnectionSupervisor:
+
+    # properties
+        state=STATE_DOWN;
+        consecutiveFailures=0;
+        reconnects=0;
+        rejected=0;# % Cues failed fast while the circuit was open
+    # end
+
+    # methods
+        def __init__(S,B,healthCheckSec=5.,backoffMinSec=0.5,backoffMaxSec=30.,failureThreshold=3):
+            S.B = B;
+            S.healthCheckSec = healthCheckSec;
+            S.backoffMinSec = backoffMinSec;
+            S.backoffMaxSec = max(backoffMaxSec,backoffMinSec);
+            S.failureThreshold = max(1,int(failureThreshold));
+            S.state = STATE_DOWN;
+            S.consecutiveFailures = 0;
+            S.everConnected = False;
+            S.reconnects = 0;
+            S.rejected = 0;
+            S.attempt = 0;
+            S.running = False;
+            S.lock = threading.Lock();
+            S.wake = threading.Event();
+            S.connected = threading.Event();
+            S.thread = threading.Thread(target=S.run, name="connection-supervisor", daemon=True);
+        # end
+
+        def start(S):
+            S.running = True;
+            S.thread.start();
+            return S;
+        # end
+
+        def stop(S):
+            S.running = False;
+            S.wake.set();
+            S.thread.join(1.0);
+        # end
+
+        def waitConnected(S,timeout):
+            return S.connected.wait(timeout);
+        # end
+
+        def allowRequest(S):
+            # % Circuit breaker: fail fast while the server is down
+            if S.state == STATE_DOWN:
+                S.rejected += 1;
+                return False;
+            # end
+            return True;
+        # end
+
+        def reportSuccess(S):
+            if S.state != STATE_CONNECTED or S.consecutiveFailures:
+                S.setState(STATE_CONNECTED);
+            # end
+        # end
+
+        def reportFailure(S):
+            # % Called by the dispatcher when a call fails
+            with S.lock:
+                S.consecutiveFailures += 1;
+                failures = S.consecutiveFailures;
+            # end
+            if failures >= S.failureThreshold:
+                S.setState(STATE_DOWN);
+            else:
+                S.setState(STATE_DEGRADED);
+            # end
+            S.wake.set();# % Probe straight away
+        # end
+
+        def setState(S,state):
+            with S.lock:
+                previous = S.state;
+                S.state = state;
+                if state == STATE_CONNECTED:
+                    S.consecutiveFailures = 0;
+                    S.attempt = 0;
+                # end
+            # end
+            if state == previous:
+                return;
+            # end
+            if state == STATE_CONNECTED:
+                if previous == STATE_DOWN and S.everConnected:# % Not a recovery from degraded
+                    S.reconnects += 1;
+                # end
+                S.everConnected = True;
+                S.connected.set();
+                S.B.log("Server ["+S.B.get_serverURL()+"] is connected");
+                S.B.onServerConnected();
+            else:
+                S.connected.clear();
+                S.B.log("[warning]:Server ["+S.B.get_serverURL()+"] is "+state,level=LOG_WARNING);
+                if state == STATE_DOWN:
+                    S.B.onServerDown();
+                # end
+            # end
+        # end
+
+        def backoff(S):
+            # % Exponential backoff with (full) jitter
+            delay = min(S.backoffMaxSec,S.backoffMinSec*(2**S.attempt));
+            S.attempt = min(S.attempt+1,30);
+            return random.uniform(S.backoffMinSec,max(delay,S.backoffMinSec));
+        # end
+
+        def probe(S):
+            # % Test the configured server, then the autodiscovery. Returns the
+            # % response of the server or None.
+            if S.B.get_serverURL():
+                connectionOK, response = S.B.testConnection(quiet=True);
+                if connectionOK:
+                    return response;
+                # end
+            # end
+            if S.B.Server_autodiscover and S.B.autodiscoverServer():
+                connectionOK, response = S.B.testConnection(quiet=True);
+                if connectionOK:
+                    return response;
+                # end
+            # end
+            return None;
+        # end
+
+        def run(S):
+            while S.running:
+                response = S.probe();
+                if response is not None:
+                    S.reportSuccess();
+                    S.B.checkLogin(response);
+                    delay = S.healthCheckSec;
+                else:
+                    with S.lock:
+                        S.consecutiveFailures += 1;
+                        failures = S.consecutiveFailures;
+                    # end
+                    S.setState(STATE_DOWN if failures >= S.failureThreshold or not(S.everConnected) else STATE_DEGRADED);
+                    delay = S.backoff();
+                # end
+                S.wake.wait(delay);
+                S.wake.clear();
+            # end
+        # end
+
+        def stats(S):
+            return {"state":S.state, "reconnects":S.reconnects, "rejected":S.rejected};
+        # end
+    # end
+# end
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   MidiTransport, CueScheduler
+# % Description: Lookahead scheduling of the cue timeline on the transport of
+# % the DAW. The transport position follows the MIDI messages the DAW sends
+# % along with the cues: MIDI clock (24 ticks per beat) with Start, Continue,
+# % Stop and the Song Position Pointer, or the MIDI timecode quarter frames.
+# % Between two messages the position is extrapolated at the measured tempo
+# % (or in real time for the timecode).
+# % The scheduler thread sends every timeline cue ahead of its position by the
+# % rolling match->response latency of its endpoint (capped), so the slide
+# % changes on the beat instead of one round trip later. After a jump of the
+# % transport (song position, start, a timecode locate) the timeline resumes
+# % from the new position; a cue already later than the tolerance is skipped
+# % and counted (missed) rather than sent late.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import time;
+import threading;
+from bisect import bisect_left;
+
+from BridgeLogger import LOG_WARNING;
+
+# % System messages of the transport
+MIDI_CLOCK = 0xF8;
+MIDI_START = 0xFA;
+MIDI_CONTINUE = 0xFB;
+MIDI_STOP = 0xFC;
+MIDI_SONG_POSITION = 0xF2;
+MIDI_TIMECODE_QUARTER = 0xF1;
+TRANSPORT_MESSAGES = frozenset((MIDI_CLOCK,MIDI_START,MIDI_CONTINUE,MIDI_STOP,MIDI_SONG_POSITION,MIDI_TIMECODE_QUARTER));
+# % MIDI clock ticks per beat (quarter note), per song position unit (16th note)
+CLOCK_TICKS_PER_BEAT = 24;
+CLOCK_TICKS_PER_SPP = 6;
+# % Frame rates of the timecode rate code (29.97 drop frame counts as 30)
+TIMECODE_RATES = (24.,25.,30.,30.);
+# % The timecode is stopped when no quarter frame is received for this long
+TIMECODE_TIMEOUT_SEC = 0.1;
+# % A timecode this far from the extrapolated position is a locate
+TIMECODE_JUMP_SEC = 0.1;
+# % Weight of the newest tick interval in the tempo estimate
+CLOCK_PERIOD_ALPHA = 0.1;
+
+
+# ==============================================================
+# Transport position of the DAW from the MIDI clock and timecode messages
+class MidiTransport:
+
+    # properties
+        playing=False;
+        # % Incremented at every jump of the position (start, song position, locate)
+        generation=0;
+        # % Seconds per MIDI clock tick (0 before the tempo is known)
+        tickPeriod=0.;
+        # % MIDI input the transport follows (index of the first input sending it)
+        source=None;
+    # end
+
+    # methods
+        def __init__(X):
+            X.lock = threading.Lock();
+            X.changed = threading.Event();# % Set at every start, stop and jump
+            X.playing = False;
+            X.generation = 0;
+            X.source = None;
+            # % MIDI clock: ticks since the song start and the time of the last one
+            X.ticks = 0;
+            X.tickTime = None;
+            X.tickPeriod = 0.;
+            # % MIDI timecode: quarter frame pieces, last full position and its time
+            X.pieces = [0]*8;
+            X.nextPiece = 0;
+            X.timecode = None;
+            X.timecodeTime = 0.;
+            X.quarterTime = -TIMECODE_TIMEOUT_SEC;
+        # end
+
+        def feed(X,packets,midiNow,tRead):
+            # % Called from the control loop with the packets of one read, the
+            # % device timestamps give the time of every message
+            for data, timestamp in packets:
+                status = data[0];
+                if status not in TRANSPORT_MESSAGES:
+                    continue;
+                # end
+                if X.source is None:
+                    X.source = data[3];
+                elif not(data[3] == X.source):
+                    continue;# % Another input sending a transport, only the first is followed
+                # end
+                t = tRead-max(midiNow-timestamp,0)/1000.;
+                with X.lock:
+                    if status == MIDI_CLOCK:
+                        X.clockTick(t);
+                    elif status == MIDI_TIMECODE_QUARTER:
+                        X.quarterFrame(data[1],t);
+                    elif status == MIDI_SONG_POSITION:
+                        X.jump(((data[2] << 7) | data[1])*CLOCK_TICKS_PER_SPP-1);
+                    elif status == MIDI_START:
+                        X.jump(-1);# % The next tick is the beat 0
+                        X.playing = True;
+                    elif status == MIDI_CONTINUE:
+                        X.playing = True;
+                        X.tickTime = None;
+                        X.changed.set();
+                    elif status == MIDI_STOP:
+                        X.playing = False;
+                        X.tickTime = None;
+                        X.changed.set();
+                    # end
+                # end
+            # end
+        # end
+
+        def clockTick(X,t):
+            if not(X.playing):
+                return;
+            # end
+            interval = 0. if X.tickTime is None else t-X.tickTime;
+            if interval > 0:# % Not the first tick after a start/continue
+                if X.tickPeriod == 0:
+                    X.tickPeriod = interval;
+                elif interval < 4*X.tickPeriod:# % A gap in the clock is not a tempo
+                    X.tickPeriod += CLOCK_PERIOD_ALPHA*(interval-X.tickPeriod);
+                # end
+            # end
+            X.ticks += 1;
+            X.tickTime = t;
+        # end
+
+        def jump(X,ticks):
+            X.ticks = ticks;
+            X.tickTime = None;
+            X.generation += 1;
+            X.changed.set();
+        # end
+
+        def quarterFrame(X,value,t):
+            piece, nibble = value >> 4, value & 0x0F;
+            if not(piece == X.nextPiece or piece == 0):# % Out of order (reverse play or lost), wait for the next piece 0
+                X.nextPiece = 0;
+                return;
+            # end
+            X.pieces[piece] = nibble;
+            X.nextPiece = (piece+1) % 8;
+            X.quarterTime = t;
+            if piece < 7:
+                return;
+            # end
+            p = X.pieces;
+            rate = TIMECODE_RATES[(p[7] >> 1) & 0x03];
+            hours = ((p[7] & 0x01) << 4) | p[6];
+            seconds = hours*3600.+((p[5] << 4) | p[4])*60.+((p[3] << 4) | p[2])+((p[1] << 4) | p[0])/rate;
+            # % The position was sent with the piece 0, seven quarter frames ago
+            seconds += 7/(4*rate);
+            if X.timecode is None or abs(seconds-X.timecodeAt(t)) > TIMECODE_JUMP_SEC:
+                X.generation += 1;
+                X.changed.set();
+            # end
+            X.timecode = seconds;
+            X.timecodeTime = t;
+        # end
+
+        def timecodeAt(X,t):
+            return X.timecode+min(max(t-X.timecodeTime,0.),TIMECODE_TIMEOUT_SEC+2/24.);
+        # end
+
+        def position(X,unit,t):
+            # % (position, seconds per unit) of the running transport at the time t,
+            # % None while stopped or without the messages of the unit
+            with X.lock:
+                if unit == "seconds":
+                    if X.timecode is None or t-X.quarterTime > TIMECODE_TIMEOUT_SEC:
+                        return None;
+                    # end
+                    return (X.timecodeAt(t),1.);
+                # end
+                if not(X.playing) or X.tickPeriod == 0:
+                    return None;
+                # end
+                ticks = X.ticks;
+                if X.tickTime is not None:# % Extrapolated up to the next tick
+                    ticks += min(max(t-X.tickTime,0.)/X.tickPeriod,1.);
+                # end
+                return (ticks/CLOCK_TICKS_PER_BEAT,X.tickPeriod*CLOCK_TICKS_PER_BEAT);
+            # end
+        # end
+
+        def tempo(X):
+            return 60./(X.tickPeriod*CLOCK_TICKS_PER_BEAT) if X.tickPeriod else 0.;
+        # end
+# end
+
+
+# ==============================================================
+# Sends the timeline cues of the server targets ahead of the transport
+class CueScheduler:
+
+    # properties
+        B=None;# The bridge
+        leadMaxSec=0.5;
+        lateSec=0.25;
+        defaultLatencySec=0.02;
+        # % Longest sleep between two checks of the transport
+        pollSec=0.01;
+        # % Counters
+        fired=0;
+        missed=0;
+    # end
+
+    # methods
+        def __init__(S,B,transport,leadMaxSec=0.5,lateSec=0.25,defaultLatencySec=0.02):
+            S.B = B;
+            S.transport = transport;
+            S.leadMaxSec = max(leadMaxSec,0.);
+            S.lateSec = max(lateSec,0.);
+            S.defaultLatencySec = max(defaultLatencySec,0.);
+            S.fired = 0;
+            S.missed = 0;
+            # % {target: (timeline, transport generation, index of the next cue)}
+            S.cursors = {};
+            S.stopped = threading.Event();
+            S.thread = threading.Thread(target=S.run, name="cue-scheduler", daemon=True);
+        # end
+
+        def start(S):
+            S.thread.start();
+            return S;
+        # end
+
+        def stop(S):
+            S.stopped.set();
+            S.transport.changed.set();
+            S.thread.join(1.0);
+        # end
+
+        def run(S):
+            changed = S.transport.changed;
+            while not(S.stopped.is_set()):
+                changed.clear();# % Before the step, a change during it ends the wait
+                wait = S.step(time.perf_counter());
+                changed.wait(wait);
+            # end
+        # end
+
+        def lead(S,trigger):
+            # % How early a cue is sent: the latency of its (first) request
+            URL = trigger.HTTP_URL;
+            if trigger.Macro:
+                URL = next((step.HTTP_URL for step in trigger.Macro if step.HTTP_URL),URL);
+            # end
+            return min(S.B.latencyStats.estimate(URL,S.defaultLatencySec),S.leadMaxSec);
+        # end
+
+        def step(S,now):
+            # % Send the cues that are due, returns the time to the next one
+            wait = S.pollSec;
+            generation = S.transport.generation;
+            for T in S.B.targets:
+                timeline = T.timeline;
+                if not(timeline.Cues):
+                    continue;
+                # end
+                state = S.transport.position(timeline.Unit,now);
+                if state is None:# % Stopped
+                    continue;
+                # end
+                position, secondsPerUnit = state;
+                cursor = S.cursors.get(T.targetName);
+                if cursor is None or cursor[0] is not timeline or not(cursor[1] == generation):
+                    # % New timeline or a jump: resume from the current position
+                    index = bisect_left(timeline.Positions,position-S.lateSec/secondsPerUnit);
+                else:
+                    index = cursor[2];
+                # end
+                while index < len(timeline.Cues):
+                    trigger, argument = timeline.Cues[index];
+                    until = (timeline.Positions[index]-position)*secondsPerUnit;
+                    lead = S.lead(trigger);
+                    if until-lead > 0:
+                        wait = min(wait,until-lead);
+                        break;
+                    # end
+                    if until < -S.lateSec:
+                        S.missed += 1;
+                        S.B.log("[warning]:Timeline cue [%s%s] at %g missed by %.0f ms",trigger.HTTP_URL,argument,
+                                timeline.Positions[index],-until*1000.,level=LOG_WARNING);
+                    else:
+                        S.send(T,trigger,argument,now);
+                        S.B.log("Timeline cue [%s%s] at %g sent %.1f ms ahead",trigger.HTTP_URL,argument,timeline.Positions[index],until*1000.);
+                    # end
+                    index += 1;
+                # end
+                S.cursors[T.targetName] = (timeline,generation,index);
+            # end
+            return max(wait,0.0005);
+        # end
+
+        def send(S,T,trigger,argument,now):
+            # % Stage timestamps as a MIDI event matched now (no device lag)
+            S.fired += 1;
+            S.B.dispatcher.submit(T.targetName,(trigger,argument,[0.,now,now,now,0.,0.]));
+        # end
+
+        def stats(S):
+            return {"fired":S.fired, "missed":S.missed, "tempoBPM":round(S.transport.tempo(),2)};
+        # end
+    # end
+# end
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   ExternalLauncher
+# % Description: Runs the "External Executable" / "External Cmd" of the matched
+# % triggers (camera switches, lighting, local scripts) off the MIDI loop.
+# % The commands are put on a bounded queue and run by a fixed number of
+# % worker threads (the concurrency limit), with a timeout and the output
+# % captured to the log. The Python scripts (*.py) run in persistent, pre-warmed
+# % interpreters, so a cue doesn't pay the process and interpreter start-up.
+# % The placeholders {channel}, {note} and {velocity} in the command are
+# % replaced by the values of the MIDI message, "{cache:/lyrics}" by the cached
+# % response of a read trigger. Relative executables are looked up next to the
+# % preset file first.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import re;
+import time;
+import json;
+import shlex;
+import queue;
+import threading;
+import subprocess;
+
+from BridgeLogger import LOG_INFO,LOG_WARNING;
+
+# % Longest command output written to the log
+LAUNCH_OUTPUT_MAX = 2000;
+# % Placeholder of a cached read response in the command
+LAUNCH_CACHE_PLACEHOLDER = re.compile(r"\{cache:([^}]*)\}");
+
+
+# ==============================================================
+# A persistent Python interpreter running the scripts one at a time
+class PythonWorker:
+
+        def __init__(P,cwd):
+            P.process = subprocess.Popen([sys.executable,"-u",os.path.abspath(__file__),"--python-worker"],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                         cwd=cwd, text=True, bufsize=1);
+        # end
+
+        def run(P,script,args,timeout):
+            # % Returns (exit code, output), the worker is killed on a timeout
+            timer = threading.Timer(timeout,P.process.kill);
+            tStart = time.perf_counter();
+            timer.start();
+            try:
+                P.process.stdin.write(json.dumps({"script":script, "args":args})+"\n");
+                P.process.stdin.flush();
+                reply = P.process.stdout.readline();
+            except OSError:
+                reply = "";
+            finally:
+                timer.cancel();
+            # end
+            if not(reply):
+                P.process.kill();
+                P.process.wait();
+                if time.perf_counter()-tStart >= timeout:
+                    raise subprocess.TimeoutExpired(script,timeout);
+                # end
+                raise Exception("the Python worker exited");
+            # end
+            reply = json.loads(reply);
+            return reply["code"], reply["output"];
+        # end
+
+        def alive(P):
+            return P.process.poll() is None;
+        # end
+
+        def stop(P):
+            if P.alive():
+                P.process.stdin.close();
+                try:
+                    P.process.wait(1.0);
+                except subprocess.TimeoutExpired:
+                    P.process.kill();
+                # end
+            # end
+        # end
+# end
+
+
+# ==============================================================
+class ExternalLauncher:
+
+    # properties
+        maxConcurrent=2;
+        timeoutSec=10.;
+        pythonWorkers=1;
+        # % Counters
+        launched=0;
+        failed=0;
+        timedOut=0;
+        dropped=0;
+    # end
+
+    # methods
+        def __init__(X,log,baseDir,maxConcurrent=2,queueSize=16,timeoutSec=10.,pythonWorkers=1,cacheText=None):
+            X.log = log;
+            X.cacheText = cacheText;# % path -> cached response text
+            X.baseDir = baseDir;
+            X.maxConcurrent = max(1,int(maxConcurrent));
+            X.timeoutSec = timeoutSec;
+            X.pythonWorkers = max(0,int(pythonWorkers));
+            X.launched = 0;
+            X.failed = 0;
+            X.timedOut = 0;
+            X.dropped = 0;
+            X.queue = queue.Queue(maxsize=max(1,int(queueSize)));
+            X.idle = queue.Queue();# % Idle Python interpreters
+            X.workersStarted = 0;
+            X.lock = threading.Lock();
+            X.executables = {};
+            X.threads = [threading.Thread(target=X.run, name="launcher-"+str(n), daemon=True)
+                         for n in range(X.maxConcurrent)];
+            for thread in X.threads:
+                thread.start();
+            # end
+        # end
+
+        def prewarm(X):
+            # % Start the Python interpreters before the first cue
+            for n in range(X.pythonWorkers-X.workersStarted):
+                X.idle.put(X.newPythonWorker());
+            # end
+        # end
+
+        def newPythonWorker(X):
+            with X.lock:
+                X.workersStarted += 1;
+            # end
+            return PythonWorker(X.baseDir);
+        # end
+
+        def launch(X,trigger,midi):
+            # % Called from the control loop, never blocks
+            try:
+                X.queue.put_nowait((trigger,midi));
+                return True;
+            except queue.Full:
+                X.count("dropped");
+                X.log("[warning]:Launcher queue is full, dropped [%s %s] (dropped:%i)",
+                      trigger.ExternalExecutable,trigger.ExternalCmd,X.dropped,level=LOG_WARNING);
+                return False;
+            # end
+        # end
+
+        def run(X):
+            while True:
+                job = X.queue.get();
+                if job is None:# % Stop sentinel
+                    break;
+                # end
+                X.execute(*job);
+            # end
+        # end
+
+        def resolve(X,executable):
+            # % Relative executables next to the preset file, otherwise from the PATH
+            path = X.executables.get(executable);
+            if path is None:
+                local = os.path.join(X.baseDir,executable);
+                path = X.executables[executable] = local if os.path.isfile(local) else executable;
+            # end
+            return path;
+        # end
+
+        def execute(X,trigger,midi):
+            executable = X.resolve(trigger.ExternalExecutable);
+            command = trigger.ExternalCmd.replace("{channel}",str(midi.Channel)).replace(
+                      "{note}",str(midi.Note_CC)).replace("{velocity}",str(midi.Velocity));
+            args = shlex.split(command,posix=os.name != "nt");
+            if X.cacheText is not None and "{cache:" in command:# % After the split, the content needs no quoting
+                args = [LAUNCH_CACHE_PLACEHOLDER.sub(lambda m: X.cacheText(m.group(1)),arg) for arg in args];
+            # end
+            tStart = time.perf_counter();
+            try:
+                if executable.lower().endswith(".py") and X.pythonWorkers > 0:
+                    code, output = X.runPython(executable,args);
+                else:
+                    if executable.lower().endswith(".py"):
+                        args = [executable]+args;
+                        executable = sys.executable;
+                    # end
+                    result = subprocess.run([executable]+args, cwd=X.baseDir, stdin=subprocess.DEVNULL,
+                                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                            text=True, timeout=X.timeoutSec);
+                    code, output = result.returncode, result.stdout;
+                # end
+            except subprocess.TimeoutExpired:
+                X.count("timedOut");
+                X.log("[warning]:External [%s %s] timed out after %.1f s",executable,command,X.timeoutSec,level=LOG_WARNING);
+                return;
+            except Exception as err:
+                X.count("failed");
+                X.log("[warning]:External [%s %s] failed: %s",executable,command,err,level=LOG_WARNING);
+                return;
+            # end
+            X.count("launched");
+            if code:
+                X.count("failed");
+            # end
+            output = (output or "").strip();
+            if len(output) > LAUNCH_OUTPUT_MAX:
+                output = output[:LAUNCH_OUTPUT_MAX]+" ...";
+            # end
+            X.log("External [%s %s] exit:%s in %.1f ms%s",executable,command,code,(time.perf_counter()-tStart)*1000.,
+                  (os.linesep+output) if output else "",level=LOG_WARNING if code else LOG_INFO);
+        # end
+
+        def runPython(X,script,args):
+            # % Run a script in an idle persistent interpreter (started on demand)
+            try:
+                worker = X.idle.get_nowait();
+            except queue.Empty:
+                worker = X.newPythonWorker() if X.workersStarted < X.pythonWorkers else X.idle.get();
+            # end
+            try:
+                return worker.run(script,args,X.timeoutSec);
+            finally:
+                if not(worker.alive()):# % Killed (timeout) or crashed, replace it
+                    worker = PythonWorker(X.baseDir);
+                # end
+                X.idle.put(worker);
+            # end
+        # end
+
+        def count(X,counter):
+            # % The counters are changed by the control loop and every worker thread
+            with X.lock:
+                setattr(X,counter,getattr(X,counter)+1);
+            # end
+        # end
+
+        def stats(X):
+            with X.lock:
+                return {"launched":X.launched, "failed":X.failed, "timedOut":X.timedOut, "dropped":X.dropped};
+            # end
+        # end
+
+        def stop(X,timeout=2.0):
+            # % Let the workers finish the queued commands, then stop the interpreters
+            for thread in X.threads:
+                try:
+                    X.queue.put(None,timeout=timeout);
+                except queue.Full:
+                    pass;
+                # end
+            # end
+            for thread in X.threads:
+                thread.join(timeout);
+            # end
+            while not(X.idle.empty()):
+                X.idle.get_nowait().stop();
+            # end
+        # end
+    # end
+# end
+
+
+# ==============================================================
+# The persistent interpreter: one JSON request per line on stdin
+# ({"script": path, "args": [...]}), one JSON reply per line on stdout
+# ({"code": exit code, "output": captured stdout/stderr}). The compiled
+# scripts are cached until they change.
+# The replies go to a private duplicate of the stdout descriptor, the file
+# descriptor 1 itself is sent to the null device: a write straight to it (a
+# child process of a script) can't corrupt the reply channel. The scripts
+# share the interpreter: sys.argv, os.environ, sys.path and the working
+# directory are reset after each one, the imported modules are kept.
+def pythonWorkerMain():
+    import io;
+    import contextlib;
+    import traceback;
+    sys.stdout.flush();
+    reply = os.fdopen(os.dup(1),"w");
+    devnull = os.open(os.devnull,os.O_WRONLY);
+    os.dup2(devnull,1);
+    os.close(devnull);
+    requests = sys.stdin;
+    environ, cwd, path = dict(os.environ), os.getcwd(), list(sys.path);
+    scripts = {};
+    for line in requests:
+        request = json.loads(line);
+        script = os.path.abspath(request["script"]);
+        output = io.StringIO();
+        code = 0;
+        try:
+            mtime = os.stat(script).st_mtime_ns;
+            cached = scripts.get(script);
+            if cached is None or cached[0] != mtime:
+                with open(script) as file:
+                    cached = scripts[script] = (mtime,compile(file.read(),script,"exec"));
+                # end
+            # end
+            sys.argv = [script]+request["args"];
+            sys.stdin = io.StringIO();# % stdin carries the requests
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                try:
+                    exec(cached[1],{"__name__":"__main__", "__file__":script});
+                except SystemExit as exit:
+                    code = exit.code if isinstance(exit.code,int) else (0 if exit.code is None else 1);
+                    if not(isinstance(exit.code,(int,type(None)))):
+                        print(exit.code);
+                    # end
+                # end
+            # end
+        except Exception:
+            output.write(traceback.format_exc());
+            code = 1;
+        finally:# % The state the next script starts from
+            os.chdir(cwd);
+            os.environ.clear();
+            os.environ.update(environ);
+            sys.path[:] = path;
+        # end
+        reply.write(json.dumps({"code":code, "output":output.getvalue()})+"\n");
+        reply.flush();
+    # end
+# end
+
+
+if __name__ == "__main__" and "--python-worker" in sys.argv:
+    pythonWorkerMain();
+# end
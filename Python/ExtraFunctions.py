@@ -40,6 +40,33 @@ def importConfigurationSettings(filePath):
         #     print({section: dict(parser[section]) })
     return parser;
 
+class StartupProfile:
+    # Startup time report: the time of each startup stage and of the heavy imports
+    heavyModules = ["requests","urllib3","pandas","numpy","tkinter","pygame","rtmidi"];
+
+    def __init__(P):
+        import time;
+        P.clock = time.perf_counter;
+        P.t0 = P.clock();
+        P.last = P.t0;
+        P.stages = [];
+
+    def mark(P,stage):
+        now = P.clock();
+        P.stages.append((stage,now-P.last));
+        P.last = now;
+
+    def report(P):
+        import os, sys;
+        lines = ["Startup report [ms]:"];
+        for stage,duration in P.stages:
+            lines.append("    %-32s %9.1f" % (stage,duration*1000.));
+        lines.append("    %-32s %9.1f" % ("total",(P.last-P.t0)*1000.));
+        loaded = [m for m in P.heavyModules if m in sys.modules];
+        lines.append("    Heavy modules loaded: "+(", ".join(loaded) if loaded else "none"));
+        lines.append("    (per module import times: python -X importtime main.py)");
+        return os.linesep.join(lines);
+
 def formattedDisplayText(object):
     import os;
     outputStr = 80*"-"+os.linesep;
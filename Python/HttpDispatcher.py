@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   HttpDispatcher
+# % Description: Dispatch stage between the MIDI poll loop and the HTTP server.
+# % Matched triggers are put on a bounded queue per target and sent by a worker
+# % thread per target, so the poll loop never waits on the network and the
+# % commands to one server (next/prev ...) stay in order. A cue for several
+# % server targets is sent to all of them concurrently (one lane each).
+# % The target names are the names of the server targets of the bridge.
+# % The macros (cue sequences) of a target run on a second lane of the target:
+# % their steps and delays follow one another over the kept-alive connection
+# % of that lane, while the single cues keep flowing on the first one.
+# % The lanes are ordered by the priority class of the triggers (their
+# % GroupType, e.g. the navigation before the bulk CC updates), in order of
+# % arrival within a class. A full lane makes room for a more urgent cue by
+# % dropping its least urgent one. A cue past its deadline when its turn comes
+# % is dropped and counted (expired) rather than sent late.
+# % The read triggers ("HTML get()") go through the response cache: a fresh
+# % response is not requested again, a stale one is revalidated. Every other
+# % command marks the cached responses of its target stale.
+# % The commands go over the transport of the target (HTTP requests or frames
+# % on a WebSocket), the reads always over HTTP.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import threading;
+import heapq;
+import time;
+from urllib.parse import urlsplit;
+
+from BridgeLogger import LOG_WARNING,LOG_ERROR;
+
+from LatencyStats import STAMP_READ,STAMP_SEND,STAMP_RESPONSE;
+from TriggerMap import ACTION_READ;
+from ServerTransport import FrameSent;
+
+# % HTTP status code returned by the server when a login is required
+net_http_StatusCode_TemporaryRedirect = 307;
+# % HTTP status codes from this one up are failures of the server (circuit breaker)
+net_http_StatusCode_ServerError = 500;
+# % Name suffix of the macro lane of a target
+MACRO_LANE = " macros";
+
+
+# ==============================================================
+# One ordered lane (priority queue + worker thread) per target server
+class DispatchLane:
+
+        def __init__(L,dispatcher,target,queueSize,name=None):
+            L.dispatcher = dispatcher;
+            L.target = target;
+            L.name = name or target;
+            L.queueSize = queueSize;
+            # % heap of (priority, sequence, job)
+            L.heap = [];
+            L.sequence = 0;
+            L.closed = False;
+            L.condition = threading.Condition();
+            # % Counters of the target
+            L.sent = 0;
+            L.failed = 0;
+            L.rejected = 0;
+            L.evicted = 0;
+            L.expired = 0;
+            L.thread = threading.Thread(target=L.run, name="dispatch-"+str(L.name), daemon=True);
+        # end
+
+        def put(L,priority,job):
+            # % Never blocks. Returns the job dropped on a full lane (the least
+            # % urgent and newest one, possibly the new job), or None.
+            with L.condition:
+                dropped = None;
+                if len(L.heap) >= L.queueSize:
+                    worst = max(L.heap);
+                    if worst[0] <= priority:
+                        return job;
+                    # end
+                    L.heap.remove(worst);
+                    heapq.heapify(L.heap);
+                    dropped = worst[2];
+                # end
+                L.sequence += 1;
+                heapq.heappush(L.heap,(priority,L.sequence,job));
+                L.condition.notify();
+                return dropped;
+            # end
+        # end
+
+        def close(L):
+            # % The worker stops after all the queued jobs (a flag, not a heap
+            # % entry that the eviction of a full lane could pick)
+            with L.condition:
+                L.closed = True;
+                L.condition.notify_all();
+            # end
+        # end
+
+        def qsize(L):
+            return len(L.heap);
+        # end
+
+        def run(L):
+            while True:
+                with L.condition:
+                    while not(L.heap or L.closed):
+                        L.condition.wait();
+                    # end
+                    if not(L.heap):# % Closed and drained
+                        break;
+                    # end
+                    job = heapq.heappop(L.heap)[2];
+                # end
+                try:
+                    L.dispatcher.execute(L,job);
+                except Exception as err:# % A local error, the lane keeps running
+                    L.dispatcher.B.log("[error]:Dispatch lane [%s] error: %r",L.name,err,level=LOG_ERROR);
+                # end
+            # end
+        # end
+# end
+
+
+# ==============================================================
+class HttpDispatcher:
+
+    # properties
+        B=None;# The bridge
+        queueSize=64;
+        lanes={};
+        # % Counters
+        submitted=0;
+        rejected=0;# % New commands refused by a full lane (never submitted)
+        evicted=0;# % Submitted commands removed from a full lane by a more urgent one
+        sent=0;
+        failed=0;
+        reauthRetries=0;# % Commands resent after a new login
+        expired=0;# % Commands past their deadline (not sent)
+        statusCounts={};
+    # end
+
+    # methods
+        def __init__(D,B,queueSize=64):
+            D.B = B;
+            D.queueSize = max(1,int(queueSize));
+            D.lanes = {};
+            D.lock = threading.Lock();
+            # % The bridge of each server target
+            D.targets = {T.targetName:T for T in B.targets};
+            D.submitted = 0;
+            D.rejected = 0;
+            D.evicted = 0;
+            D.sent = 0;
+            D.failed = 0;
+            D.reauthRetries = 0;
+            D.expired = 0;
+            # % HTTP calls per (target, status code or "error")
+            D.statusCounts = {};
+            D.statusLock = threading.Lock();
+            # % The counters are changed by the poll loop and by every lane
+            D.counterLock = threading.Lock();
+        # end
+
+        def lane(D,target,name=None):
+            # % Get (or lazily start) the lane of a target
+            name = name or target;
+            L = D.lanes.get(name);
+            if L is None:
+                with D.lock:
+                    L = D.lanes.get(name);
+                    if L is None:
+                        L = DispatchLane(D,target,D.queueSize,name);
+                        L.thread.start();
+                        D.lanes[name] = L;
+                    # end
+                # end
+            # end
+            return L;
+        # end
+
+        def submit(D,target,job):
+            # % Non-blocking hand-over from the poll loop. When the queue of
+            # % the target is full the least urgent job is dropped and counted:
+            # % the new job (rejected, not submitted) or a queued one (evicted).
+            # % While the server is down (circuit open) the job fails fast.
+            supervisor = D.targets.get(target,D.B).supervisor;
+            if supervisor is not None and not(supervisor.allowRequest()):
+                return False;
+            # end
+            L = D.lane(target,target+MACRO_LANE if job[0].Macro else None);
+            dropped = L.put(job[0].Priority,job);
+            if dropped is not job:
+                D.count("submitted");
+            # end
+            if dropped is not None:
+                reason = "rejected" if dropped is job else "evicted";
+                D.count(reason,L);
+                D.B.log("[warning]:Dispatch queue of [%s] is full, %s [%s%s] (rejected:%i evicted:%i)",
+                        L.name,reason,dropped[0].HTTP_URL,dropped[1],D.rejected,D.evicted,level=LOG_WARNING,
+                        trigger=dropped[0].HTTP_URL,target=L.target,lane=L.name,reason=reason);
+            # end
+            return dropped is not job;
+        # end
+
+        def execute(D,L,job):
+            # % Runs in the worker thread of the lane
+            trigger, argument, stamps = job;
+            T = D.targets.get(L.target,D.B);
+            supervisor = T.supervisor;
+            if supervisor is not None and not(supervisor.allowRequest()):
+                D.count("failed",L);# % Queued before the circuit opened, failed fast
+                return;
+            # end
+            if trigger.DeadlineSec and time.perf_counter()-stamps[STAMP_READ] > trigger.DeadlineSec:
+                # % Too late to be useful, dropped rather than sent late
+                D.count("expired",L);
+                D.B.log("[warning]:Expired [%s%s] after %.0f ms in the queue of [%s] (expired:%i)",trigger.HTTP_URL,argument,
+                        (time.perf_counter()-stamps[STAMP_READ])*1000.,L.name,D.expired,level=LOG_WARNING,
+                        trigger=trigger.HTTP_URL,target=L.target,lane=L.name,reason="expired");
+                return;
+            # end
+            try:
+                # Send the pre-built HTTP command over the pooled connection
+                stamps[STAMP_SEND] = time.perf_counter();
+                if trigger.Macro:
+                    status = D.executeMacro(L,T,trigger.Macro);
+                elif trigger.ActionTypeArguments == ACTION_READ:
+                    status = D.fetch(T,trigger,urlsplit(trigger.HTTP_URL).path+argument,argument,L).status;
+                else:
+                    status = D.send(L,T,trigger.Request,argument).status_code;
+                    if status == net_http_StatusCode_TemporaryRedirect:
+                        D.resendAfterLogin(T,trigger.Request,argument);
+                    # end
+                # end
+            except Exception as err:
+                # % No response (only the transport is in the try, a local error is not a server failure)
+                D.count("failed",L);
+                D.countStatus(L.target,"error");
+                D.B.log("[warning]:Sending [%s%s] to [%s] failed: %s",trigger.HTTP_URL,argument,L.target,err,level=LOG_WARNING,
+                        trigger=trigger.HTTP_URL,target=L.target,lane=L.name,reason="error");
+                # % The supervisor probes the server in the background
+                if supervisor is not None:
+                    supervisor.reportFailure();
+                # end
+                return;
+            # end
+            stamps[STAMP_RESPONSE] = time.perf_counter();
+            if not(trigger.ActionTypeArguments == ACTION_READ):# % The presenter state has changed
+                D.B.responseCache.invalidate(L.target);
+            # end
+            # % Only a server answer feeds the latency estimate (not a WebSocket write)
+            D.B.latencyStats.record(trigger.HTTP_URL,stamps,
+                                    estimate=T.serverTransport.measuresResponse or trigger.ActionTypeArguments == ACTION_READ);
+            if supervisor is not None:# % A server error counts as a failing server
+                if status >= net_http_StatusCode_ServerError:
+                    supervisor.reportFailure();
+                else:
+                    supervisor.reportSuccess();
+                # end
+            # end
+        # end
+
+        def send(D,L,T,request,argument,headers=None):
+            # % A command over the transport of the target, a read (with headers) over HTTP
+            if headers is None:
+                response = T.serverTransport.send(request,argument);
+            else:
+                response = T.sendHttpRequest(request,argument,headers);
+            # end
+            D.count("sent",L);
+            D.countStatus(T.targetName,response.statusLabel if isinstance(response,FrameSent) else response.status_code);
+            return response;
+        # end
+
+        def fetch(D,T,trigger,path,argument="",L=None):
+            # % The response of a read trigger through the cache (also called by
+            # % the cache queries, without a lane). Logs in again once when needed.
+            cache = D.B.responseCache;
+            key = (T.targetName,path);
+            supervisor = T.supervisor;
+            if supervisor is not None and not(supervisor.allowRequest()):
+                # % The server is down (circuit open): the last response, no request
+                entry = cache.lookup(key);
+                if entry is None:
+                    raise ConnectionError("server ["+T.get_serverURL()+"] is down");
+                # end
+                return entry;
+            # end
+            entry = cache.fetch(key,lambda headers: D.send(L,T,trigger.Request,argument,headers));
+            if entry.status == net_http_StatusCode_TemporaryRedirect:
+                T.Server_loggedIN = False;
+                T.handleLogin_();
+                if T.Server_loggedIN:
+                    D.count("reauthRetries");
+                    entry = cache.fetch(key,lambda headers: D.send(L,T,trigger.Request,argument,headers));
+                # end
+            # end
+            return entry;
+        # end
+
+        def count(D,counter,L=None):
+            # % Increment a counter of the dispatcher (and of the lane)
+            with D.counterLock:
+                setattr(D,counter,getattr(D,counter)+1);
+                if L is not None:
+                    setattr(L,counter,getattr(L,counter)+1);
+                # end
+            # end
+        # end
+
+        def countStatus(D,target,status):
+            key = (target,str(status));
+            with D.statusLock:
+                D.statusCounts[key] = D.statusCounts.get(key,0)+1;
+            # end
+        # end
+
+        def statusSnapshot(D):
+            # % Copy of the status counts (the lanes add keys while it is read)
+            with D.statusLock:
+                return dict(D.statusCounts);
+            # end
+        # end
+
+        def laneSnapshot(D):
+            # % (name, lane) pairs by name, the lanes start lazily
+            with D.lock:
+                return sorted(D.lanes.items());
+            # end
+        # end
+
+        def resendAfterLogin(D,T,request,argument):
+            # % The login expired: log in again and resend the command once
+            T.Server_loggedIN = False;
+            T.handleLogin_();
+            if T.Server_loggedIN:
+                D.count("reauthRetries");
+                response = T.serverTransport.send(request,argument);
+                D.countStatus(T.targetName,response.statusLabel if isinstance(response,FrameSent) else response.status_code);
+            # end
+        # end
+
+        def executeMacro(D,L,T,steps):
+            # % The steps of a macro one after the other (no other command of the
+            # % lane in between), a failed step raises and ends the macro, a server
+            # % error ends it too. Returns the status of the last step sent.
+            status = 200;
+            for step in steps:
+                if step.Request is None:
+                    time.sleep(step.DelaySec);
+                    continue;
+                # end
+                response = D.send(L,T,step.Request,step.Argument);
+                status = response.status_code;
+                if status == net_http_StatusCode_TemporaryRedirect:
+                    D.resendAfterLogin(T,step.Request,step.Argument);
+                elif status >= net_http_StatusCode_ServerError:
+                    break;
+                # end
+            # end
+            return status;
+        # end
+
+        def queueDepth(D):
+            return sum(L.qsize() for name,L in D.laneSnapshot());
+        # end
+
+        def stats(D):
+            queueDepth = D.queueDepth();
+            with D.counterLock:
+                return {"queueDepth":queueDepth, "submitted":D.submitted, "sent":D.sent,
+                        "failed":D.failed, "rejected":D.rejected, "evicted":D.evicted, "expired":D.expired, "reauthRetries":D.reauthRetries};
+            # end
+        # end
+
+        def laneStats(D,target):
+            L = D.lanes.get(target);
+            M = D.lanes.get(target+MACRO_LANE);
+            with D.counterLock:
+                if L is None:
+                    stats = {"sent":0, "failed":0, "rejected":0, "evicted":0, "expired":0};
+                else:
+                    stats = {"queueDepth":L.qsize(), "sent":L.sent, "failed":L.failed, "rejected":L.rejected, "evicted":L.evicted, "expired":L.expired};
+                # end
+                if M is not None:# % Steps sent by the macros
+                    stats.update({"macroSteps":M.sent, "macroFailed":M.failed, "macroRejected":M.rejected, "macroEvicted":M.evicted, "macroExpired":M.expired});
+                # end
+            # end
+            return stats;
+        # end
+
+        def stop(D,timeout=2.0):
+            # % Let the lanes drain the queued jobs and stop the workers
+            for L in list(D.lanes.values()):
+                L.close();
+            # end
+            for L in list(D.lanes.values()):
+                L.thread.join(timeout);
+            # end
+        # end
+    # end
+# end
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# %
+# % Description: End-to-end latency instrumentation. Every dispatched MIDI event
+# % carries its stage timestamps (MIDI device time, poll read, decode, match,
+# % HTTP send and HTTP response). They are aggregated into per-trigger latency
+# % histograms with p50/p95/p99, which can be dumped on demand and at shutdown.
+# % A rolling (exponentially weighted) estimate of the match->response latency
+# % of every endpoint is kept for the cues sent ahead of the transport.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os;
+import threading;
+from bisect import bisect_left;
+
+# % Indices of the stage timestamps of an event (perf_counter seconds,
+# % except the device lag which is in milliseconds of the MIDI clock)
+STAMP_DEVICE_LAG = 0;
+STAMP_READ       = 1;
+STAMP_DECODE     = 2;
+STAMP_MATCH      = 3;
+STAMP_SEND       = 4;
+STAMP_RESPONSE   = 5;
+
+# % Reported stages
+LATENCY_STAGES = ["device->read","read->decode","decode->match","match->send","send->response","read->response","device->response"];
+
+# % Log-spaced histogram bucket upper bounds in milliseconds (~12% resolution from 10 us to 30 s)
+HISTOGRAM_BOUNDS_MS = [0.01*(1.12**i) for i in range(133)];
+
+# % Weight of the newest value in the rolling latency estimate
+LATENCY_ESTIMATE_ALPHA = 0.2;
+
+
+# ==============================================================
+class LatencyHistogram:
+        __slots__ = ("counts","count","total","maximum");
+
+        def __init__(H):
+            H.counts = [0]*(len(HISTOGRAM_BOUNDS_MS)+1);
+            H.count = 0;
+            H.total = 0.;
+            H.maximum = 0.;
+        # end
+
+        def add(H,valueMs):
+            H.counts[bisect_left(HISTOGRAM_BOUNDS_MS,valueMs)] += 1;
+            H.count += 1;
+            H.total += valueMs;
+            if valueMs > H.maximum:
+                H.maximum = valueMs;
+            # end
+        # end
+
+        def percentile(H,p):
+            # % Upper bound of the bucket holding the p-th percentile
+            if H.count == 0:
+                return 0.;
+            # end
+            rank = p/100.*H.count;
+            cumulative = 0;
+            for i,c in enumerate(H.counts):
+                cumulative += c;
+                if cumulative >= rank and c:
+                    return min(HISTOGRAM_BOUNDS_MS[i],H.maximum) if i < len(HISTOGRAM_BOUNDS_MS) else H.maximum;
+                # end
+            # end
+            return H.maximum;
+        # end
+
+        def mean(H):
+            return H.total/H.count if H.count else 0.;
+        # end
+
+        def cumulative(H,boundsMs):
+            # % Number of values up to each bound (at the resolution of the buckets)
+            counts = [];
+            total = 0;
+            i = 0;
+            for bound in boundsMs:
+                while i < len(HISTOGRAM_BOUNDS_MS) and HISTOGRAM_BOUNDS_MS[i] <= bound:
+                    total += H.counts[i];
+                    i += 1;
+                # end
+                counts.append(total);
+            # end
+            return counts;
+        # end
+# end
+
+
+# ==============================================================
+class LatencyStats:
+
+        def __init__(S):
+            S.lock = threading.Lock();
+            # % {trigger: {stage: LatencyHistogram}}
+            S.histograms = {};
+            # % {trigger: rolling match->response latency in seconds}
+            S.estimates = {};
+        # end
+
+        def record(S,trigger,stamps,estimate=True):
+            # % Record the stage timestamps of one completed event. estimate=False
+            # % leaves the rolling estimate out (the "response" is not a server answer)
+            deviceLag = stamps[STAMP_DEVICE_LAG];
+            read = stamps[STAMP_READ];
+            response = stamps[STAMP_RESPONSE];
+            values = (
+                deviceLag,
+                (stamps[STAMP_DECODE]-read)*1000.,
+                (stamps[STAMP_MATCH]-stamps[STAMP_DECODE])*1000.,
+                (stamps[STAMP_SEND]-stamps[STAMP_MATCH])*1000.,
+                (response-stamps[STAMP_SEND])*1000.,
+                (response-read)*1000.,
+                deviceLag+(response-read)*1000.,
+            );
+            with S.lock:
+                stages = S.histograms.get(trigger);
+                if stages is None:
+                    stages = S.histograms[trigger] = {stage:LatencyHistogram() for stage in LATENCY_STAGES};
+                # end
+                for stage,value in zip(LATENCY_STAGES,values):
+                    stages[stage].add(max(value,0.));
+                # end
+                if estimate:
+                    latency = max(response-stamps[STAMP_MATCH],0.);
+                    previous = S.estimates.get(trigger);
+                    S.estimates[trigger] = latency if previous is None else previous+LATENCY_ESTIMATE_ALPHA*(latency-previous);
+                # end
+            # end
+        # end
+
+        def estimate(S,trigger,default=0.):
+            # % Rolling match->response latency of a trigger in seconds (default before the first event)
+            return S.estimates.get(trigger,default);
+        # end
+
+        def summary(S):
+            # % {trigger: {stage: (count, mean, p50, p95, p99, max)}} in milliseconds
+            with S.lock:
+                return {trigger:{stage:(h.count,h.mean(),h.percentile(50),h.percentile(95),h.percentile(99),h.maximum)
+                                 for stage,h in stages.items()}
+                        for trigger,stages in S.histograms.items()};
+            # end
+        # end
+
+        def export(S,boundsMs):
+            # % {trigger: {stage: (cumulative counts of the bounds, count, sum)}} in milliseconds
+            with S.lock:
+                return {trigger:{stage:(h.cumulative(boundsMs),h.count,h.total) for stage,h in stages.items()}
+                        for trigger,stages in S.histograms.items()};
+            # end
+        # end
+
+        def combined(S,stage,prefix=""):
+            # % Histogram of one stage merged over all the triggers (with the URL prefix)
+            merged = LatencyHistogram();
+            with S.lock:
+                for trigger,stages in S.histograms.items():
+                    if not(trigger.startswith(prefix)):
+                        continue;
+                    # end
+                    h = stages[stage];
+                    merged.counts = [a+b for a,b in zip(merged.counts,h.counts)];
+                    merged.count += h.count;
+                    merged.total += h.total;
+                    merged.maximum = max(merged.maximum,h.maximum);
+                # end
+            # end
+            return merged;
+        # end
+
+        def report(S):
+            # % Formatted latency report (milliseconds)
+            lines = ["Latency report [ms]:"];
+            header = "    %-18s %8s %9s %9s %9s %9s %9s";
+            row    = "    %-18s %8i %9.3f %9.3f %9.3f %9.3f %9.3f";
+            summary = S.summary();
+            if not(summary):
+                lines.append("    No events recorded");
+            # end
+            for trigger in sorted(summary):
+                lines.append("  "+trigger);
+                lines.append(header % ("stage","count","mean","p50","p95","p99","max"));
+                for stage in LATENCY_STAGES:
+                    lines.append(row % ((stage,)+summary[trigger][stage]));
+                # end
+            # end
+            return os.linesep.join(lines);
+        # end
+# end
@@ -21,22 +21,46 @@
 # Standard libraty imports
 
 # System and os import
-from ast import alias;
 import sys , os ;
 # Import the time library
 import time;
+# Threads of the background stages
+import threading;
+# Copy of the bridge for the additional server targets
+import copy;
+# Reader of the macro files
+import csv;
 # Library for HTTP requests
 import requests;
 # Import the math library
-from numpy import mod;
 from math import floor;
-# Import pandas library to handle DataFrame data object
-import pandas as pd;
+# % pandas is imported where the preset CSV is parsed, numpy is not needed:
+# % the heavy imports stay out of the startup path
 
 
 # Custom functions imports
 # from ExtraFunctions import *;
 from ExtraFunctions import uigetfile,getTimeNow,importConfigurationSettings,formattedDisplayText;
+from TriggerMap import compileTriggerTable,compileMacros,compileTimeline,compileReadTriggers,triggerChannelTypes,hasSourceTriggers,cellText,ACTION_WITH_VELOCITY,EMPTY_TIMELINE;
+from HttpDispatcher import HttpDispatcher;
+from TriggerCoalescer import TriggerCoalescer;
+from ConnectionSupervisor import ConnectionSupervisor;
+from ExternalLauncher import ExternalLauncher;
+from PresetWatcher import PresetWatcher;
+from MetricsServer import MetricsServer;
+from PresetCache import PresetCache,CachedConfiguration,cachePath;
+from MidiMessage import MidiDecoder;
+from MidiWaitStrategy import createWaitStrategy;
+from LatencyStats import LatencyStats;
+from MidiInputBackends import createMidiBackend,MultiMidiBackend;
+from MidiRecorder import MidiRecorder;
+from CueScheduler import MidiTransport,CueScheduler;
+from ResponseCache import ResponseCache;
+from ServerTransport import createServerTransport;
+from BridgeLogger import BridgeLogger,LOG_INFO,LOG_WARNING,LOG_ERROR;
+
+# % Log line of a dispatched MIDI event (formatted in the logger thread)
+MIDI_EVENT_LOG = "MIDI event:%r"+os.linesep+"HTTP call:%s%s %r"+os.linesep;
 
 
 # ==============================================================
@@ -47,9 +71,11 @@ class MIDI2HTTP_Bridge:
         # % Get the platform the service is currently runing on
         platform=os.name;
 
-        # % The preset file
+        # % The preset file (several MIDI inputs: names separated by ";")
         midi_BridgeName="";
         midi_HttpProtocolPreset="";
+        # % The macros (cue sequences of the preset rows), optional
+        midi_MacroPreset="";
         
         # % The name of the DAW or midi player
         DAW_name="";
@@ -66,68 +92,259 @@ class MIDI2HTTP_Bridge:
         Server_ControlPort=0;
         Server_password="";
         Server_loggedIN=False;
+        Server_loginTime=0.;
+        # % Login: optional session cookie cache file (relative to the configuration
+        # % file) and the period of the proactive re-login (0 = only when needed)
+        Server_CookieCache="";
+        Server_ReauthSec=0.;
+        # % Transport of the cue commands: "http" (a GET per cue) or "websocket"
+        # % (a text frame per cue on a persistent socket, "{path}" in the format is
+        # % replaced by the path of the trigger, port 0 = Server_ControlPort)
+        Server_Transport="http";
+        Server_WebSocketPort=0;
+        Server_WebSocketPath="/";
+        Server_WebSocketFormat="{path}";
+        loginBrowserOpened=False;
+
+        # % Logging: level ("debug", "info", "warning", "error") and optional
+        # % rotating log file (relative to the configuration file) as "text" or "json"
+        Log_Level="info";
+        Log_File="";
+        Log_FileMaxKB=1024;
+        Log_FileBackups=3;
+        Log_Format="text";
+
+        # % MIDI input backend: "pygame", "callback", "virtual" or "replay"
+        MIDI_Backend="pygame";
+        # % Text file with the MIDI messages of the "virtual" backend (empty for an in-process queue),
+        # % the recording replayed by the "replay" backend
+        MIDI_VirtualSource="";
+        # % Recording of the MIDI input for a later replay ("{time}" is the start time), empty: off
+        MIDI_RecordFile="";
+        # % Wait between the MIDI polls: "fixed", "adaptive" or "blocking"
+        MIDI_WaitStrategy="adaptive";
+        # % Longest wait between two polls while the MIDI input is idle
+        MIDI_IdleMaxDelayMs=20.0;
+
+        # % Maximum number of queued HTTP commands per server before dropping
+        Dispatch_QueueSize=64;
+        # % Priority class and deadline of the GroupTypes ("Group:priority:deadline ms", "*" the others)
+        Dispatch_PriorityGroups="Navigate:0:800; Screen:1:800; Exit:1:0; Macro:1:800; Multimeda:2:800; Edit:3:300; *:2:800";
+
+        # % Server connection supervision: wait for the first connection at
+        # % startup, health check period, reconnect backoff and the number of
+        # % consecutive failures that open the circuit (cues fail fast)
+        Server_StartupWaitSec=5.0;
+        Server_HealthCheckSec=5.0;
+        Server_BackoffMinSec=0.5;
+        Server_BackoffMaxSec=30.0;
+        Server_FailureThreshold=3;
+
+        # % Default rate cap of the coalesced (velocity parameterised) triggers,
+        # % the preset rows can override it ("Rate Limit Hz", "Coalesce Edge")
+        Coalesce_DefaultRateHz=10.0;
+
+        # % Pooled HTTP client settings
+        HTTP_ConnectTimeoutSec=0.5;
+        HTTP_ReadTimeoutSec=2.0;
+        HTTP_ConnectRetries=2;
+        HTTP_PoolSize=4;
+
+        # % External commands of the triggers: concurrent commands, queued commands
+        # % before dropping, timeout and persistent interpreters for the *.py scripts
+        Launch_MaxConcurrent=2;
+        Launch_QueueSize=16;
+        Launch_TimeoutSec=10.0;
+        Launch_PythonWorkers=1;
+
+        # % Period of the check for edited preset/configuration files (0 = no hot reload)
+        Reload_PollSec=1.0;
+
+        # % Cache of the responses of the read triggers ("HTML get()"): seconds
+        # % an entry is fresh and the number of entries kept (0 = no cache)
+        Cache_TTLSec=2.0;
+        Cache_MaxEntries=64;
+
+        # % Cue timeline on the transport of the DAW (MIDI clock/song position or
+        # % timecode), optional. The cues are sent ahead by the latency of their
+        # % endpoint (at most Schedule_LeadMaxMs), cues later than Schedule_LateMs are skipped
+        Schedule_Timeline="";
+        Schedule_LeadMaxMs=500.0;
+        Schedule_LateMs=250.0;
+        Schedule_DefaultLatencyMs=20.0;
     # end
 
     # properties # Additional Properties
         rootPath = os.path.abspath(os.path.dirname(__file__));
         configuration_filepath = "."+os.sep+"daw2server_settingsConfiguration.ini";# % Default file name
-        # % MIDI device(bridge name)
+        # % MIDI device(bridge name), all the selected inputs and their names by source index
         midiDevice=[];
+        midiDevices=[];
+        midiSourceNames=[];
+        # % MIDI input backend
+        midiBackend=None;
         # % Limiter
         inLoopFPS=[];
         # % State flag for the sate of the program can also be used as a
         # % control flag 
         STATE_FLAG="";
-        diagnosticMode=False;
+        # % Local metrics endpoint (Prometheus text format) and cache queries, 0: off
+        Metrics_Host="127.0.0.1";
+        Metrics_Port=0;
+        metricsServer=None;
+        # % Counters of the MIDI input and the control loop
+        midiPackets=0;
+        midiMatched=0;
+        midiUnmatched=0;
+        loopCount=0;
+        # % No GUI (file dialogs) in headless mode
+        headless=False;
+        # % Asynchronous logger
+        logger=None;
 
         # serverURL="";# This will not be needed
         MAP=[];
+        MACROS=[];
+        TIMELINE=[];
+        # % Compiled cue timeline (sorted by position)
+        timeline=EMPTY_TIMELINE;
+        # % Transport position of the DAW and the scheduler of the timeline cues
+        transport=None;
+        cueScheduler=None;
+        # % Compiled trigger lookup (channel, type, note/CC) -> trigger
+        triggerTable={};
+        triggerFilter=frozenset();
+        # % Read triggers of the preset by path (the queries of the response cache)
+        readTriggers={};
+        # % Cached responses of the read triggers
+        responseCache=None;
+        # % Some triggers are limited to one MIDI input ("Midi Source")
+        triggerSourced=False;
+        # % Union of the (channel, type) filters of all the server targets
+        inputFilter=frozenset();
+        # % Reloaded trigger map waiting to be swapped in by the control loop
+        pendingTriggerMap=None;
+        reloadPending=False;
+        reloadLock=threading.Lock();
+        # % Background watcher of the preset and configuration files
+        presetWatcher=None;
+        # % Server targets: the main bridge and the "[target NAME]" sections of
+        # % the configuration file. Each target has its own server connection,
+        # % login and triggers, the MIDI input and the dispatch stage are shared.
+        targets=[];
+        targetName="";
+        targetSection="top";
+        parent=None;# % The main bridge of an additional target
+        # % HTTP dispatch stage (decouples the network from the MIDI loop)
+        dispatcher=None;
+        # % Coalescing/rate limiting stage of the bursty triggers
+        coalescer=None;
+        # % Background connection supervisor (state and circuit breaker)
+        supervisor=None;
+        # % Runs the external commands of the triggers
+        launcher=None;
+        # % Server URL the trigger requests were prepared for
+        preparedServerURL="";
+        loginLock=None;
+        # % Per trigger latency histograms of the dispatched events
+        latencyStats=None;
+        # % MIDI packet decoder (keeps the running status between reads)
+        midiDecoder=None;
+        # % Shared keep-alive HTTP session and its (connect, read) timeouts
+        httpSession=None;
+        httpTimeout=None;
+        # % Transport of the cue commands of the server target
+        serverTransport=None;
+        # % Cache of the configuration and of the trigger presets (None: off)
+        presetCache=None;
     # end
    
 
     # % Constructor methods  # methods
         # % Constructor
-        def __init__(B):
+        def __init__(B,configuration_filepath=None,headless=False,useCache=True):
             isdeployed = False;
+            B.headless = headless;
+            B.logger = BridgeLogger(lambda obj: formattedDisplayText(obj)+os.linesep);
             B.STATE_FLAG="Initialization";
             # % Print welcome message
             B.printWelcome();
             
-            if not(isdeployed):#% Check if it is deployed to adjust the root paths
-                B.configuration_filepath = "."+B.configuration_filepath;
+            if configuration_filepath is not None:# % Explicit configuration file (presets, benchmark)
+                B.configuration_filepath = os.path.abspath(configuration_filepath);
+            else:
+                if not(isdeployed):#% Check if it is deployed to adjust the root paths
+                    B.configuration_filepath = "."+B.configuration_filepath;
+                # end
+                # Construct the absolute path for the configuration file
+                B.configuration_filepath = os.path.abspath(os.path.join(B.rootPath,B.configuration_filepath));
             # end
-            # Construct the absolute path for the configuration file
-            B.configuration_filepath = os.path.abspath(os.path.join(B.rootPath,B.configuration_filepath));
             # % Check if file exists otherwise locate it
             if not(os.path.exists(B.configuration_filepath)):
+                if B.headless:
+                    B.log("Configuration file ["+B.configuration_filepath+"] not found!");
+                    raise Exception("Configuration file ["+B.configuration_filepath+"] not found!");
+                # end
                 B.configuration_filepath = uigetfile(B.configuration_filepath);                
             # end
             B.log("Get Configuration file: "+B.configuration_filepath);
-            # % Get the raw file properties
-            iniConfigurationPaser = importConfigurationSettings(B.configuration_filepath);
+            # % Get the raw file properties (from the preset cache when the file is unchanged)
+            if useCache:
+                B.presetCache = PresetCache(cachePath(B.configuration_filepath),B.log);
+            # end
+            iniConfigurationPaser = B.readConfiguration(B.configuration_filepath);
             # % Assign the file properties
             B.loadFileProperties(iniConfigurationPaser);
+            B.configureLogger();
             # % Compute the application loop FPS limiter to match the cycle
             # % rate of the DAW's audio interface (it will be approximate)
             B.inLoopFPS = B.DAW_AudioFreqencyHz/B.DAW_InterfaceBufferSamples;
             
-            if not(isdeployed):#% Check if it is deployed to adjust the root paths
-                B.midi_HttpProtocolPreset = "."+B.midi_HttpProtocolPreset;
+            B.midi_HttpProtocolPreset = B.resolvePresetPath(B.midi_HttpProtocolPreset,isdeployed);
+            if B.midi_MacroPreset:
+                B.midi_MacroPreset = B.resolvePresetPath(B.midi_MacroPreset,isdeployed);
             # end
-            # Construct the absolute path for the http protocol triggers file
-            B.midi_HttpProtocolPreset = os.path.abspath(os.path.join(B.rootPath,B.midi_HttpProtocolPreset));
+            if B.Schedule_Timeline:
+                B.Schedule_Timeline = B.resolvePresetPath(B.Schedule_Timeline,isdeployed);
+            # end
+
+            # % Create the shared HTTP client used for all the server calls
+            B.createHttpSession();
+            B.serverTransport = createServerTransport(B);
+
+            # % Additional server targets fed by the same MIDI input
+            B.loadServerTargets(iniConfigurationPaser);
 
             B.STATE_FLAG="Configured";
         # end
 
-        # % Loggin and output function
-        def log(self,msg):
-            if not(isinstance(msg,str)):
-               msg=formattedDisplayText(msg)+os.linesep;
+        # % The settings of the configuration file by section
+        def readConfiguration(B,filePath):
+            def build(filePath):
+                iniConfig = importConfigurationSettings(filePath);
+                return CachedConfiguration({section:dict(iniConfig[section]) for section in iniConfig.sections()});
+            # end
+            if B.presetCache is None:
+                return build(filePath);
             # end
+            return B.presetCache.load("configuration",filePath,build);
+        # end
 
-            # % To standart output
-            print(msg);
+        # % Loggin and output function. Only a record is queued here, the
+        # % message is formatted ("msg % args", objects as property lists) and
+        # % written to the standart output/log file by the logger thread.
+        # % The keyword fields (trigger=, target= ...) are separate keys of the JSON log
+        def log(B,msg,*args,level=LOG_INFO,**fields):
+            B.logger.log(level,msg,args,fields);
+        # end
+
+        # % Apply the logging settings of the configuration file
+        def configureLogger(B):
+            logFile = B.Log_File;
+            if logFile:# % Relative to the configuration file
+                logFile = os.path.join(os.path.dirname(B.configuration_filepath),logFile);
+            # end
+            B.logger.configure(B.Log_Level,True,logFile,B.Log_FileMaxKB,B.Log_FileBackups,B.Log_Format);
         # end
         
         # % Prints the welcome message
@@ -151,13 +368,29 @@ class MIDI2HTTP_Bridge:
         # end
 
         # % Function for loading the imported file properties
-        def loadFileProperties(B,iniConfig):
+        def loadFileProperties(B,iniConfig,section="top"):
+            for key,value,errorMsg in B.parseFileProperties(iniConfig,section):
+                if errorMsg:
+                    B.log(errorMsg); 
+                    # error(errorMsg);
+                else:
+                    # Assign the value 
+                    B.__setattr__(key,value);
+                    B.log("Assign Property: ["+key+"] = ["+str(B.__getattribute__(key))+"]");
+                # end
+            # end
+        # end
+
+        # % Cast the imported property strings to the property types, without
+        # % assigning them. Returns a list of [key, value, errorMsg].
+        def parseFileProperties(B,iniConfig,section="top"):
             bPropNms = dir(B);
             bPropNms_lower = [x.lower() for x in bPropNms];
+            properties = [];
              # % Loop over all imported property strings
-            for key in iniConfig["top"]:
+            for key in iniConfig[section]:
                 try:
-                    value = iniConfig["top"][key];
+                    value = iniConfig[section][key];
                     # Check if the property name is valid
                     if not(key.lower() in bPropNms_lower):
                         raise Exception("");
@@ -170,16 +403,86 @@ class MIDI2HTTP_Bridge:
 
                     # Cast in the correct format 
                     value = type(B.__getattribute__(key)) (value);
-                    # Assign the value 
-                    B.__setattr__(key,value);
-                    B.log("Assign Property: ["+key+"] = ["+str(B.__getattribute__(key))+"]");
+                    properties.append([key,value,""]);
             
                 except:# %(err) Could catch the original message and merge it the one in the catch
                     errorMsg = "Not found Property:["+key+"]"+" Associated data:["+str(value)+"]";
-                    B.log(errorMsg); 
-                    # error(errorMsg);
+                    properties.append([key,value,errorMsg]);
+                # end
+            # end
+            return properties;
+        # end
+
+        # % Create the additional server targets of the "[target NAME]" sections
+        def loadServerTargets(B,iniConfig):
+            B.targetName = B.Server_Name;
+            B.targets = [B];
+            for section in iniConfig.sections():
+                if not(section.lower().startswith("target ")):
+                    continue;
                 # end
+                name = section[len("target "):].strip();
+                if name in [T.targetName for T in B.targets]:
+                    raise Exception("[error]:Server target ["+name+"] is defined twice in ["+B.configuration_filepath+"]");
+                # end
+                B.targets.append(B.createServerTarget(name,iniConfig,section));
+            # end
+        # end
+
+        # % An additional server target is a copy of the main bridge: the
+        # % settings of the section override the main settings, the connection,
+        # % login and trigger state are its own
+        def createServerTarget(B,name,iniConfig,section):
+            keys = [key.lower() for key in iniConfig[section]];
+            for key in ["Server_Name","midi_HttpProtocolPreset"]:
+                if not(key.lower() in keys):
+                    raise Exception("[error]:Server target ["+name+"] needs "+key);
+                # end
+            # end
+            B.log(os.linesep+"Server target: ["+name+"]");
+            T = copy.copy(B);
+            T.parent = B;
+            T.targets = [];
+            T.targetName = name;
+            T.targetSection = section;
+            T.supervisor = None;
+            T.loginLock = None;
+            T.Server_loggedIN = False;
+            T.Server_CookieCache = "";
+            T.loginBrowserOpened = False;
+            T.MAP = [];
+            T.MACROS = [];
+            T.midi_MacroPreset = "";# % Its own macros (the steps are rows of its preset)
+            T.TIMELINE = [];
+            T.timeline = EMPTY_TIMELINE;
+            T.Schedule_Timeline = "";# % Its own timeline
+            T.triggerTable = {};
+            T.triggerFilter = frozenset();
+            T.readTriggers = {};
+            T.triggerSourced = False;
+            T.pendingTriggerMap = None;
+            T.preparedServerURL = "";
+            T.reloadLock = threading.Lock();
+            T.loadFileProperties(iniConfig,section);
+            T.midi_HttpProtocolPreset = T.resolvePresetPath(T.midi_HttpProtocolPreset);
+            if T.midi_MacroPreset:
+                T.midi_MacroPreset = T.resolvePresetPath(T.midi_MacroPreset);
+            # end
+            if T.Schedule_Timeline:
+                T.Schedule_Timeline = T.resolvePresetPath(T.Schedule_Timeline);
             # end
+            T.createHttpSession();
+            T.serverTransport = createServerTransport(T);
+            return T;
+        # end
+
+        # % Absolute path of the http protocol triggers file
+        def resolvePresetPath(B,presetPath,isdeployed=False):
+            if not(isdeployed):#% Check if it is deployed to adjust the root paths
+                presetPath = "."+presetPath;
+            # end
+            # Construct the absolute path for the http protocol triggers file
+            return os.path.abspath(os.path.join(B.rootPath,presetPath));
         # end
 
     # end
@@ -188,60 +491,65 @@ class MIDI2HTTP_Bridge:
     # % Setup methods
     # methods 
 
+        # % Get the MIDI input backend selected in the configuration
+        def getMidiBackend(B):
+            if B.midiBackend is None:
+                virtualSource = B.MIDI_VirtualSource;
+                if virtualSource:# % Relative to the configuration file (one per input, separated by ";")
+                    virtualSource = ";".join([os.path.join(os.path.dirname(B.configuration_filepath),s) if s else ""
+                                              for s in virtualSource.split(";")]);
+                # end
+                B.midiBackend = createMidiBackend(B.MIDI_Backend,B.midi_BridgeName,virtualSource);
+            # end
+            return B.midiBackend;
+        # end
+
         # % Get MIDI device info
         def getMidiDeviceInfo(B):
-            # Import the MIDI module from pygame
-            B.log(os.linesep+"MIDI device library:");
-            from pygame import midi;
-            midi.init();
+            B.log(os.linesep+"MIDI device library: ["+B.MIDI_Backend+"]");
             B.log(os.linesep+"Get list of midi devices:");
-            midiDevInfo = [];
-            device_count = midi.get_count()
+            midiDevInfo = B.getMidiBackend().listDevices();
             # % Get midi device info;
-            for device_ID in range(device_count):
-                device = midi.get_device_info(device_ID);
-
-                keys = ['interface', 'name', 'is_input', 'is_output', 'opened'];
-                info = dict(zip(keys, device));
-                info['device_id'] = device_ID;
-                info['handle'] = device;
-                info['name'] = info['name'].decode();
-
-                
+            for info in midiDevInfo:
                 # If the device is input device 
                 if info["is_input"]:
-                    B.log("Type: [Input]["+str(device[2])+"] - ID["+str(device_ID)+"] - "+info["name"]);# %display the available midi devices
+                    B.log("Type: [Input]["+str(info["is_input"])+"] - ID["+str(info["device_id"])+"] - "+info["name"]);# %display the available midi devices
                 elif info["is_output"]:
-                    B.log("Type: [Ouput]["+str(device[2])+"] - ID["+str(device_ID)+"] - "+info["name"]);# %display the available midi devices
+                    B.log("Type: [Ouput]["+str(info["is_input"])+"] - ID["+str(info["device_id"])+"] - "+info["name"]);# %display the available midi devices
                 else:
                     B.log("Devoce type not recognized! - "+info["name"]);
                 # end
-                midiDevInfo.append(info);
-
-            midi.quit() # THIS LINE FIXED IT
+            # end
             return midiDevInfo;
         # end
         
         # % Select the MIDI device connection
         def selectMidiDeviceInput(B):
-            import numpy as np;
             # % Get midi device info
             devInfo = B.getMidiDeviceInfo();
 
-            # % Check if the imported midi name can be found otherwise load
+            # % Check if the imported midi names can be found otherwise load
             # % the one from the list
-            preselectedMidiDevice = False;
-            for dev in devInfo:
-                if (B.midi_BridgeName == dev["name"]) and dev["is_input"]:
-                    preselectedMidiDevice = True;
-                    break;
+            devices = [];
+            for name in [n.strip() for n in B.midi_BridgeName.split(";") if n.strip()]:
+                matches = [dev for dev in devInfo if (name == dev["name"]) and dev["is_input"]];
+                if matches:
+                    devices.append(matches[0]);
+                else:
+                    B.log("[warning]:MIDI input ["+name+"] not found!",level=LOG_WARNING);
+                # end
+            # end
 
             # If the preslected MIDI device is not found ask for selection       
-            if not(preselectedMidiDevice):
+            if not(devices):
                 promptMsg = os.linesep+"Please select the MIDI bridge from input device IDs [%i:%i]:";
                 # Get input device indices
-                IDs =  [dI["device_id"] if dI["is_input"]==1 else np.nan for dI in devInfo];
-                promptMsg = promptMsg % (np.nanmin(IDs),np.nanmax(IDs));
+                IDs =  [dI["device_id"] for dI in devInfo if dI["is_input"]==1];
+                if not(IDs):
+                    B.log("No MIDI input devices found!",level=LOG_ERROR);
+                    raise Exception("No MIDI input devices found!");
+                # end
+                promptMsg = promptMsg % (min(IDs),max(IDs));
                 noValidInput = True;
                 # % Input validation until valid input is given
                 while noValidInput:
@@ -267,14 +575,23 @@ class MIDI2HTTP_Bridge:
 
                 # % After Validation
                 B.midi_BridgeName = dev["name"];
+                devices = [dev];
             # end
             
             # % Load the selected device as an input to the Bridge.
             # % DAW(out)->(in)Bridge
-            B.midiDevice = dev;#%'Output',midideviceName) 
-            # Log and display the selected device
-            B.log(os.linesep+"The currect selected device connection: ["+B.midi_BridgeName +"]"+
-                  " ID:["+str(dev["device_id"])+"]"+os.linesep);
+            B.midiDevice = devices[0];#%'Output',midideviceName) 
+            B.midiDevices = devices;
+            B.midiSourceNames = [dev["name"] for dev in devices];
+            # % Several inputs: a reader per input and the fan-in in front of the control loop
+            if len(devices) > 1 and not(B.midiBackend.name == MultiMidiBackend.name):
+                B.midiBackend = MultiMidiBackend([(B.midiBackend.portBackend(dev),dev) for dev in devices]);
+            # end
+            # Log and display the selected devices
+            for dev in devices:
+                B.log(os.linesep+"The currect selected device connection: ["+dev["name"]+"]"+
+                      " ID:["+str(dev["device_id"])+"]"+os.linesep);
+            # end
         # end
     
         # # % Get function to get the server URL
@@ -286,143 +603,333 @@ class MIDI2HTTP_Bridge:
             return serverURL;
         # end
 
-        # % Function to establish the connection to the server
+        # % Function to establish the connection to the server. The connection
+        # % is kept by the background supervisor (retries with backoff, reconnects
+        # % while running), here we only wait a moment for the first connection.
         def establishServerConnection(B):
-            configAvailable_server=True;
-            configAvailable_autodiscover=True;
-            serverFound=False;
-            # % Maximum of connection retyr attempts
-            connectionRetryLimit = 10000;
-            for retry in range(connectionRetryLimit):
-                if ~(B.get_serverURL=="") and configAvailable_server:
-                    # % Connect to the preconfigured IP
-                    testResult = B.testConnection();
-                    serverFound = testResult[0];
-                else:
-                    B.log("Server Configuration in ["+B.configuration_filepath+"] not found!");
-                    configAvailable_server= False;
-                # end
-            
-                # % If the configured IP is not working try the autodiscover
-                # % option
-                if not(serverFound): 
-                    if not(B.Server_autodiscover=="") and configAvailable_autodiscover:
-                        # % Connect to the preconfigured IP
-                        try:
-                            B.log("Attempt autodiscover at ["+B.Server_autodiscover+"] ... ")
-                            # If the preemble is missing add the protocol to the auto discover
-                            if B.Server_autodiscover.find(B.Server_Protocol) < 0:
-                                B.Server_autodiscover=B.Server_Protocol+"://"+B.Server_autodiscover;
-                            # end
-                            response = requests.get(B.Server_autodiscover);
-                            # % Convert the response data to formated strings.
-                            URIs = response.text.splitlines();
-                            # % Get the correct control IP
-                            URI = list(filter(lambda x: (":"+str(B.Server_ControlPort)) in x, URIs))[0];
-                            B.log("Autodiscover found at ["+B.Server_autodiscover+"] is ["+URI+"]");
-                            # % Split the URI
-                            uriParts = URI.replace("://",":").split(':',3);
-                            B.Server_Protocol = uriParts[0];
-                            B.Server_IP = uriParts[1];
-                            B.Server_ControlPort = int(uriParts[2]);
-            
-                        except:
-                            B.log("Autodiscover at ["+B.Server_autodiscover+"] failed!");
-                        # end
-                    else:
-                        B.log("Server autodiscover Configuration in ["+B.configuration_filepath+"] not found!");
-                        configAvailable_autodiscover = False;
-                    # end
-                # end
-            
-                # % If configuration data is not available for both
-                if serverFound:
-                    B.STATE_FLAG="connected";
-                    break;
-                elif not(configAvailable_server) and not(configAvailable_autodiscover):
-                    B.STATE_FLAG="exit";
-                    break;
-                else:
-                    B.STATE_FLAG="connection_retry";
-                    if retry < connectionRetryLimit-1:
-                        B.log(os.linesep+"Retry connection ...");
-                        time.sleep(1);
-                    else:
-                        B.log(os.linesep+"Connection retry limit reached ... exiting!");
-                    # end
-                # end           
-            
+            if B.get_serverURL()=="" and B.Server_autodiscover=="":
+                B.log("Server Configuration in ["+B.configuration_filepath+"] not found!",level=LOG_ERROR);
+                B.STATE_FLAG="exit";
+                return;
+            # end
+            if B.supervisor is None:
+                B.supervisor = ConnectionSupervisor(B,B.Server_HealthCheckSec,B.Server_BackoffMinSec,
+                                                    B.Server_BackoffMaxSec,B.Server_FailureThreshold).start();
+            # end
+            B.log("Connecting to ["+B.get_serverURL()+"] ... ");
+            if B.supervisor.waitConnected(B.Server_StartupWaitSec):
+                B.STATE_FLAG="connected";
+            else:
+                B.STATE_FLAG="connection_retry";
+                B.log("[warning]:Server not found yet, the cues are dropped until it is connected (retrying in the background)",level=LOG_WARNING);
             # end
             # % Just a new line for clarity
             B.log(" ");
         # end
 
+        # % Try to find the server control URL with the autodiscover option
+        def autodiscoverServer(B):
+            try:
+                # If the preemble is missing add the protocol to the auto discover
+                if B.Server_autodiscover.find(B.Server_Protocol) < 0:
+                    B.Server_autodiscover=B.Server_Protocol+"://"+B.Server_autodiscover;
+                # end
+                response = B.httpSession.get(B.Server_autodiscover,timeout=B.httpTimeout);
+                # % Convert the response data to formated strings.
+                URIs = response.text.splitlines();
+                # % Get the correct control IP
+                URI = list(filter(lambda x: (":"+str(B.Server_ControlPort)) in x, URIs))[0];
+                # % Split the URI
+                uriParts = URI.replace("://",":").split(':',3);
+                if not(B.Server_IP == uriParts[1]):
+                    B.log("Autodiscover found at ["+B.Server_autodiscover+"] is ["+URI+"]");
+                # end
+                B.Server_Protocol = uriParts[0];
+                B.Server_IP = uriParts[1];
+                B.Server_ControlPort = int(uriParts[2]);
+                return True;
+            except:
+                return False;
+            # end
+        # end
+
+        # % Called by the supervisor when the server is (re)connected
+        def onServerConnected(B):
+            # % The triggers were prepared for another address (autodiscovery)
+            if B.preparedServerURL and not(B.preparedServerURL == B.get_serverURL()):
+                B.log("Server address changed, rebuilding the trigger map for ["+B.get_serverURL()+"]");
+                B.serverTransport.close();
+                B.reloadTriggerMap();
+            # end
+            # % Log in again after a restart of the server (not before the startup login)
+            if B.preparedServerURL and not(B.Server_loggedIN):
+                B.handleLogin_();
+            # end
+        # end
+
+        # % Called by the supervisor after every successful health check: log in
+        # % again before a cue hits an expired login
+        def checkLogin(B,response):
+            from handleLogin import isLoginPage;
+            if not(B.preparedServerURL):
+                return;# % The startup login is done by the main thread
+            # end
+            expired = B.Server_ReauthSec > 0 and time.monotonic()-B.Server_loginTime > B.Server_ReauthSec;
+            if isLoginPage(response) or expired:
+                B.Server_loggedIN = False;
+            # end
+            if not(B.Server_loggedIN):
+                B.handleLogin_();
+            # end
+        # end
+
+        # % Called by the supervisor when the server is down
+        def onServerDown(B):
+            # % A restarted server needs a new login (and a new socket)
+            B.Server_loggedIN = False;
+            B.serverTransport.close();
+        # end
+
 
         # % Connection test function
-        def testConnection(B):
+        def testConnection(B,quiet=False):
             connectionOK = False;
             response = [];
             URL = B.get_serverURL();
             try:
-                B.log("Connecting to ["+URL+"] ... ");
+                if not(quiet):
+                    B.log("Connecting to ["+URL+"] ... ");
+                # end
                 # Send a test request to the server
-                response = requests.get(URL);
-                B.log("Server found at ["+URL+"]");
+                response = B.httpSession.get(URL,timeout=B.httpTimeout);
+                if not(quiet):
+                    B.log("Server found at ["+URL+"]");
+                # end
                 connectionOK = True;
             except:
-                B.log("Connection to ["+URL+"] failed!");
+                if not(quiet):
+                    B.log("Connection to ["+URL+"] failed!");
+                # end
             # end
             return [connectionOK , response];
         # end
 
+        # % Create the pooled keep-alive HTTP client owned by the bridge
+        def createHttpSession(B):
+            from requests.adapters import HTTPAdapter;
+            from urllib3.util.retry import Retry;
+
+            # % Only failed connects are retried. A command that reached the
+            # % server is never resent, a retried "/next" would skip a slide.
+            retry = Retry(total=B.HTTP_ConnectRetries, connect=B.HTTP_ConnectRetries, read=0, status=0,
+                          other=0, redirect=0, backoff_factor=0.05, raise_on_status=False);
+            adapter = HTTPAdapter(pool_connections=B.HTTP_PoolSize, pool_maxsize=B.HTTP_PoolSize, max_retries=retry);
+
+            B.httpSession = requests.Session();
+            B.httpSession.mount("http://",adapter);
+            B.httpSession.mount("https://",adapter);
+            B.httpTimeout = (B.HTTP_ConnectTimeoutSec,B.HTTP_ReadTimeoutSec);
+
+            # % Reuse the login cookies of the last run
+            if B.Server_CookieCache:# % Relative to the configuration file
+                from handleLogin import loadCookieCache;
+                B.Server_CookieCache = os.path.join(os.path.dirname(B.configuration_filepath),B.Server_CookieCache);
+                loadCookieCache(B);
+            # end
+        # end
+
+        # % Prepare the request of a trigger once, when the trigger map is processed
+        def prepareHttpRequest(B,URL):
+            return B.httpSession.prepare_request(requests.Request("GET",URL));
+        # end
+
+        # % Send a prepared trigger request, the argument (velocity) is appended to the URL.
+        # % The cookies are those of the session now (a login after the trigger map
+        # % was prepared, a new session cookie after a re-login)
+        def sendHttpRequest(B,request,argument="",headers=None):
+            request = request.copy();
+            request.url = request.url+argument;
+            request.headers.pop("Cookie",None);
+            request.prepare_cookies(B.httpSession.cookies);
+            request.headers.update(headers or {});
+            return B.httpSession.send(request,timeout=B.httpTimeout,allow_redirects=False);
+        # end
+
         def handleLogin_(B):
             from handleLogin import handleLogin; 
-            handleLogin(B); 
+            import threading;
+            if B.loginLock is None:
+                B.loginLock = threading.Lock();
+            # end
+            # % Called from the main thread, the supervisor and the dispatcher
+            with B.loginLock:
+                if B.supervisor is not None and not(B.supervisor.connected.is_set()):
+                    B.log("Login deferred until the server is connected");
+                    return;
+                # end
+                if not(B.Server_loggedIN):
+                    handleLogin(B); 
+                # end
+            # end
         # end
 
         # Import Triggers
         def importMidiTriggers(B):
-            import csv;
+            # Pass the data
+            B.MAP = B.loadTriggerRows(B.midi_HttpProtocolPreset);
+            B.MACROS = B.readMacroPreset(B.midi_MacroPreset);
+            B.TIMELINE = B.readTimeline(B.Schedule_Timeline);
+        # end
+
+        # % The rows of a trigger preset, from the preset cache when the file is unchanged
+        def loadTriggerRows(B,filePath):
+            if B.presetCache is None:
+                return B.readTriggerRows(filePath);
+            # end
+            return B.presetCache.load("preset",filePath,B.readTriggerRows);
+        # end
+
+        # % Read a trigger preset file as a list of rows (dicts of plain Python values)
+        def readTriggerRows(B,filePath):
+            return [{c:(v.item() if hasattr(v,"item") else v) for c,v in r.items()}
+                    for r in B.readTriggerPreset(filePath).to_dict("records")];
+        # end
+
+        # % Read a trigger preset file as a table
+        def readTriggerPreset(B,filePath):
             import pandas as pd;
 
             # Import the MIDI triggers as CSV table
-            data = pd.read_csv(B.midi_HttpProtocolPreset,delimiter=",");
+            data = pd.read_csv(filePath,delimiter=",");
             
             # % Specify column names and types
-            data.columns = ["HTTP_URL", "ServerAPI", "MidiMapping", "Description", "GroupType", "ActionTypeArguments", "MidimsgType", "MidiChanel", "MidiNote_CC", "ExternalExecutable", "ExternalCmd"];
+            columns = ["HTTP_URL", "ServerAPI", "MidiMapping", "Description", "GroupType", "ActionTypeArguments", "MidimsgType", "MidiChanel", "MidiNote_CC", "ExternalExecutable", "ExternalCmd"];
+            # % Optional columns (by header name), empty when missing
+            optionalColumns = {"Coalesce Edge":"CoalesceEdge", "Rate Limit Hz":"RateLimitHz", "Midi Source":"MidiSource",
+                               "Priority":"Priority", "Deadline Ms":"DeadlineMs"};
+            data.columns = columns+[optionalColumns.get(c.strip(),c) for c in data.columns[len(columns):]];
+            for c in optionalColumns.values():
+                if not(c in data.columns):
+                    data[c] = "";
+                # end
+            # end
             # opts.VariableTypes = ["string", "string", "categorical", "string", "categorical", "categorical", "string", "double", "double", "string", "string"];
 
             # % Specify file level properties
             # opts.ExtraColumnsRule = "ignore";
             # opts.EmptyLineRule = "read";
 
-            # Pass the data
-            B.MAP = data;
+            return data;
+        # end
+
+        # % Read a macro file as a list of rows (none without a file)
+        def readMacroPreset(B,filePath):
+            if not(filePath):
+                return [];
+            # end
+            # % Column names by header name
+            columns = {"Macro Name":"MacroName", "Midi Mapping":"MidiMapping", "Description":"Description",
+                       "Midi MsgType":"MidimsgType", "Midi Chanel":"MidiChanel", "Midi Note_CC":"MidiNote_CC",
+                       "Midi Source":"MidiSource", "Steps":"Steps"};
+            with open(filePath,newline="") as file:
+                return [{columns.get((c or "").strip(),c):value for c,value in row.items()} for row in csv.DictReader(file)];
+            # end
+        # end
+
+        # % Read a cue timeline file as a list of rows (none without a file)
+        def readTimeline(B,filePath):
+            if not(filePath):
+                return [];
+            # end
+            columns = {"Position":"Position", "Mapping":"Mapping", "Description":"Description", "Cue":"Cue"};
+            with open(filePath,newline="") as file:
+                return [{columns.get((c or "").strip(),c):value for c,value in row.items()} for row in csv.DictReader(file)];
+            # end
         # end
 
         # % Processing the tirggers and prepareing them for 
         def processTriggerMap(B):
-            # % Only process the enabled mappings
-            B.MAP = B.MAP.loc[B.MAP.MidiMapping == "enabled"];
-            
-            # % Make the HTTP Calls
-            B.MAP.HTTP_URL = B.get_serverURL()+B.MAP.HTTP_URL;
+            B.applyTriggerMap(B.compileTriggerMap(B.MAP,B.MACROS,B.TIMELINE));
+        # end
 
-            # Reset table indices
-            B.MAP = B.MAP.reset_index();
+        # % Process the trigger rows. Returns the compiled trigger map:
+        # % (rows, server URL, trigger lookup, channel/type filter, timeline, read triggers).
+        # % Raises on invalid mappings, nothing of the bridge is changed here.
+        # % The macro and timeline steps refer to the rows of the preset (enabled or not).
+        def compileTriggerMap(B,MAP,macroRows=(),timelineRows=()):
+            serverURL = B.get_serverURL();
+            presetPaths = {cellText(r["HTTP_URL"]).strip() for r in MAP if cellText(r["HTTP_URL"]).strip()};
+            readTriggers = compileReadTriggers(MAP,serverURL,B.prepareHttpRequest);
+            # % Only process the enabled mappings
+            MAP = [dict(r) for r in MAP if r["MidiMapping"] == "enabled"];
 
-            NoteAlph = [];
             # % Process the table entries
-            for index,r in B.MAP.iterrows():
+            for r in MAP:
+                # % Make the HTTP Calls
+                r["HTTP_URL"] = serverURL+cellText(r["HTTP_URL"]);
                 # % Get the MIDI notes Alphabetical form
-                if "Note".lower() in r.MidimsgType.lower():
-                    NoteAlph.append(B.val2note(r.MidiNote_CC));
+                if "Note".lower() in cellText(r["MidimsgType"]).lower():
+                    r["NoteAlph"] = B.val2note(float(r["MidiNote_CC"]));
                 else:
-                    NoteAlph.append("");
+                    r["NoteAlph"] = "";
                 # end
-            # # end
-            # # % Put the alphabetical note from in the trigger table
-            B.MAP['NoteAlph'] = NoteAlph;
+            # end
+
+            # % Compile the dispatch table used in the control loop
+            macros = compileMacros(macroRows,presetPaths,serverURL,B.prepareHttpRequest,B.Dispatch_PriorityGroups);
+            triggerTable = compileTriggerTable(MAP,B.prepareHttpRequest,B.Coalesce_DefaultRateHz,macros,B.Dispatch_PriorityGroups);
+            timeline = compileTimeline(timelineRows,presetPaths,serverURL,B.prepareHttpRequest,B.Dispatch_PriorityGroups);
+            return (MAP,serverURL,triggerTable,triggerChannelTypes(triggerTable),timeline,readTriggers);
+        # end
+
+        # % Swap in a compiled trigger map
+        def applyTriggerMap(B,triggerMap):
+            B.MAP, B.preparedServerURL, B.triggerTable, B.triggerFilter, B.timeline, B.readTriggers = triggerMap;
+            B.triggerSourced = hasSourceTriggers(B.triggerTable);
+            # % The MIDI pre-filter of the main bridge covers all the targets
+            main = B.parent or B;
+            main.inputFilter = frozenset().union(*[T.triggerFilter for T in main.targets or [main]]);
+        # end
+
+        # % Re-read and compile the trigger preset in the calling (background)
+        # % thread. While the control loop runs, the new map is swapped in by the
+        # % loop between two reads; the queued commands keep their triggers.
+        def reloadTriggerMap(B):
+            tStart = time.perf_counter();
+            try:
+                macroRows = B.readMacroPreset(B.midi_MacroPreset);
+                timelineRows = B.readTimeline(B.Schedule_Timeline);
+                triggerMap = B.compileTriggerMap(B.loadTriggerRows(B.midi_HttpProtocolPreset),macroRows,timelineRows);
+            except Exception as err:
+                B.log("[warning]:Triggers of ["+B.midi_HttpProtocolPreset+"] not reloaded, keeping the current ones: "+str(err),level=LOG_WARNING);
+                return False;
+            # end
+            main = B.parent or B;
+            with B.reloadLock:
+                B.MACROS = macroRows;
+                B.TIMELINE = timelineRows;
+                if main.STATE_FLAG == "running":
+                    B.pendingTriggerMap = triggerMap;
+                    main.reloadPending = True;
+                else:
+                    B.applyTriggerMap(triggerMap);
+                # end
+            # end
+            B.log("Reloaded %i triggers from [%s] in %.1f ms",len(triggerMap[2]),B.midi_HttpProtocolPreset,(time.perf_counter()-tStart)*1000.);
+            return True;
+        # end
+
+        # % Called by the control loop between two reads
+        def swapPendingTriggerMaps(B):
+            B.reloadPending = False;
+            for T in B.targets:
+                with T.reloadLock:
+                    if T.pendingTriggerMap is not None:
+                        T.applyTriggerMap(T.pendingTriggerMap);
+                        T.pendingTriggerMap = None;
+                    # end
+                # end
+            # end
         # end
     # end
 
@@ -432,191 +939,305 @@ class MIDI2HTTP_Bridge:
         
         # % Run main loop
         def runLoop(B):
-            # Midi library imports 
-            import pygame as pg;
-            import pygame.midi;
-            
-            # Pygame and MIDI library initialization
-            pg.init();
-            pg.fastevent.init();
-            pygame.midi.init();
-            # Event aliases
-            event_get = pg.fastevent.get;
-            event_post = pg.fastevent.post;
-
-            # Setup midi input handle  
-            i_ = pygame.midi.Input(B.midiDevice['device_id']);
+            # % Open the MIDI input (no display or pygame event loop is needed, stop with Ctrl+C)
+            backend = B.getMidiBackend();
+            backend.open(B.midiDevice);
 
-            # Mode setup display mode in pixels
-            pg.display.set_mode((1, 1));
+            # % Start the HTTP dispatch stage and the latency instrumentation
+            B.startDispatch();
+            B.installLatencyReportSignal();
 
             # % Compute the time delay to maintain the loop
             tDelayInSeconds = 1./B.inLoopFPS;
+            # % The "blocking" wait needs a backend that signals new messages
+            midiWait = createWaitStrategy(B.MIDI_WaitStrategy,tDelayInSeconds,B.MIDI_IdleMaxDelayMs/1000.,
+                                          supportsNotify=backend.supportsCallback,log=B.log);
+            if midiWait.needsNotify:
+                backend.setNotify(midiWait.notify);
+            # end
+            B.log("MIDI wait strategy: ["+midiWait.name+"]");
             B.STATE_FLAG = 'running';# % Running state update
+            # % Aliases of the backend functions
+            poll = backend.poll;
+            read = backend.read;
+            midiTime = backend.time;
+            # % Capture of the MIDI input for a later replay
+            recorder = B.startMidiRecorder();
 
-            uMidiChannels = list(pd.unique(B.MAP.MidiChanel));
-            # uMidiTypes    = ["NoteOn","ControlChange"];
-            uMidiTypes    = list(pd.unique(B.MAP.MidimsgType));
-            Warning("... Other types need to be included but for now this is sufficient");
 
             def tic():
                 # The function will return the start timer mark
-                return time.time();
+                return time.perf_counter();
 
             def toc(startTime):
                 # The function will return elapced time
-                return time.time() - startTime;
-
-            if B.diagnosticMode:
-                # % Timers and counters
-                totalTime = tic();#% Total time
-                loopCount = 0;#% Total counter
-                lastTime  = tic();#% Last time
-                lastCount = 0;#% Last count
+                return time.perf_counter() - startTime;
 
-            # end
-            
             # % Run the main control loop
-            while True:
-                cycleTime  = tic();#% Loop timing
+            try:
+                while True:
+                    cycleTime  = tic();#% Loop timing
 
-                # Get events
-                events = event_get();
-                for e_ in events:
-                    if e_.type in [pg.QUIT] or e_.type in [pg.KEYDOWN]:
-                        B.STATE_FLAG = "stop";
-                    if e_.type in [pygame.midi.MIDIIN]:
-                        B.log(e_.__str__());
-                
-                # % Check if any new messages have been recieved
-                if i_.poll():
-                    # % Get the midi messages
-                    midi_events = i_.read(10);
-                    
-                    # convert them into pygame events.
-                    # midi_evs = pygame.midi.midis2events(midi_events, i_.device_id);                    
-                    # for m_e in midi_evs:
-                        # event_post(m_e);
+                    # % Swap in a reloaded trigger map (between the events)
+                    if B.reloadPending:
+                        B.swapPendingTriggerMaps();
                     # end
 
-                    # % Loop over all messages that have been recieved
-                    for single_midi_event in midi_events:
-
-                        midiS = B.convertPygameEventToMIDIstruct(single_midi_event);
-                        # % Ignore all messages that don't match the midi channel and the
-                        # % midi message types in the cue trigger mapping database file
-                        if (midiS.Channel in uMidiChannels) and (midiS.Type in uMidiTypes):
-                            # % Call the callback function
-                            B.handleMidiCallback(midiS);
+                    # % Check if any new messages have been recieved
+                    midiWait.arm();
+                    hadTraffic = poll();
+                    if hadTraffic:
+                        # % Get the midi messages (and the MIDI clock to compare the device timestamps with)
+                        midi_events = read(10);
+                        tRead = time.perf_counter();
+                        midiNow = midiTime();
+                        if recorder is not None:
+                            recorder.write(midi_events,tRead);
                         # end
+
+                        # % Decode and handle the messages
+                        B.processMidiPackets(midi_events,midiNow,tRead);
+                    elif backend.finished():# % A finite (virtual) source has been played
+                        B.STATE_FLAG = "stop";
                     # end
-                # end
 
 
-                # % Time delay to maintain the refresh rate 
-                currentDelay = (tDelayInSeconds - toc(cycleTime))*0.925;
-                if currentDelay > 0:
-                    # % Dealy
-                    time.sleep(currentDelay);
-                # end
+                    # % Wait for the next poll
+                    midiWait.wait(cycleTime,hadTraffic);
                 
-                if B.diagnosticMode:
-                    loopCount = loopCount+1;# % Increment the count the total count
-                    lastCount = lastCount+1;# % Increment the count the last count                
-                    # % Disagnostic for tuneing (not needed in deployment)
-                    if not(mod(loopCount,B.inLoopFPS)):
-                        diagnosticMsg = "FPS:%i | C:%i = Clast:%i | T:%f = T:%f | Rtot:%f = Rlast:%f"; 
-                        diagnosticData = [B.inLoopFPS,loopCount,lastCount,toc(totalTime),toc(lastTime),loopCount/toc(totalTime),lastCount/toc(lastTime)];
-                        B.log( diagnosticMsg % tuple(diagnosticData) );
-                        lastTime  = tic();#% Last time reset
-                        lastCount = 0;#% Last count reset
+                    # % Loop rate of the metrics endpoint
+                    B.loopCount += 1;
+
+                    # Exit flag
+                    if not(B.STATE_FLAG=="running"):
+                        break;
                     # end
-                # end
 
-                # Exit flag
-                if not(B.STATE_FLAG=="running"):
-                    break;
                 # end
-
+            except KeyboardInterrupt:
+                B.STATE_FLAG = "stop";
+            finally:
+                if recorder is not None:
+                    recorder.close();
+                    B.log("Recorded %i MIDI packets to [%s]",recorder.records,recorder.filePath);
+                # end
+                # % Drain and stop the HTTP dispatch stage
+                B.stopDispatch();
+                # Free the input handle
+                backend.close();
             # end
+        # end
 
-            # Free the input handle
-            del i_;
-            # close the midi module connection
-            pygame.midi.quit();
+        # % Open the recording file of the MIDI input (relative to the configuration file)
+        def startMidiRecorder(B):
+            if not(B.MIDI_RecordFile):
+                return None;
+            # end
+            filePath = os.path.join(os.path.dirname(B.configuration_filepath),
+                                    B.MIDI_RecordFile.replace("{time}",time.strftime("%Y%m%d-%H%M%S")));
+            try:
+                recorder = MidiRecorder(filePath,B.midiSourceNames).start();
+            except OSError as err:
+                B.log("[warning]:MIDI recording ["+filePath+"] not started: "+str(err),level=LOG_WARNING);
+                return None;
+            # end
+            B.log("Recording the MIDI input to ["+filePath+"]");
+            return recorder;
+        # end
 
+        # % Start the HTTP dispatch stage, the MIDI decoder and the latency instrumentation
+        def startDispatch(B):
+            B.midiDecoder = MidiDecoder();
+            B.latencyStats = LatencyStats();
+            B.responseCache = ResponseCache(B.Cache_MaxEntries,B.Cache_TTLSec);
+            B.dispatcher = HttpDispatcher(B,B.Dispatch_QueueSize);
+            B.coalescer = TriggerCoalescer(B.dispatcher.submit);
+            B.launcher = ExternalLauncher(B.log,os.path.dirname(B.midi_HttpProtocolPreset),B.Launch_MaxConcurrent,
+                                          B.Launch_QueueSize,B.Launch_TimeoutSec,B.Launch_PythonWorkers,B.responseCache.text);
+            if any(trigger.ExternalExecutable.lower().endswith(".py") for T in B.targets for trigger in T.triggerTable.values()):
+                B.launcher.prewarm();
+            # end
+            # % Hot reload of the edited preset/configuration files
+            if B.Reload_PollSec > 0 and B.presetWatcher is None:
+                B.presetWatcher = PresetWatcher(B,B.Reload_PollSec).start();
+            # end
+            # % Transport of the DAW and the timeline cues sent ahead of it
+            if any(T.Schedule_Timeline for T in B.targets):
+                B.transport = MidiTransport();
+                B.cueScheduler = CueScheduler(B,B.transport,B.Schedule_LeadMaxMs/1000.,B.Schedule_LateMs/1000.,
+                                              B.Schedule_DefaultLatencyMs/1000.).start();
+                B.log("Timeline cues: %s",{T.targetName:len(T.timeline.Cues) for T in B.targets});
+            # end
+            # % Metrics endpoint for scraping while running
+            if B.Metrics_Port > 0 and B.metricsServer is None:
+                try:
+                    B.metricsServer = MetricsServer(B,B.Metrics_Host,B.Metrics_Port).start();
+                    B.log("Metrics at [http://%s:%i/metrics]",*B.metricsServer.address());
+                    B.log("Response cache at [http://%s:%i/cache]",*B.metricsServer.address());
+                except OSError as err:
+                    B.log("[warning]:Metrics endpoint on port ["+str(B.Metrics_Port)+"] not started: "+str(err),level=LOG_WARNING);
+                # end
+            # end
         # end
 
-        class convertPygameEventToMIDIstruct:
-            # Proeprties
-            Channel = 16;# Default midi channel
-            Type    = "NoteOn";# Default midi type
-            Note_CC = 0;# Default midi Note_CC
-            Velocity= 0;# Default midi velocity
-            Time    = 0;# Default midi message time
-            # Constructor
-            def __init__(midi_struct,midi_event):
-                # Interface function toconvert between midi events from pygame and useable midi structures
-                midi_struct.Note_CC  = midi_event[0][1];
-                midi_struct.Velocity = midi_event[0][2];
-                midi_struct.Time     = midi_event[1];
-                # If the trigger has 0 velocity it is effectively "NoteOff" type 
-                if midi_struct.Type =="NoteOn" and midi_struct.Velocity == 0:
-                    midi_struct.Type="NoteOff";
+        # % Drain and stop the HTTP dispatch stage and report the statistics
+        def stopDispatch(B):
+            if B.metricsServer is not None:
+                B.metricsServer.stop();
+                B.metricsServer = None;
+            # end
+            if B.presetWatcher is not None:
+                B.presetWatcher.stop();
+                B.log("Reload statistics: %s",B.presetWatcher.stats());
+                B.presetWatcher = None;
+            # end
+            if B.cueScheduler is not None:
+                B.cueScheduler.stop();
+                B.log("Timeline statistics: %s",B.cueScheduler.stats());
+                B.cueScheduler = None;
+            # end
+            B.coalescer.stop();
+            B.dispatcher.stop();
+            B.launcher.stop();
+            B.log("Dispatch statistics: %s %s",B.dispatcher.stats(),B.coalescer.stats());
+            B.log("Response cache statistics: %s",B.responseCache.stats());
+            B.log("External command statistics: %s",B.launcher.stats());
+            for T in B.targets:
+                T.serverTransport.close();
+                B.log("Target [%s] %s: %s",T.targetName,T.get_serverURL(),B.targetReport(T));
+                if T.supervisor is not None:
+                    T.supervisor.stop();
                 # end
             # end
+            B.dumpLatencyReport();
+            B.logger.flush();
         # end
 
-        def handleMidiCallback(B,midi):
-            # This function handles the callback 
+        # % Status and timing of one server target
+        def targetReport(B,T):
+            report = {};
+            if T.supervisor is not None:
+                report.update(T.supervisor.stats());
+            # end
+            report.update(T.serverTransport.stats());
+            report.update(B.dispatcher.laneStats(T.targetName));
+            total = B.latencyStats.combined("read->response",T.preparedServerURL+"/");
+            if T.preparedServerURL and total.count:
+                report["read->response p50/p95/max [ms]"] = "%.3f/%.3f/%.3f" % (total.percentile(50),total.percentile(95),total.maximum);
+            # end
+            return report;
+        # end
 
-            # % Filter the trigger table
-            try:
-                rowIndex = list(B.MAP.MidiChanel == midi.Channel) and list(B.MAP.MidiNote_CC == midi.Note_CC);
-            except:
-                "wait";
+        # % Decode all the packets of one MIDI read and handle the messages
+        def processMidiPackets(B,midi_events,midiNow,tRead):
+            # % Decode all the messages that have been recieved in one pass.
+            # % Ignore all messages that don't match the midi channel and the
+            # % midi message types in the cue trigger mapping database file
+            midiMessages = B.midiDecoder.decodeBatch(midi_events,B.inputFilter);
+            B.midiPackets += len(midi_events);
+            # % The clock/timecode messages move the transport of the timeline
+            if B.transport is not None:
+                B.transport.feed(midi_events,midiNow,tRead);
             # end
+            stamps = (midiNow,tRead,time.perf_counter());
+            for midiS in midiMessages:
+                # % Call the callback function
+                B.handleMidiCallback(midiS,stamps);
+            # end
+        # end
 
-            if any(rowIndex) and sum(rowIndex)==1:
-                # % Get the correct trigger
-                trigger = B.MAP[rowIndex]; 
+        def handleMidiCallback(B,midi,stamps=None):
+            # This function handles the callback 
+            # % stamps = (MIDI clock at read [ms], read time, decode time)
+
+            # % Match the trigger with a single lookup in the compiled table of
+            # % every server target, each matching target gets the command on its
+            # % own dispatch lane (the targets are served concurrently)
+            key = (midi.Channel,midi.Type,midi.Note_CC);
+            matched = False;
+            for T in B.targets:
+                trigger = None;
+                if T.triggerSourced:# % The triggers of the source input come first
+                    trigger = T.triggerTable.get(key+(B.midiSourceNames[midi.Source],));
+                # end
+                if trigger is None:
+                    trigger = T.triggerTable.get(key);
+                    if trigger is None:
+                        continue;
+                    # end
+                # end
+                tMatch = time.perf_counter();
+                matched = True;
 
+                argument = "";
                 # % "void action()" is the default command type                
                 # % Support for "void action(int velocity)"
-                if trigger.ActionTypeArguments.tolist() == "void action(int velocity)":
-                    trigger.HTTP_URL=trigger.HTTP_URL+""+str(midi.Velocity-1);
+                if trigger.ActionTypeArguments == ACTION_WITH_VELOCITY:
+                    argument = str(midi.Velocity-1);
                 # end
 
-                try:
-                    # Send the HTTP command
-                    response = requests.get(trigger.HTTP_URL.to_list()[0]);
-                    net_http_StatusCode_TemporaryRedirect = 307;
-                    if response.status_code == net_http_StatusCode_TemporaryRedirect:
-                        B.handleLogin_();
-                    # end
-                except: 
-                    B.testConnection();
+                # % Stage timestamps: device lag [ms], read, decode, match, send, response
+                if stamps is None:
+                    eventStamps = [0.,tMatch,tMatch,tMatch,0.,0.];
+                else:
+                    eventStamps = [max(stamps[0]-midi.Time,0),stamps[1],stamps[2],tMatch,0.,0.];
                 # end
 
-                # % Match the midi note            
-                B.log("MIDI event:"+B.getKeyValuePropertyPairs(midi).__repr__());
-                B.log("HTTP call:"+trigger.values.__repr__().replace("\n","").replace("        "," ")+os.linesep);
-            else:
-                if sum(rowIndex) > 1:
-                    B.log("[error]:Multiple MIDI triggers matching as shown in the table:");
-                    B.log(B.MAP[rowIndex]);
-                    errorMsg = "[error]:Multiple MIDI triggers matching!";
-                    B.log(errorMsg); 
-                    raise Exception();
+                # % Hand the HTTP command over to the dispatch stage (never blocks),
+                # % the bursty triggers go through the coalescing stage first, the
+                # % macros run on the macro lane of the target
+                if trigger.Macro:
+                    B.dispatcher.submit(T.targetName,(trigger,argument,eventStamps));
+                elif trigger.Request is None:
+                    pass;# % External command only
+                elif trigger.CoalesceEdge == "none":
+                    B.dispatcher.submit(T.targetName,(trigger,argument,eventStamps));
+                else:
+                    B.coalescer.offer(T.targetName,(trigger,argument,eventStamps));
                 # end
-                if sum(rowIndex) < 1:
-                     B.log("No MIDI triggers matching the trigger map");
+                # % Local command of the cue (script, camera or lighting switch ...)
+                if trigger.ExternalExecutable:
+                    B.launcher.launch(trigger,midi);
                 # end
+
+                # % Match the midi note            
+                B.log(MIDI_EVENT_LOG,midi,trigger.HTTP_URL,argument,trigger);
+            # end
+            if matched:
+                B.midiMatched += 1;
+            else:
+                B.midiUnmatched += 1;
+                B.log("No MIDI triggers matching the trigger map");
+            # end
+        # end
+
+        # % Log the latency histograms of the dispatched events
+        def dumpLatencyReport(B):
+            if B.latencyStats is not None:
+                B.log(B.latencyStats.report());
+            # end
+        # end
+
+        # % Dump the latency report on demand with a signal
+        # % (SIGUSR1 "kill -USR1 <pid>" on posix, Ctrl+Break on Windows)
+        def installLatencyReportSignal(B):
+            import signal;
+            reportSignal = getattr(signal,"SIGUSR1",None) or getattr(signal,"SIGBREAK",None);
+            if reportSignal is None:
+                return;
+            # end
+            try:
+                signal.signal(reportSignal,lambda signum,frame: B.dumpLatencyReport());
+            except ValueError:# % Only possible from the main thread
+                pass;
             # end
         # end
 
         def getKeyValuePropertyPairs(B,object):
             # Get Key value propery pairs
+            if hasattr(object,"__slots__"):
+                return {key:getattr(object,key) for key in object.__slots__};
+            # end
             return {key:value for key, value in object.__dict__.items() if not key.startswith('__') and not callable(key)}
             
         # end
@@ -643,7 +1264,7 @@ class MIDI2HTTP_Bridge:
             # end
 
             if 0 <= val and val <= 127:
-                noteStr = B.notesInOctave[ int( mod(val,B.notesInOctave.__len__()) + 1 ) ] + \
+                noteStr = B.notesInOctave[ int( val % B.notesInOctave.__len__() ) ] + \
                             str( floor( val/B.notesInOctave.__len__()) - 1 );
             else: 
                 B.log('MIDI notes range is [0:127] the input value is out of bounds!');
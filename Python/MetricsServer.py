@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   MetricsServer
+# % Description: Optional local HTTP endpoint with the runtime metrics of the
+# % bridge in the Prometheus text format (http://127.0.0.1:PORT/metrics):
+# % MIDI messages received/matched/unmatched, HTTP calls by status, dispatch
+# % queue depth, drops and expired cues, server state and reconnects, control
+# % loop rate and the latency histograms. The metrics are read from the counters of the
+# % stages when scraped, nothing is computed in the control loop.
+# % The same server answers the queries of the response cache (/cache).
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import time;
+import threading;
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler;
+
+from ResponseCache import cacheQuery;
+
+# % Prefix of the metric names
+METRICS_PREFIX = "daw2http_";
+# % Upper bounds of the exported latency histogram buckets in milliseconds
+METRICS_LATENCY_BOUNDS_MS = [0.25, 0.5, 1., 2., 5., 10., 20., 50., 100., 200., 500., 1000., 2000., 5000.];
+
+
+def labelText(labels):
+    if not(labels):
+        return "";
+    # end
+    values = [k+"=\""+str(v).replace("\\","\\\\").replace("\"","\\\"").replace("\n","\\n")+"\"" for k,v in labels.items()];
+    return "{"+",".join(values)+"}";
+# end
+
+
+# ==============================================================
+class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(h):
+            path = h.path.split("?",1)[0];
+            if path == "/cache":
+                status, contentType, body, headers = cacheQuery(h.server.metrics.B,h.path);
+            elif path in ("/metrics","/"):
+                status, contentType, body, headers = 200, "text/plain; version=0.0.4; charset=utf-8", h.server.metrics.render().encode(), {};
+            else:
+                h.send_error(404);
+                return;
+            # end
+            h.send_response(status);
+            h.send_header("Content-Type",contentType);
+            h.send_header("Content-Length",str(len(body)));
+            for key,value in headers.items():
+                h.send_header(key,value);
+            # end
+            h.end_headers();
+            h.wfile.write(body);
+        # end
+
+        def log_message(h,format,*args):
+            pass;# % The scrapes are not logged
+        # end
+# end
+
+
+# ==============================================================
+class MetricsServer:
+
+    # properties
+        B=None;# The bridge
+        scrapes=0;
+    # end
+
+    # methods
+        def __init__(M,B,host="127.0.0.1",port=9108):
+            M.B = B;
+            M.scrapes = 0;
+            M.lastLoop = (time.perf_counter(),B.loopCount);
+            M.loopRate = 0.;
+            M.lock = threading.Lock();
+            M.httpd = ThreadingHTTPServer((host,port),MetricsHandler);
+            M.httpd.daemon_threads = True;
+            M.httpd.metrics = M;
+            M.thread = threading.Thread(target=M.httpd.serve_forever, name="metrics-server", daemon=True);
+        # end
+
+        def address(M):
+            return M.httpd.server_address;
+        # end
+
+        def start(M):
+            M.thread.start();
+            return M;
+        # end
+
+        def stop(M):
+            M.httpd.shutdown();
+            M.httpd.server_close();
+        # end
+
+        def render(M):
+            # % The metrics in the Prometheus text format
+            B = M.B;
+            lines = [];
+            def metric(name,kind,description,samples):
+                lines.append("# HELP "+METRICS_PREFIX+name+" "+description);
+                lines.append("# TYPE "+METRICS_PREFIX+name+" "+kind);
+                for labels,value in samples:
+                    lines.append(METRICS_PREFIX+name+labelText(labels)+" "+repr(float(value)));
+                # end
+            # end
+
+            with M.lock:
+                M.scrapes += 1;
+                now, loops = time.perf_counter(), B.loopCount;
+                if now > M.lastLoop[0]:
+                    M.loopRate = (loops-M.lastLoop[1])/(now-M.lastLoop[0]);
+                # end
+                M.lastLoop = (now,loops);
+                loopRate = M.loopRate;
+            # end
+
+            # % MIDI input and control loop
+            metric("midi_packets_received_total","counter","MIDI packets read from the inputs",[({},B.midiPackets)]);
+            metric("midi_messages_total","counter","Decoded MIDI messages of the trigger channels/types",
+                   [({"result":"matched"},B.midiMatched),({"result":"unmatched"},B.midiUnmatched)]);
+            metric("loop_iterations_total","counter","Control loop iterations",[({},loops)]);
+            metric("loop_rate_hz","gauge","Control loop iterations per second since the last scrape",[({},loopRate)]);
+
+            # % HTTP dispatch
+            D = B.dispatcher;
+            metric("http_requests_total","counter","HTTP calls by server target and status ('error': no response, 'sent': WebSocket frame written, no answer)",
+                   [({"target":target,"status":status},n) for (target,status),n in sorted(D.statusSnapshot().items(),key=str)]);
+            lanes = D.laneSnapshot();
+            metric("dispatch_queue_depth","gauge","Commands waiting in the dispatch lane",[({"lane":name},L.qsize()) for name,L in lanes]);
+            metric("dispatch_dropped_total","counter","Commands dropped on a full dispatch lane: the new one (rejected) or a queued one (evicted)",
+                   [({"lane":name,"reason":reason},getattr(L,reason)) for name,L in lanes for reason in ("rejected","evicted")]);
+            metric("dispatch_expired_total","counter","Commands past their deadline, dropped instead of sent late",[({"lane":name},L.expired) for name,L in lanes]);
+            metric("dispatch_reauth_retries_total","counter","Commands resent after a new login",[({},D.reauthRetries)]);
+            metric("coalesced_total","counter","Bursty values superseded by a newer one",[({},B.coalescer.coalesced)]);
+
+            # % Server targets
+            targets = [T for T in B.targets if T.supervisor is not None];
+            metric("server_connected","gauge","1 when the server target is connected, 0.5 degraded, 0 down",
+                   [({"target":T.targetName},{"connected":1.,"degraded":.5}.get(T.supervisor.state,0.)) for T in targets]);
+            metric("server_reconnects_total","counter","Reconnections of the server target",[({"target":T.targetName},T.supervisor.reconnects) for T in targets]);
+            metric("server_rejected_total","counter","Commands failed fast while the server was down",[({"target":T.targetName},T.supervisor.rejected) for T in targets]);
+
+            # % Response cache of the read triggers
+            if B.responseCache is not None:
+                cacheStats = B.responseCache.stats();
+                metric("cache_requests_total","counter","Reads of the response cache by result",
+                       [({"result":result},cacheStats[result]) for result in ("hits","misses","revalidated")]);
+                metric("cache_entries","gauge","Cached responses",[({},cacheStats["entries"])]);
+                metric("cache_evictions_total","counter","Cached responses evicted by the size limit",[({},cacheStats["evicted"])]);
+            # end
+
+            # % External commands and hot reload
+            if B.launcher is not None:
+                metric("external_commands_total","counter","External commands by result",
+                       [({"result":result},n) for result,n in B.launcher.stats().items()]);
+            # end
+            if B.presetWatcher is not None:
+                metric("reloads_total","counter","Preset/configuration reloads by result",
+                       [({"result":"ok"},B.presetWatcher.reloads),({"result":"error"},B.presetWatcher.errors)]);
+            # end
+
+            if B.cueScheduler is not None:
+                metric("timeline_cues_total","counter","Timeline cues sent ahead of the transport, or missed",
+                       [({"result":"sent"},B.cueScheduler.fired),({"result":"missed"},B.cueScheduler.missed)]);
+                metric("transport_tempo_bpm","gauge","Tempo of the MIDI clock",[({},B.transport.tempo())]);
+            # end
+
+            # % Latency histograms (seconds)
+            name = METRICS_PREFIX+"latency_seconds";
+            lines.append("# HELP "+name+" Stage latency of the dispatched events");
+            lines.append("# TYPE "+name+" histogram");
+            for trigger,stages in sorted(B.latencyStats.export(METRICS_LATENCY_BOUNDS_MS).items()):
+                for stage,(cumulative,count,totalMs) in stages.items():
+                    labels = {"trigger":trigger, "stage":stage};
+                    for bound,n in zip(METRICS_LATENCY_BOUNDS_MS,cumulative):
+                        lines.append(name+"_bucket"+labelText(dict(labels,le=repr(bound/1000.)))+" "+repr(float(n)));
+                    # end
+                    lines.append(name+"_bucket"+labelText(dict(labels,le="+Inf"))+" "+repr(float(count)));
+                    lines.append(name+"_sum"+labelText(labels)+" "+repr(totalMs/1000.));
+                    lines.append(name+"_count"+labelText(labels)+" "+repr(float(count)));
+                # end
+            # end
+            return "\n".join(lines)+"\n";
+        # end
+    # end
+# end
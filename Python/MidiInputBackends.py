@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+# %
+# % Description: MIDI input backends. The control loop only talks to the
+# % MidiInputBackend interface, the backend is selected with "MIDI_Backend" in
+# % the configuration file:
+# %   "pygame"   - pygame.midi (PortMidi), polled. No pygame display is opened.
+# %   "callback" - python-rtmidi, the messages are pushed by the MIDI driver
+# %                callback without polling (install with: pip install python-rtmidi).
+# %   "virtual"  - no MIDI hardware, the messages come from a text file
+# %                ("MIDI_VirtualSource") or from an in-process queue (send()).
+# %                Used for headless runs and deterministic load tests.
+# %   "replay"   - a recording of a live session (MidiRecorder, the file in
+# %                "MIDI_VirtualSource"), at the original speed or as fast as possible.
+# % All the backends return the packets like pygame "Input.read":
+# % [[status, data1, data2, data3], timestamp_ms].
+# % Several inputs ("midi_BridgeName" list separated by ";") are read by the
+# % MultiMidiBackend fan-in: one reader thread per input, merged in time order
+# % within each read (see MultiMidiBackend.read).
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import time;
+import threading;
+from collections import deque;
+from operator import itemgetter;
+
+from MidiRecorder import MidiRecording;
+
+
+# ==============================================================
+# The backend interface
+class MidiInputBackend:
+        name = "";
+        # % True when the backend signals new messages (blocking wait possible)
+        supportsCallback = False;
+
+        def listDevices(M):
+            # % List of dicts with: interface, name, is_input, is_output, opened, device_id
+            return [];
+        # end
+
+        def open(M,device):
+            pass;
+        # end
+
+        def poll(M):
+            return False;
+        # end
+
+        def read(M,count):
+            return [];
+        # end
+
+        def time(M):
+            # % The clock of the packet timestamps in milliseconds
+            return 0;
+        # end
+
+        def setNotify(M,notify):
+            # % Function called (from any thread) when new messages arrive
+            pass;
+        # end
+
+        def finished(M):
+            # % True when a finite source has been fully read
+            return False;
+        # end
+
+        def close(M):
+            pass;
+        # end
+
+        def portBackend(M,device):
+            # % A new backend of the same type for one more opened input
+            return type(M)();
+        # end
+# end
+
+
+# ==============================================================
+class PygameMidiBackend(MidiInputBackend):
+        name = "pygame";
+
+        def __init__(M):
+            # Import the MIDI module from pygame (pygame.init and a display are not needed)
+            import pygame.midi;
+            M.midi = pygame.midi;
+            M.input = None;
+        # end
+
+        def listDevices(M):
+            M.midi.init();
+            devices = [];
+            keys = ['interface', 'name', 'is_input', 'is_output', 'opened'];
+            for device_ID in range(M.midi.get_count()):
+                device = M.midi.get_device_info(device_ID);
+                info = dict(zip(keys, device));
+                info['device_id'] = device_ID;
+                info['handle'] = device;
+                info['name'] = info['name'].decode();
+                devices.append(info);
+            # end
+            M.midi.quit();
+            return devices;
+        # end
+
+        def open(M,device):
+            M.midi.init();
+            # Setup midi input handle
+            M.input = M.midi.Input(device['device_id']);
+            M.poll = M.input.poll;
+            M.read = M.input.read;
+            M.time = M.midi.time;
+        # end
+
+        def close(M):
+            # Free the input handle and close the midi module connection
+            if M.input is not None:
+                M.input.close();
+                M.input = None;
+            # end
+            M.midi.quit();
+        # end
+# end
+
+
+# ==============================================================
+# Base of the backends that receive the messages in another thread
+class PushMidiBackend(MidiInputBackend):
+        supportsCallback = True;
+
+        def __init__(M):
+            M.buffer = deque();
+            M.notify = None;
+            M.t0 = time.perf_counter();
+        # end
+
+        def push(M,data,timestamp=None):
+            # % Called from the driver/feeder thread
+            M.buffer.append([data, M.time() if timestamp is None else timestamp]);
+            notify = M.notify;
+            if notify is not None:
+                notify();
+            # end
+        # end
+
+        def poll(M):
+            return len(M.buffer) > 0;
+        # end
+
+        def read(M,count):
+            packets = [];
+            popleft = M.buffer.popleft;
+            try:
+                for n in range(count):
+                    packets.append(popleft());
+                # end
+            except IndexError:
+                pass;
+            # end
+            return packets;
+        # end
+
+        def time(M):
+            return int((time.perf_counter()-M.t0)*1000.);
+        # end
+
+        def setNotify(M,notify):
+            M.notify = notify;
+        # end
+# end
+
+
+# ==============================================================
+class CallbackMidiBackend(PushMidiBackend):
+        name = "callback";
+
+        def __init__(M):
+            PushMidiBackend.__init__(M);
+            import rtmidi;
+            M.rtmidi = rtmidi;
+            M.input = None;
+        # end
+
+        def listDevices(M):
+            midiIn = M.rtmidi.MidiIn();
+            devices = [];
+            for device_ID,name in enumerate(midiIn.get_ports()):
+                devices.append({'interface':midiIn.get_current_api(), 'name':name, 'is_input':1, 'is_output':0,
+                                'opened':0, 'device_id':device_ID, 'handle':None});
+            # end
+            midiIn.delete();
+            return devices;
+        # end
+
+        def open(M,device):
+            M.input = M.rtmidi.MidiIn();
+            # % System exclusive and active sensing are not needed, keep the timing messages
+            M.input.ignore_types(sysex=True, timing=False, active_sense=True);
+            M.input.set_callback(M.onMidi);
+            M.input.open_port(device['device_id']);
+        # end
+
+        def onMidi(M,event,data=None):
+            # % rtmidi driver callback: ([status, data1, data2], delta time)
+            message = event[0];
+            M.push([message[0],
+                    message[1] if len(message) > 1 else 0,
+                    message[2] if len(message) > 2 else 0, 0]);
+        # end
+
+        def close(M):
+            if M.input is not None:
+                M.input.cancel_callback();
+                M.input.close_port();
+                M.input.delete();
+                M.input = None;
+            # end
+        # end
+# end
+
+
+# ==============================================================
+class VirtualMidiBackend(PushMidiBackend):
+        name = "virtual";
+
+        def __init__(M,deviceName="Virtual MIDI",source=None,realtime=True):
+            # % source - text file path, list of packets or None (in-process queue via send())
+            # % Several virtual inputs: device names and text files separated by ";"
+            PushMidiBackend.__init__(M);
+            M.deviceName = deviceName;
+            M.source = source;
+            M.realtime = realtime;
+            M.feeding = source is not None;
+            M.feeder = None;
+        # end
+
+        def listDevices(M):
+            return [{'interface':"virtual", 'name':name, 'is_input':1, 'is_output':0,
+                     'opened':0, 'device_id':device_ID, 'handle':None}
+                    for device_ID,name in enumerate(M.deviceName.split(";"))];
+        # end
+
+        def portBackend(M,device):
+            return VirtualMidiBackend(M.deviceName,M.source,M.realtime);
+        # end
+
+        def open(M,device):
+            if isinstance(M.source,str) and ";" in M.source:# % The text file of this input
+                sources = M.source.split(";");
+                M.source = (sources[device['device_id']] or None) if device['device_id'] < len(sources) else None;
+                M.feeding = M.source is not None;
+            # end
+            M.t0 = time.perf_counter();
+            if M.source is not None:
+                M.feeder = threading.Thread(target=M.feed, name="virtual-midi", daemon=True);
+                M.feeder.start();
+            # end
+        # end
+
+        def send(M,data):
+            # % In-process source: queue one [status, data1, data2, data3] message
+            M.push(list(data));
+        # end
+
+        def feed(M):
+            # % Feed the packets of the source, at their timestamps when realtime
+            packets = loadMidiTextFile(M.source) if isinstance(M.source,str) else M.source;
+            first = None;
+            for data, timestamp in packets:
+                if M.realtime:
+                    if first is None:
+                        first = timestamp;
+                    # end
+                    delay = (timestamp-first)/1000.-(time.perf_counter()-M.t0);
+                    if delay > 0:
+                        time.sleep(delay);
+                    # end
+                # end
+                M.push(list(data));
+            # end
+            M.feeding = False;
+            if M.notify is not None:
+                M.notify();
+            # end
+        # end
+
+        def finished(M):
+            return M.source is not None and not(M.feeding) and not(M.buffer);
+        # end
+# end
+
+
+# ==============================================================
+class ReplayMidiBackend(PushMidiBackend):
+        name = "replay";
+
+        def __init__(M,filePath,realtime=True,source=None):
+            # % source - replay only the packets of this input (index of the recorded inputs)
+            PushMidiBackend.__init__(M);
+            M.filePath = filePath;
+            M.realtime = realtime;
+            M.source = source;
+            M.feeding = True;
+            M.feeder = None;
+            recording = MidiRecording(filePath);
+            M.sourceNames = recording.sourceNames;
+            M.count = recording.count;
+            recording.close();
+        # end
+
+        def listDevices(M):
+            return [{'interface':"replay", 'name':name, 'is_input':1, 'is_output':0,
+                     'opened':0, 'device_id':device_ID, 'handle':None}
+                    for device_ID,name in enumerate(M.sourceNames)];
+        # end
+
+        def portBackend(M,device):
+            # % Several recorded inputs: one backend per input for the fan-in
+            return ReplayMidiBackend(M.filePath,M.realtime,device['device_id']);
+        # end
+
+        def open(M,device):
+            M.t0 = time.perf_counter();
+            M.feeder = threading.Thread(target=M.feed, name="replay-midi", daemon=True);
+            M.feeder.start();
+        # end
+
+        def feed(M):
+            # % Push the recorded packets, at their recorded read times when realtime.
+            # % The timestamps keep their recorded distance from the first packet.
+            recording = MidiRecording(M.filePath);
+            first = None;
+            try:
+                for readTime, timestamp, status, data1, data2, data3 in recording.records():
+                    if M.source is not None and not(data3 == M.source):
+                        continue;
+                    # end
+                    if first is None:
+                        first = (readTime,timestamp);
+                    # end
+                    if M.realtime:
+                        delay = (readTime-first[0])/1000000.-(time.perf_counter()-M.t0);
+                        if delay > 0:
+                            time.sleep(delay);
+                        # end
+                        M.push([status,data1,data2,data3],timestamp-first[1]);
+                    else:
+                        M.push([status,data1,data2,data3]);
+                    # end
+                # end
+            finally:
+                recording.close();
+                M.feeding = False;
+                if M.notify is not None:
+                    M.notify();
+                # end
+            # end
+        # end
+
+        def finished(M):
+            return not(M.feeding) and not(M.buffer);
+        # end
+# end
+
+
+# ==============================================================
+# Fan-in of several MIDI inputs
+class MultiMidiBackend(PushMidiBackend):
+        name = "multi";
+
+        def __init__(M,ports,pollSec=0.001):
+            # % ports - list of (backend, device), one opened backend per input
+            PushMidiBackend.__init__(M);
+            M.ports = ports;
+            M.pollSec = pollSec;
+            M.readers = [];
+            M.running = False;
+            M.active = 0;
+            M.lock = threading.Lock();
+        # end
+
+        def listDevices(M):
+            return [device for backend,device in M.ports];
+        # end
+
+        def open(M,device=None):
+            M.t0 = time.perf_counter();
+            M.running = True;
+            M.active = len(M.ports);
+            for source,(backend,portDevice) in enumerate(M.ports):
+                backend.open(portDevice);
+                reader = threading.Thread(target=M.readPort, args=(source,backend),
+                                          name="midi-reader-"+str(source), daemon=True);
+                M.readers.append(reader);
+                reader.start();
+            # end
+        # end
+
+        def readPort(M,source,backend):
+            # % Reader thread of one input: the running status is expanded, the
+            # % source index goes in the spare 4th byte and the timestamps are
+            # % moved to the clock of the fan-in. A quiet input only blocks its own thread.
+            wake = threading.Event();
+            if backend.supportsCallback:
+                backend.setNotify(wake.set);
+            # end
+            runningStatus = 0;
+            while M.running:
+                if not(backend.poll()):
+                    if backend.finished():
+                        break;
+                    elif backend.supportsCallback:
+                        wake.wait(0.1);
+                        wake.clear();
+                    else:
+                        time.sleep(M.pollSec);
+                    # end
+                    continue;
+                # end
+                packets = backend.read(64);
+                offset = M.time()-backend.time();
+                batch = [];
+                for data, timestamp in packets:
+                    status = data[0];
+                    if status >= 0x80:
+                        if status < 0xF0:
+                            runningStatus = status;
+                        elif status < 0xF8:# % System common cancels the running status
+                            runningStatus = 0;
+                        # end
+                        batch.append([[status,data[1],data[2],source],timestamp+offset]);
+                    elif runningStatus:
+                        batch.append([[runningStatus,data[0],data[1],source],timestamp+offset]);
+                    # end
+                # end
+                M.buffer.extend(batch);
+                notify = M.notify;
+                if notify is not None:
+                    notify();
+                # end
+            # end
+            with M.lock:
+                M.active -= 1;
+            # end
+            if M.notify is not None:
+                M.notify();
+            # end
+        # end
+
+        def read(M,count):
+            # % Merge the inputs in time order. The order is per read: a packet of
+            # % a slower input that arrives after the read of a newer packet of
+            # % another input is delivered in the next read, out of order. Holding
+            # % the packets back until every input has caught up would delay every
+            # % cue while one input is quiet, so the bridge does not wait for it.
+            packets = PushMidiBackend.read(M,count);
+            if len(packets) > 1:
+                packets.sort(key=itemgetter(1));
+            # end
+            return packets;
+        # end
+
+        def finished(M):
+            return M.active <= 0 and not(M.buffer);
+        # end
+
+        def close(M):
+            M.running = False;
+            for reader in M.readers:
+                reader.join(1.0);
+            # end
+            for backend,device in M.ports:
+                backend.close();
+            # end
+        # end
+# end
+
+
+def loadMidiTextFile(filePath):
+    # % Text MIDI source, one message per line: "time_ms status data1 data2"
+    # % (comma or space separated, decimal or 0x hex, "#" comments)
+    packets = [];
+    with open(filePath) as lines:
+        for line in lines:
+            line = line.split("#",1)[0].replace(","," ").split();
+            if not(line):
+                continue;
+            # end
+            values = [int(v,0) for v in line];
+            values = values+[0]*(4-len(values));
+            packets.append([[values[1],values[2],values[3],0],values[0]]);
+        # end
+    # end
+    return packets;
+# end
+
+def createMidiBackend(name,deviceName="",virtualSource=""):
+    # % Factory of the MIDI input backends
+    name = name.strip().lower();
+    if name == "pygame":
+        return PygameMidiBackend();
+    elif name == "callback":
+        return CallbackMidiBackend();
+    elif name == "virtual":
+        return VirtualMidiBackend(deviceName or "Virtual MIDI",virtualSource or None);
+    elif name == "replay":
+        return ReplayMidiBackend(virtualSource);
+    # end
+    raise Exception("Unknown MIDI backend ["+name+"], use pygame, callback, virtual or replay");
+# end
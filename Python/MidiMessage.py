@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# %
+# % Description: Decoding of the raw MIDI packets returned by the MIDI input
+# % ("Input.read" gives [[status, data1, data2, data3], timestamp]) into compact
+# % MIDI messages. All the channel-voice messages and running status are
+# % supported. The channel is 1-based (1..16) as in the preset CSV.
+# % With several MIDI inputs the spare 4th byte of the packet carries the index
+# % of the source input (the fan-in normalises the running status per input).
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+# % Channel-voice message types by status nibble
+MIDI_MESSAGE_TYPES = {
+    0x80:"NoteOff",
+    0x90:"NoteOn",
+    0xA0:"PolyAftertouch",
+    0xB0:"ControlChange",
+    0xC0:"ProgramChange",
+    0xD0:"ChannelAftertouch",
+    0xE0:"PitchBend",
+};
+
+
+# ==============================================================
+# The decoded MIDI message
+class MidiMessage:
+        # % Note_CC  - note, controller or program number
+        # % Velocity - velocity, controller value, pressure or 14 bit pitch bend
+        # % Source   - index of the MIDI input the message came from
+        __slots__ = ("Channel","Type","Note_CC","Velocity","Time","Status","Source");
+
+        def __init__(m,Status,Channel,Type,Note_CC,Velocity,Time,Source=0):
+            m.Status   = Status;
+            m.Channel  = Channel;
+            m.Type     = Type;
+            m.Note_CC  = Note_CC;
+            m.Velocity = Velocity;
+            m.Time     = Time;
+            m.Source   = Source;
+        # end
+
+        def asDict(m):
+            return {key:getattr(m,key) for key in m.__slots__};
+        # end
+
+        def __repr__(m):
+            return "MidiMessage("+repr(m.asDict())+")";
+        # end
+# end
+
+
+# ==============================================================
+# Stateful decoder (the running status is kept between the reads)
+class MidiDecoder:
+        __slots__ = ("runningStatus",);
+
+        def __init__(D):
+            D.runningStatus = 0;
+        # end
+
+        def decode(D,midi_event):
+            # % Decode a single packet, returns None for non channel-voice messages
+            messages = D.decodeBatch((midi_event,));
+            return messages[0] if messages else None;
+        # end
+
+        def decodeBatch(D,midi_events,acceptFilter=None):
+            # % Decode the whole list returned by "Input.read" in one pass.
+            # % When acceptFilter (a set of (channel, type)) is given, the
+            # % messages that can't match a trigger are dropped before a
+            # % message object is created for them.
+            messages = [];
+            append = messages.append;
+            types = MIDI_MESSAGE_TYPES;
+            runningStatus = D.runningStatus;
+            for data, timestamp in midi_events:
+                status = data[0];
+                if status >= 0xF8:# % System real-time, leaves the running status untouched
+                    continue;
+                elif status >= 0xF0:# % System common cancels the running status
+                    runningStatus = 0;
+                    continue;
+                elif status >= 0x80:
+                    runningStatus = status;
+                    data1 = data[1];
+                    data2 = data[2];
+                    source = data[3];
+                elif runningStatus:# % Running status, the packet starts with data
+                    status = runningStatus;
+                    data1 = data[0];
+                    data2 = data[1];
+                    source = 0;
+                else:# % Data without a status, ignore
+                    continue;
+                # end
+
+                msgType = types[status & 0xF0];
+                channel = (status & 0x0F)+1;
+                if msgType == "NoteOn":
+                    # If the trigger has 0 velocity it is effectively "NoteOff" type
+                    if data2 == 0:
+                        msgType = "NoteOff";
+                    # end
+                elif msgType == "PitchBend":
+                    data1, data2 = 0, (data2 << 7) | data1;
+                elif msgType == "ChannelAftertouch":
+                    data1, data2 = 0, data1;
+                elif msgType == "ProgramChange":
+                    data2 = 0;
+                # end
+
+                if acceptFilter is not None and (channel,msgType) not in acceptFilter:
+                    continue;
+                # end
+                append(MidiMessage(status,channel,msgType,data1,data2,timestamp,source));
+            # end
+            D.runningStatus = runningStatus;
+            return messages;
+        # end
+# end
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   MidiRecorder
+# % Description: Capture of the live MIDI input for a later replay (timing bugs,
+# % profiling against the real show traffic). The packets read by the control
+# % loop are appended to an in-memory array of fixed size binary records and
+# % written to the file by a writer thread, a chunk at a time.
+# % File format (little endian):
+# %   header  - "<8sHHdH": magic, version, record size, start time (epoch
+# %             seconds), length of the source names (UTF-8, one per line)
+# %   records - "<QIBBBB": read time [us since the start], packet timestamp
+# %             [ms of the MIDI clock], status, data1, data2, data3 (source)
+# % The recordings are replayed by the "replay" MIDI backend (memory mapped).
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import time;
+import mmap;
+import queue;
+import struct;
+import threading;
+
+MIDI_RECORD_MAGIC = b"DAW2MIDI";
+MIDI_RECORD_VERSION = 1;
+MIDI_RECORD_HEADER = struct.Struct("<8sHHdH");
+MIDI_RECORD = struct.Struct("<QIBBBB");
+
+
+# ==============================================================
+class MidiRecorder:
+
+    # properties
+        records=0;
+        chunkBytes=65536;# % Written to the file in chunks of this size
+    # end
+
+    # methods
+        def __init__(R,filePath,sourceNames=(),chunkBytes=65536):
+            R.filePath = filePath;
+            R.chunkBytes = chunkBytes;
+            R.records = 0;
+            R.pack = MIDI_RECORD.pack;
+            R.chunk = bytearray();
+            names = "\n".join(sourceNames).encode();
+            R.file = open(filePath,"wb");
+            R.file.write(MIDI_RECORD_HEADER.pack(MIDI_RECORD_MAGIC,MIDI_RECORD_VERSION,MIDI_RECORD.size,time.time(),len(names))+names);
+            R.t0 = time.perf_counter();
+            R.queue = queue.Queue();
+            R.thread = threading.Thread(target=R.run, name="midi-recorder", daemon=True);
+        # end
+
+        def start(R):
+            R.thread.start();
+            return R;
+        # end
+
+        def write(R,packets,tRead):
+            # % Called from the control loop with the packets of one read
+            readTime = int((tRead-R.t0)*1000000.);
+            pack = R.pack;
+            chunk = R.chunk;
+            for data, timestamp in packets:
+                chunk += pack(readTime,int(timestamp) & 0xFFFFFFFF,data[0] & 0xFF,data[1] & 0xFF,data[2] & 0xFF,data[3] & 0xFF);
+            # end
+            R.records += len(packets);
+            if len(chunk) >= R.chunkBytes:
+                R.queue.put(chunk);
+                R.chunk = bytearray();
+            # end
+        # end
+
+        def run(R):
+            # % Writer thread
+            while True:
+                chunk = R.queue.get();
+                if chunk is None:# % Stop sentinel
+                    break;
+                # end
+                R.file.write(chunk);
+            # end
+            R.file.close();
+        # end
+
+        def close(R):
+            R.queue.put(R.chunk);
+            R.chunk = bytearray();
+            R.queue.put(None);
+            R.thread.join();
+        # end
+    # end
+# end
+
+
+# ==============================================================
+# Memory mapped reading of a recording
+class MidiRecording:
+
+        def __init__(P,filePath):
+            P.filePath = filePath;
+            with open(filePath,"rb") as file:
+                P.map = mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ);
+            # end
+            try:
+                magic, version, recordSize, P.startTime, namesLength = MIDI_RECORD_HEADER.unpack_from(P.map,0);
+            except struct.error:
+                magic, recordSize = b"", 0;
+            # end
+            if not(magic == MIDI_RECORD_MAGIC) or not(recordSize == MIDI_RECORD.size):
+                P.map.close();
+                raise Exception("["+filePath+"] is not a MIDI recording (version "+str(MIDI_RECORD_VERSION)+")");
+            # end
+            P.offset = MIDI_RECORD_HEADER.size+namesLength;
+            P.sourceNames = bytes(P.map[MIDI_RECORD_HEADER.size:P.offset]).decode().split("\n");
+            # % A partial last record (recording interrupted) is ignored
+            P.count = (len(P.map)-P.offset)//MIDI_RECORD.size;
+        # end
+
+        def records(P):
+            # % (read time [us], timestamp [ms], status, data1, data2, data3) without copying the file
+            view = memoryview(P.map)[P.offset:P.offset+P.count*MIDI_RECORD.size];
+            records = MIDI_RECORD.iter_unpack(view);
+            try:
+                yield from records;
+            finally:
+                del records;# % Releases the buffer, the map can then be closed
+                view.release();
+            # end
+        # end
+
+        def close(P):
+            P.map.close();
+        # end
+# end
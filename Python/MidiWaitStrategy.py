@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# %
+# % Description: Wait strategies for the MIDI control loop. They decide how long
+# % the loop waits between two polls of the MIDI input.
+# %   "fixed"    - the original limiter, one poll per DAW audio buffer cycle.
+# %   "adaptive" - polls at the DAW cycle rate while MIDI traffic arrives and
+# %                backs off up to MIDI_IdleMaxDelayMs while idle.
+# %   "blocking" - sleeps until the MIDI input signals new messages (backends
+# %                with a callback), MIDI_IdleMaxDelayMs is only a safety timeout.
+# % The strategy is selected with "MIDI_WaitStrategy" in the configuration file.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import time;
+import threading;
+
+
+# ==============================================================
+class FixedRateWait:
+        name = "fixed";
+        needsNotify = False;
+
+        def __init__(W,cycleDelay):
+            W.cycleDelay = cycleDelay;
+        # end
+
+        def wait(W,cycleStart,hadTraffic):
+            # % Time delay to maintain the refresh rate
+            currentDelay = (W.cycleDelay - (time.perf_counter()-cycleStart))*0.925;
+            if currentDelay > 0:
+                time.sleep(currentDelay);
+            # end
+        # end
+
+        def arm(W):
+            pass;
+        # end
+
+        def notify(W):
+            pass;
+        # end
+# end
+
+
+# ==============================================================
+class AdaptiveWait:
+        name = "adaptive";
+        needsNotify = False;
+        # % Growth of the delay per idle cycle
+        backoffFactor = 1.5;
+
+        def __init__(W,cycleDelay,maxDelay):
+            W.minDelay = cycleDelay;
+            W.maxDelay = max(cycleDelay,maxDelay);
+            W.delay = W.minDelay;
+        # end
+
+        def wait(W,cycleStart,hadTraffic):
+            if hadTraffic:
+                # % Tighten, poll again straight away to drain a burst
+                W.delay = W.minDelay;
+                return;
+            # end
+            currentDelay = W.delay - (time.perf_counter()-cycleStart);
+            if currentDelay > 0:
+                time.sleep(currentDelay);
+            # end
+            # % Back off while idle
+            W.delay = min(W.delay*W.backoffFactor,W.maxDelay);
+        # end
+
+        def arm(W):
+            pass;
+        # end
+
+        def notify(W):
+            W.delay = W.minDelay;
+        # end
+# end
+
+
+# ==============================================================
+class BlockingWait:
+        name = "blocking";
+        needsNotify = True;
+
+        def __init__(W,maxDelay):
+            W.maxDelay = maxDelay;
+            W.event = threading.Event();
+        # end
+
+        def arm(W):
+            # % Called before the poll: a notify from now on wakes the next wait
+            # % (cleared after the wait, a notify in between would be lost)
+            W.event.clear();
+        # end
+
+        def wait(W,cycleStart,hadTraffic):
+            if hadTraffic:
+                return;
+            # end
+            W.event.wait(W.maxDelay);
+        # end
+
+        def notify(W):
+            # % Called by the MIDI input (any thread) when messages arrive
+            W.event.set();
+        # end
+# end
+
+
+def createWaitStrategy(name,cycleDelay,maxDelay,supportsNotify=False,log=print):
+    # % Factory of the wait strategies, falls back when the strategy is not
+    # % supported by the MIDI input
+    name = name.strip().lower();
+    if name == "blocking" and not(supportsNotify):
+        log("[warning]:The MIDI input does not support the [blocking] wait, using [adaptive]");
+        name = "adaptive";
+    # end
+    if name == "fixed":
+        return FixedRateWait(cycleDelay);
+    elif name == "blocking":
+        return BlockingWait(maxDelay);
+    elif name == "adaptive":
+        return AdaptiveWait(cycleDelay,maxDelay);
+    # end
+    log("[warning]:Unknown MIDI wait strategy ["+name+"], using [fixed]");
+    return FixedRateWait(cycleDelay);
+# end
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   PresenterStubServer
+# % Description: Local stand-in for the Quelea/OpenLP remote control servers.
+# % It answers the control endpoints of the presets with a configurable
+# % response delay and error rate and counts the hits per endpoint.
+# % With a password it asks for the login like Quelea (login page, 307 on the
+# % control endpoints, session cookie after the password form). The canned
+# % answers carry an ETag and are revalidated ("304 Not Modified"). A WebSocket
+# % upgrade on any path opens the stand-in of the streaming transport: every
+# % text frame is a command (counted like the path of a GET) and is answered
+# % with an "OK" frame after the response delay. Used by
+# % the offline benchmark, it can also be run on its own:
+# %     python PresenterStubServer.py --flavour Quelea --port 1112 --delay-ms 5
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import threading;
+import random;
+import time;
+import hashlib;
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler;
+
+from ServerTransport import websocketAccept,encodeFrame,readFrame,WEBSOCKET_TEXT,WEBSOCKET_CLOSE,WEBSOCKET_PING,WEBSOCKET_PONG;
+
+# % Canned answers of the read type endpoints
+STUB_RESPONSES = {
+    "Quelea": {
+        "/":         b"<html><body>Quelea mobile remote (stub)</body></html>",
+        "/status":   b"Lyrics\nItem 1",
+        "/lyrics":   b"<p>Amazing grace how sweet the sound</p>",
+        "/chords":   b"<p>G C G D</p>",
+        "/schedule": b"<p>Item 1</p><p>Item 2</p>",
+        "login":     b"<html><body><form action=\"/\" method=\"post\"><input name=\"password\"></form></body></html>",
+    },
+    "OpenLP": {
+        "/":               b"<html><body>OpenLP remote (stub)</body></html>",
+        "/api/poll":       b'{"results": {"service": 1, "slide": 0, "item": "1", "blank": false}}',
+        "/api/controller/live/text": b'{"results": {"slides": []}}',
+    },
+};
+
+
+# ==============================================================
+class PresenterStubHandler(BaseHTTPRequestHandler):
+        # % HTTP/1.1 so that the keep-alive connections of the bridge are kept
+        protocol_version = "HTTP/1.1";
+        # % Headers and body are written separately, avoid the Nagle/delayed ACK stall
+        disable_nagle_algorithm = True;
+
+        def do_GET(h):
+            stub = h.server.stub;
+            path = h.path.split("?",1)[0];
+            if h.headers.get("Upgrade","").lower() == "websocket":
+                h.websocket();
+                return;
+            # end
+            stub.count(path);
+            if not(stub.loggedIn(h)):
+                if path == "/":
+                    h.reply(200,STUB_RESPONSES["Quelea"]["login"]);
+                else:
+                    h.reply(307,b"",{"Location":"/"});
+                # end
+                return;
+            # end
+            if stub.delay > 0:
+                time.sleep(stub.delay);
+            # end
+            if stub.errorRate > 0 and stub.random.random() < stub.errorRate:
+                stub.errors += 1;
+                h.reply(500,b"stub error");
+                return;
+            # end
+            body = STUB_RESPONSES.get(stub.flavour,{}).get(path);
+            if body is None:
+                h.reply(200,b"OK");
+                return;
+            # end
+            etag = "\""+hashlib.sha1(body).hexdigest()[:16]+"\"";
+            if h.headers.get("If-None-Match") == etag:
+                stub.notModified += 1;
+                h.reply(304,b"",{"ETag":etag});
+            else:
+                h.reply(200,body,{"ETag":etag});
+            # end
+        # end
+
+        def do_POST(h):
+            # % Login form of Quelea
+            stub = h.server.stub;
+            length = int(h.headers.get("Content-Length",0));
+            form = h.rfile.read(length).decode();
+            stub.count(h.path);
+            if stub.password and form == "password="+stub.password:
+                stub.sessions += 1;
+                h.reply(200,b"OK",{"Set-Cookie":"session=%i; Path=/" % stub.sessions});
+                return;
+            # end
+            h.reply(200,STUB_RESPONSES["Quelea"]["login"] if stub.password else b"OK");
+        # end
+
+        def websocket(h):
+            # % Handshake, then one command per text frame until the close frame
+            stub = h.server.stub;
+            h.close_connection = True;
+            if not(stub.loggedIn(h)):
+                h.reply(403,b"login required");
+                return;
+            # end
+            with stub.lock:# % Counted before the client sees the handshake
+                stub.websockets += 1;
+            # end
+            h.send_response(101);
+            h.send_header("Upgrade","websocket");
+            h.send_header("Connection","Upgrade");
+            h.send_header("Sec-WebSocket-Accept",websocketAccept(h.headers.get("Sec-WebSocket-Key","")));
+            h.end_headers();
+            h.wfile.flush();
+            def recvExact(n):
+                data = h.rfile.read(n);
+                if len(data) < n:
+                    raise ConnectionError("closed by the client");
+                # end
+                return data;
+            # end
+            try:
+                while True:
+                    opcode, payload = readFrame(recvExact);
+                    if opcode == WEBSOCKET_CLOSE:
+                        h.wfile.write(encodeFrame(WEBSOCKET_CLOSE,payload[:2],mask=False));
+                        break;
+                    elif opcode == WEBSOCKET_PING:
+                        h.wfile.write(encodeFrame(WEBSOCKET_PONG,payload,mask=False));
+                    elif opcode == WEBSOCKET_TEXT:
+                        stub.count(payload.decode("utf-8","replace"));
+                        if stub.delay > 0:
+                            time.sleep(stub.delay);
+                        # end
+                        h.wfile.write(encodeFrame(WEBSOCKET_TEXT,b"OK",mask=False));
+                    # end
+                    h.wfile.flush();
+                # end
+            except OSError:
+                pass;
+            # end
+        # end
+
+        def reply(h,code,body,headers={}):
+            h.send_response(code);
+            for name,value in headers.items():
+                h.send_header(name,value);
+            # end
+            h.send_header("Content-Type","text/html");
+            h.send_header("Content-Length",str(len(body)));
+            h.end_headers();
+            h.wfile.write(body);
+        # end
+
+        def log_message(h,format,*args):
+            pass;# % Keep the benchmark output clean
+        # end
+# end
+
+
+# ==============================================================
+class PresenterStubServer:
+
+    # properties
+        flavour="Quelea";
+        delay=0.;
+        errorRate=0.;
+        errors=0;
+        notModified=0;# % Revalidations answered with 304
+        websockets=0;# % WebSocket connections opened
+        password="";# % Login required when set
+        sessions=0;# % Issued login cookies, only the last one is valid (expire())
+    # end
+
+    # methods
+        def __init__(S,flavour="Quelea",delayMs=0.,errorRate=0.,host="127.0.0.1",port=0,seed=0,password=""):
+            S.flavour = flavour;
+            S.password = password;
+            S.sessions = 0;
+            S.delay = delayMs/1000.;
+            S.errorRate = errorRate;
+            S.errors = 0;
+            S.notModified = 0;
+            S.websockets = 0;
+            S.hits = {};
+            S.lock = threading.Lock();
+            S.random = random.Random(seed);
+            S.httpd = ThreadingHTTPServer((host,port),PresenterStubHandler);
+            S.httpd.daemon_threads = True;
+            S.httpd.stub = S;
+            S.thread = threading.Thread(target=S.httpd.serve_forever, name="presenter-stub", daemon=True);
+        # end
+
+        def count(S,path):
+            with S.lock:
+                S.hits[path] = S.hits.get(path,0)+1;
+            # end
+        # end
+
+        def loggedIn(S,h):
+            return not(S.password) or ("session=%i" % S.sessions) in h.headers.get("Cookie","");
+        # end
+
+        def expire(S):
+            # % Expire the login (like a restart of the server)
+            S.sessions += 1;
+        # end
+
+        def totalHits(S):
+            with S.lock:
+                return sum(S.hits.values());
+            # end
+        # end
+
+        def address(S):
+            return S.httpd.server_address;
+        # end
+
+        def start(S):
+            S.thread.start();
+            return S;
+        # end
+
+        def stop(S):
+            S.httpd.shutdown();
+            S.httpd.server_close();
+        # end
+    # end
+# end
+
+
+if __name__ == "__main__":
+    import argparse;
+    parser = argparse.ArgumentParser(description="Local stand-in for the Quelea/OpenLP remote control server");
+    parser.add_argument("--flavour",default="Quelea",choices=sorted(STUB_RESPONSES));
+    parser.add_argument("--port",type=int,default=1112);
+    parser.add_argument("--delay-ms",type=float,default=0.);
+    parser.add_argument("--error-rate",type=float,default=0.);
+    parser.add_argument("--password",default="",help="require the login (Quelea password form)");
+    args = parser.parse_args();
+    stub = PresenterStubServer(args.flavour,args.delay_ms,args.error_rate,port=args.port,password=args.password).start();
+    print("Presenter stub ["+args.flavour+"] at http://%s:%i" % stub.address());
+    try:
+        while True:
+            time.sleep(1);
+        # end
+    except KeyboardInterrupt:
+        stub.stop();
+    # end
+# end
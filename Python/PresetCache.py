@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   PresetCache
+# % Description: Compiled cache of the configuration file (the sections and
+# % their settings) and of the trigger presets (the rows of the CSV), stored
+# % next to the configuration file in a compact binary (pickle) file. Every
+# % entry is keyed on the content hash of its source file: a warm start loads
+# % the entries directly (without ConfigParser and pandas), a changed or
+# % missing entry is rebuilt from the source file and stored again.
+# % The HTTP requests of the triggers are not cached, they depend on the
+# % (autodiscovered) server address and are prepared at each start.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import pickle;
+import hashlib;
+import threading;
+
+from BridgeLogger import LOG_WARNING;
+
+# % Bumped when the cached data changes shape
+PRESET_CACHE_VERSION = 1;
+PRESET_CACHE_EXTENSION = ".presetcache";
+
+
+def fileDigest(filePath):
+    with open(filePath,"rb") as file:
+        return hashlib.sha256(file.read()).hexdigest();
+    # end
+# end
+
+def cachePath(configurationPath):
+    # % "settings.ini" -> "settings.presetcache"
+    return os.path.splitext(configurationPath)[0]+PRESET_CACHE_EXTENSION;
+# end
+
+
+# ==============================================================
+# The settings of the configuration file by section, in place of the ConfigParser
+class CachedConfiguration(dict):
+
+        def sections(C):
+            return list(C);
+        # end
+# end
+
+
+# ==============================================================
+class PresetCache:
+
+    # properties
+        hits=0;
+        misses=0;
+    # end
+
+    # methods
+        def __init__(C,filePath,log):
+            C.filePath = filePath;
+            C.log = log;
+            C.hits = 0;
+            C.misses = 0;
+            C.lock = threading.Lock();
+            C.entries = {};
+            try:
+                with open(filePath,"rb") as file:
+                    data = pickle.load(file);
+                # end
+                if data.get("version") == PRESET_CACHE_VERSION and data.get("python") == sys.version_info[:2]:
+                    C.entries = data["entries"];
+                # end
+            except FileNotFoundError:
+                pass;
+            except Exception as err:# % Corrupt or foreign file, rebuilt
+                C.log("[warning]:Preset cache ["+filePath+"] not loaded: "+str(err),level=LOG_WARNING);
+            # end
+        # end
+
+        def load(C,kind,sourcePath,build):
+            # % The cached data of the source file, or build(sourcePath) when the
+            # % source has changed since it was cached (the result is stored)
+            key = (kind,os.path.abspath(sourcePath));
+            digest = fileDigest(sourcePath);
+            with C.lock:
+                entry = C.entries.get(key);
+            # end
+            if entry is not None and entry[0] == digest:
+                C.hits += 1;
+                C.log("Preset cache hit for ["+sourcePath+"]");
+                return entry[1];
+            # end
+            C.misses += 1;
+            data = build(sourcePath);
+            with C.lock:
+                C.entries[key] = (digest,data);
+                C.save();
+            # end
+            return data;
+        # end
+
+        def save(C):
+            # % Written to a temporary file first, a reader never sees a partial cache
+            temporaryPath = C.filePath+".tmp";
+            try:
+                with open(temporaryPath,"wb") as file:
+                    pickle.dump({"version":PRESET_CACHE_VERSION, "python":sys.version_info[:2], "entries":C.entries},
+                                file,protocol=pickle.HIGHEST_PROTOCOL);
+                # end
+                os.replace(temporaryPath,C.filePath);
+            except Exception as err:
+                C.log("[warning]:Preset cache ["+C.filePath+"] not saved: "+str(err),level=LOG_WARNING);
+            # end
+        # end
+
+        def stats(C):
+            return {"hits":C.hits, "misses":C.misses};
+        # end
+    # end
+# end
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   PresetWatcher
+# % Description: Hot reload of the trigger preset (CSV) and of the
+# % configuration file (ini) without restarting the bridge. A background
+# % thread polls the modification times of the files. A changed file is parsed
+# % and validated in that thread, the control loop then swaps in the new
+# % compiled trigger map between two MIDI reads. An invalid file is reported
+# % and the current settings/triggers are kept.
+# % The settings of the MIDI input, the dispatch queues and the HTTP pool are
+# % only reported when changed, they apply after a restart.
+# % Every server target is watched: its preset, macro and timeline files and its section of the
+# % configuration file ("top" for the main server, "[target NAME]" otherwise).
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os;
+import time;
+import threading;
+
+from ExtraFunctions import importConfigurationSettings;
+from BridgeLogger import LOG_WARNING;
+
+# % Settings applied while running
+RELOAD_LIVE_PROPERTIES = {
+    "midi_HttpProtocolPreset", "midi_MacroPreset", "Schedule_Timeline", "Coalesce_DefaultRateHz", "Dispatch_PriorityGroups",
+    "Server_autodiscover", "Server_Protocol", "Server_IP", "Server_ControlPort", "Server_password", "Server_ReauthSec",
+    "Log_Level", "Log_File", "Log_FileMaxKB", "Log_FileBackups", "Log_Format",
+    "HTTP_ConnectTimeoutSec", "HTTP_ReadTimeoutSec",
+    "Schedule_LeadMaxMs", "Schedule_LateMs", "Schedule_DefaultLatencyMs",
+};
+# % Settings used when the trigger requests are compiled
+RELOAD_TRIGGER_PROPERTIES = {"midi_HttpProtocolPreset", "midi_MacroPreset", "Schedule_Timeline", "Coalesce_DefaultRateHz", "Dispatch_PriorityGroups", "Server_Protocol", "Server_IP", "Server_ControlPort"};
+
+
+def fileStamp(filePath):
+    try:
+        stat = os.stat(filePath);
+        return (stat.st_mtime_ns,stat.st_size);
+    except OSError:
+        return None;
+    # end
+# end
+
+
+# ==============================================================
+class PresetWatcher:
+
+    # properties
+        pollSec=1.0;
+        reloads=0;
+        errors=0;
+    # end
+
+    # methods
+        def __init__(W,B,pollSec=1.0):
+            W.B = B;
+            W.pollSec = pollSec;
+            W.reloads = 0;
+            W.errors = 0;
+            W.stamps = {B.configuration_filepath:fileStamp(B.configuration_filepath)};
+            for T in B.targets:
+                W.stamps[T.midi_HttpProtocolPreset] = fileStamp(T.midi_HttpProtocolPreset);
+                W.stamps[T.midi_MacroPreset] = fileStamp(T.midi_MacroPreset);
+                W.stamps[T.Schedule_Timeline] = fileStamp(T.Schedule_Timeline);
+            # end
+            # % The values of the file per section (the bridge values can differ, e.g.
+            # % the autodiscovered server address), only the edited ones are applied
+            W.fileValues = {};
+            for T in B.targets:
+                try:
+                    W.fileValues[T.targetSection] = {key:value for key,value,errorMsg in W.parseConfiguration(T) if not(errorMsg)};
+                except Exception:
+                    W.fileValues[T.targetSection] = {};
+                # end
+            # end
+            W.stopped = threading.Event();
+            W.thread = threading.Thread(target=W.run, name="preset-watcher", daemon=True);
+        # end
+
+        def start(W):
+            W.thread.start();
+            return W;
+        # end
+
+        def stop(W):
+            W.stopped.set();
+            W.thread.join(1.0);
+        # end
+
+        def changed(W,filePath):
+            stamp = fileStamp(filePath);
+            if stamp is None or stamp == W.stamps.get(filePath):
+                return False;# % Missing (e.g. while an editor saves it) or unchanged
+            # end
+            W.stamps[filePath] = stamp;
+            return True;
+        # end
+
+        def run(W):
+            B = W.B;
+            while not(W.stopped.wait(W.pollSec)):
+                configurationChanged = W.changed(B.configuration_filepath);
+                for T in B.targets:
+                    # % A new preset file or server address reloads the triggers too
+                    reloadTriggers = configurationChanged and W.reloadConfiguration(T);
+                    filesChanged = [W.changed(T.midi_HttpProtocolPreset),W.changed(T.midi_MacroPreset),W.changed(T.Schedule_Timeline)];
+                    if any(filesChanged) or reloadTriggers:
+                        W.count(T.reloadTriggerMap());
+                    # end
+                # end
+            # end
+        # end
+
+        def count(W,reloaded):
+            if reloaded:
+                W.reloads += 1;
+            else:
+                W.errors += 1;
+            # end
+        # end
+
+        def parseConfiguration(W,T):
+            return T.parseFileProperties(importConfigurationSettings(W.B.configuration_filepath),T.targetSection);
+        # end
+
+        def reloadConfiguration(W,T):
+            # % Reload the section of a server target. Returns True when the
+            # % triggers have to be reloaded as well.
+            B = T;
+            tStart = time.perf_counter();
+            try:
+                properties = W.parseConfiguration(T);
+            except Exception as err:
+                B.log("[warning]:Configuration ["+B.configuration_filepath+"] not reloaded: "+str(err),level=LOG_WARNING);
+                W.count(False);
+                return False;
+            # end
+            errorMsgs = [errorMsg for key,value,errorMsg in properties if errorMsg];
+            if errorMsgs:
+                B.log("[warning]:Configuration ["+B.configuration_filepath+"] not reloaded: "+" ".join(errorMsgs),level=LOG_WARNING);
+                W.count(False);
+                return False;
+            # end
+
+            fileValues = W.fileValues.get(T.targetSection,{});
+            changes = {key:value for key,value,errorMsg in properties if not(fileValues.get(key) == value)};
+            W.fileValues[T.targetSection] = {key:value for key,value,errorMsg in properties};
+            for key in sorted(set(changes)-RELOAD_LIVE_PROPERTIES):
+                B.log("[warning]:Property ["+key+"] changed, it applies after a restart",level=LOG_WARNING);
+            # end
+            live = {key:value for key,value in changes.items() if key in RELOAD_LIVE_PROPERTIES};
+            for key,value in live.items():
+                if key == "midi_HttpProtocolPreset" or (key in ("midi_MacroPreset","Schedule_Timeline") and value):
+                    value = B.resolvePresetPath(value);
+                # end
+                setattr(B,key,value);
+            # end
+            if any(key.startswith("Log_") for key in live):
+                B.configureLogger();
+            # end
+            if any(key.startswith("HTTP_") for key in live):
+                B.httpTimeout = (B.HTTP_ConnectTimeoutSec,B.HTTP_ReadTimeoutSec);
+            # end
+            S = W.B.cueScheduler;
+            if S is not None and T is W.B and any(key.startswith("Schedule_") for key in live):
+                S.leadMaxSec, S.lateSec, S.defaultLatencySec = B.Schedule_LeadMaxMs/1000., B.Schedule_LateMs/1000., B.Schedule_DefaultLatencyMs/1000.;
+            # end
+            B.log("Reloaded configuration [%s] of [%s] in %.1f ms, changed: %s",B.configuration_filepath,T.targetName,
+                  (time.perf_counter()-tStart)*1000.,sorted(live) or "none");
+            W.count(True);
+            return bool(RELOAD_TRIGGER_PROPERTIES.intersection(live));
+        # end
+
+        def stats(W):
+            return {"reloads":W.reloads, "errors":W.errors};
+        # end
+    # end
+# end
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   ResponseCache
+# % Description: Bridge-side cache of the responses of the read triggers (the
+# % "HTML get()" rows of the preset: lyrics, chords, status, schedule ...).
+# % An entry is fresh for the TTL, a stale entry is revalidated with a
+# % conditional request (If-None-Match/If-Modified-Since, a "304 Not Modified"
+# % only refreshes it). The least recently used entries are evicted above the
+# % size limit. A command sent to a server target marks its entries stale (the
+# % presenter state has changed), they are revalidated on the next read.
+# % The cached content is used by the external commands ("{cache:/lyrics}")
+# % and served on the local endpoint (/cache of the metrics server).
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import time;
+import json;
+import threading;
+from collections import OrderedDict;
+from urllib.parse import urlsplit,parse_qs;
+
+# % HTTP status code of a conditional request when the content is unchanged
+net_http_StatusCode_NotModified = 304;
+
+
+# ==============================================================
+# A cached response
+class CachedResponse:
+        __slots__ = ("status","body","contentType","etag","lastModified","fetchedAt","stale");
+
+        def __init__(E,response):
+            E.status = response.status_code;
+            E.body = response.content;
+            E.contentType = response.headers.get("Content-Type","");
+            E.etag = response.headers.get("ETag","");
+            E.lastModified = response.headers.get("Last-Modified","");
+            E.fetchedAt = time.monotonic();
+            E.stale = False;
+        # end
+
+        def age(E):
+            return time.monotonic()-E.fetchedAt;
+        # end
+
+        def text(E):
+            return E.body.decode("utf-8","replace");
+        # end
+
+        def validators(E):
+            # % Headers of the conditional request revalidating the entry
+            headers = {};
+            if E.etag:
+                headers["If-None-Match"] = E.etag;
+            # end
+            if E.lastModified:
+                headers["If-Modified-Since"] = E.lastModified;
+            # end
+            return headers;
+        # end
+# end
+
+
+# ==============================================================
+class ResponseCache:
+
+    # properties
+        ttlSec=2.0;
+        maxEntries=64;
+        # % Counters
+        hits=0;
+        misses=0;
+        revalidated=0;
+        evicted=0;
+    # end
+
+    # methods
+        def __init__(C,maxEntries=64,ttlSec=2.0):
+            C.maxEntries = max(0,int(maxEntries));
+            C.ttlSec = ttlSec;
+            C.hits = 0;
+            C.misses = 0;
+            C.revalidated = 0;
+            C.evicted = 0;
+            C.lock = threading.Lock();
+            # % {(target, path): CachedResponse}, least recently used first
+            C.entries = OrderedDict();
+            # % One fetch at a time per key, the concurrent readers get its result
+            C.fetchLocks = {};
+        # end
+
+        def fresh(C,entry):
+            return entry is not None and not(entry.stale) and entry.age() < C.ttlSec;
+        # end
+
+        def lookup(C,key):
+            # % The entry of the key (fresh or not), or None
+            with C.lock:
+                entry = C.entries.get(key);
+                if entry is not None:
+                    C.entries.move_to_end(key);
+                # end
+                return entry;
+            # end
+        # end
+
+        def fetch(C,key,send):
+            # % The fresh entry of the key, otherwise send(headers) is called with
+            # % the validators of the stale entry and the response is cached.
+            # % Error responses are returned without being cached.
+            entry = C.lookup(key);
+            if C.fresh(entry):
+                C.count("hits");
+                return entry;
+            # end
+            with C.lock:
+                fetchLock = C.fetchLocks.setdefault(key,threading.Lock());
+            # end
+            with fetchLock:
+                stored = False;
+                try:
+                    entry = C.lookup(key);
+                    if C.fresh(entry):# % Fetched by another reader meanwhile
+                        C.count("hits");
+                        stored = True;
+                        return entry;
+                    # end
+                    response = send(entry.validators() if entry is not None else {});
+                    if response.status_code == net_http_StatusCode_NotModified and entry is not None:
+                        C.count("revalidated");
+                        entry.fetchedAt = time.monotonic();
+                        entry.stale = False;
+                        stored = True;
+                        return entry;
+                    # end
+                    C.count("misses");
+                    fetched = CachedResponse(response);
+                    stored = fetched.status == 200 and C.store(key,fetched);
+                    return fetched;
+                finally:
+                    if not(stored):# % Not cached (error response, send raised): no lock kept for the key
+                        with C.lock:
+                            if C.fetchLocks.get(key) is fetchLock and not(key in C.entries):
+                                del C.fetchLocks[key];
+                            # end
+                        # end
+                    # end
+                # end
+            # end
+        # end
+
+        def count(C,counter):
+            # % The lanes and the metrics thread fetch concurrently
+            with C.lock:
+                setattr(C,counter,getattr(C,counter)+1);
+            # end
+        # end
+
+        def store(C,key,entry):
+            # % False when the cache is disabled (no entries)
+            if C.maxEntries <= 0:
+                return False;
+            # end
+            with C.lock:
+                C.entries[key] = entry;
+                C.entries.move_to_end(key);
+                while len(C.entries) > C.maxEntries:
+                    oldest, evicted = C.entries.popitem(last=False);
+                    C.fetchLocks.pop(oldest,None);
+                    C.evicted += 1;
+                # end
+            # end
+            return True;
+        # end
+
+        def invalidate(C,target):
+            # % Mark the entries of a server target stale (kept for the revalidation)
+            with C.lock:
+                for (entryTarget,path),entry in C.entries.items():
+                    if entryTarget == target:
+                        entry.stale = True;
+                    # end
+                # end
+            # end
+        # end
+
+        def text(C,path):
+            # % The most recently fetched content of the path (any target), "" when not cached
+            with C.lock:
+                entries = [entry for (target,entryPath),entry in C.entries.items() if entryPath == path];
+            # end
+            return max(entries,key=lambda entry: entry.fetchedAt).text() if entries else "";
+        # end
+
+        def index(C):
+            # % The cached entries for the query endpoint
+            with C.lock:
+                return [{"target":target, "path":path, "status":entry.status, "ageSec":round(entry.age(),3),
+                         "fresh":C.fresh(entry), "etag":entry.etag, "bytes":len(entry.body)}
+                        for (target,path),entry in C.entries.items()];
+            # end
+        # end
+
+        def stats(C):
+            with C.lock:
+                return {"entries":len(C.entries), "hits":C.hits, "misses":C.misses,
+                        "revalidated":C.revalidated, "evicted":C.evicted};
+            # end
+        # end
+    # end
+# end
+
+
+def cacheQuery(B,requestPath):
+    # % The local query endpoint of the cache: (status, content type, body, headers)
+    # %   /cache                           - JSON index of the entries and of the read paths
+    # %   /cache?path=/lyrics[&target=NAME] - the content (fetched when stale, main target by default)
+    url = urlsplit(requestPath);
+    query = {key:values[0] for key,values in parse_qs(url.query).items()};
+    if B.responseCache is None or B.dispatcher is None:
+        return (503,"text/plain; charset=utf-8",b"The bridge is not running",{});
+    # end
+    if not("path" in query):
+        body = {"entries":B.responseCache.index(), "stats":B.responseCache.stats(),
+                "readPaths":{T.targetName:sorted(T.readTriggers) for T in B.targets}};
+        return (200,"application/json",json.dumps(body,indent=1).encode(),{});
+    # end
+    targets = {T.targetName:T for T in B.targets};
+    T = targets.get(query.get("target",B.targetName));
+    if T is None:
+        return (404,"text/plain; charset=utf-8",("Unknown target ["+query.get("target","")+"]").encode(),{});
+    # end
+    path = query["path"];
+    trigger = T.readTriggers.get(path);
+    if trigger is None:
+        entry = B.responseCache.lookup((T.targetName,path));# % Cached by a MIDI mapped read only
+    else:
+        try:
+            entry = B.dispatcher.fetch(T,trigger,path);
+        except Exception as err:
+            return (502,"text/plain; charset=utf-8",("Read of ["+path+"] failed: "+str(err)).encode(),{});
+        # end
+    # end
+    if entry is None:
+        return (404,"text/plain; charset=utf-8",("No read trigger or cached response for ["+path+"]").encode(),{});
+    # end
+    return (entry.status,entry.contentType or "application/octet-stream",entry.body,{"Age":str(int(entry.age()))});
+# end
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   HttpTransport, WebSocketTransport
+# % Description: Transports of the cue commands to a server target, used by
+# % the HTTP dispatcher. The transport is chosen per server in the
+# % configuration file (Server_Transport):
+# %   "http"      - every command is a GET request of the prepared trigger
+# %                 over the pooled keep-alive HTTP session.
+# %   "websocket" - every command is a single text frame on a persistent
+# %                 WebSocket (RFC 6455, standard library only), by default
+# %                 the path of the trigger ("/nextitem"); Server_WebSocketFormat
+# %                 wraps it ("{path}" is replaced, e.g. a JSON message).
+# % The WebSocket is opened on the first command and opened again after it was
+# % closed. The handshake carries the login cookie of the HTTP session: the
+# % socket is closed after every new login, and a handshake refused for the
+# % login is reported as a 307 so the dispatcher logs in again. A reader thread
+# % answers the pings and drops the frames pushed by the server. The read
+# % triggers, the login and the health checks stay on HTTP.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os;
+import ssl;
+import base64;
+import socket;
+import struct;
+import hashlib;
+import threading;
+from urllib.parse import urlsplit;
+
+from BridgeLogger import LOG_WARNING;
+
+# % Key suffix of the WebSocket handshake
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11";
+# % Frame opcodes
+WEBSOCKET_TEXT = 0x1;
+WEBSOCKET_BINARY = 0x2;
+WEBSOCKET_CLOSE = 0x8;
+WEBSOCKET_PING = 0x9;
+WEBSOCKET_PONG = 0xA;
+# % Longest handshake response read
+WEBSOCKET_HANDSHAKE_MAX = 65536;
+# % Handshake answers of a server asking for a login
+WEBSOCKET_LOGIN_REQUIRED = ("401","403","307");
+# % HTTP status code of a command sent without a valid login (the dispatcher logs in again)
+net_http_StatusCode_TemporaryRedirect = 307;
+
+
+def websocketAccept(key):
+    # % The Sec-WebSocket-Accept value of a Sec-WebSocket-Key
+    return base64.b64encode(hashlib.sha1((key+WEBSOCKET_GUID).encode()).digest()).decode();
+# end
+
+def encodeFrame(opcode,payload,mask=True):
+    # % A single final frame, masked as required from a client
+    length = len(payload);
+    header = bytes([0x80 | opcode]);
+    maskBit = 0x80 if mask else 0;
+    if length < 126:
+        header += bytes([maskBit | length]);
+    elif length < 65536:
+        header += bytes([maskBit | 126])+struct.pack("!H",length);
+    else:
+        header += bytes([maskBit | 127])+struct.pack("!Q",length);
+    # end
+    if not(mask):
+        return header+payload;
+    # end
+    key = os.urandom(4);
+    if length:
+        payload = (int.from_bytes(payload,"big") ^ int.from_bytes((key*(length//4+1))[:length],"big")).to_bytes(length,"big");
+    # end
+    return header+key+payload;
+# end
+
+def readFrame(recvExact):
+    # % (opcode, payload) of the next frame, recvExact(n) returns n bytes
+    first, second = recvExact(2);
+    length = second & 0x7F;
+    if length == 126:
+        length = struct.unpack("!H",recvExact(2))[0];
+    elif length == 127:
+        length = struct.unpack("!Q",recvExact(8))[0];
+    # end
+    key = recvExact(4) if second & 0x80 else None;
+    payload = recvExact(length) if length else b"";
+    if key is not None and length:
+        payload = (int.from_bytes(payload,"big") ^ int.from_bytes((key*(length//4+1))[:length],"big")).to_bytes(length,"big");
+    # end
+    return (first & 0x0F, payload);
+# end
+
+
+# ==============================================================
+# Result of a command sent as a frame. There is no answer of the server: a
+# written frame has the status 200 for the dispatcher but is counted as "sent"
+class FrameSent:
+        __slots__ = ("status_code","statusLabel");
+
+        def __init__(R,status_code=200):
+            R.status_code = status_code;
+            R.statusLabel = "sent" if status_code == 200 else str(status_code);
+        # end
+# end
+
+
+# ==============================================================
+# The server refused the WebSocket handshake because of the login
+class LoginRequired(ConnectionError):
+        pass;
+# end
+
+
+# ==============================================================
+class HttpTransport:
+        name = "http";
+        # % The response of a command is the answer of the server (latency, status)
+        measuresResponse = True;
+
+        def __init__(X,B):
+            X.B = B;
+        # end
+
+        def send(X,request,argument=""):
+            return X.B.sendHttpRequest(request,argument);
+        # end
+
+        def close(X):
+            pass;
+        # end
+
+        def stats(X):
+            return {"transport":X.name};
+        # end
+# end
+
+
+# ==============================================================
+class WebSocketTransport:
+        name = "websocket";
+        # % A command "response" is only the socket write: no server latency
+        # % (the timeline lead uses Schedule_DefaultLatencyMs) and no 5xx status
+        measuresResponse = False;
+
+    # properties
+        connects=0;
+        framesSent=0;
+        framesReceived=0;
+    # end
+
+    # methods
+        def __init__(X,B,port=0,path="/",messageFormat="{path}"):
+            X.B = B;
+            X.port = int(port);
+            X.path = path or "/";
+            X.messageFormat = messageFormat or "{path}";
+            X.connects = 0;
+            X.framesSent = 0;
+            X.framesReceived = 0;
+            X.sock = None;
+            X.reader = None;
+            X.closing = False;
+            X.lock = threading.Lock();# % One writer at a time (lanes, pongs)
+        # end
+
+        def url(X):
+            # % ws(s)://IP:port/path of the current server address (autodiscovery)
+            B = X.B;
+            scheme = "wss" if B.Server_Protocol == "https" else "ws";
+            return scheme+"://"+B.Server_IP+":"+str(X.port or B.Server_ControlPort)+X.path;
+        # end
+
+        def message(X,request,argument):
+            # % The frame of a command: the path (and query) of the trigger URL
+            url = urlsplit(request.url+argument);
+            path = url.path+("?"+url.query if url.query else "");
+            return X.messageFormat.replace("{path}",path).encode();
+        # end
+
+        def send(X,request,argument=""):
+            frame = encodeFrame(WEBSOCKET_TEXT,X.message(request,argument));
+            with X.lock:
+                if X.sock is None:
+                    try:
+                        X.connect();
+                    except LoginRequired:# % Like a 307 of the HTTP transport, not a success
+                        return FrameSent(net_http_StatusCode_TemporaryRedirect);
+                    # end
+                # end
+                try:
+                    if not(X.reader.is_alive()):# % Closed by the server, not sent
+                        raise ConnectionError("WebSocket of ["+X.url()+"] closed by the server");
+                    # end
+                    X.sock.sendall(frame);
+                except OSError:
+                    X.disconnect();
+                    raise;
+                # end
+                X.framesSent += 1;
+            # end
+            return FrameSent();
+        # end
+
+        def connect(X):
+            # % Open the socket and do the handshake (called with the lock)
+            B = X.B;
+            url = urlsplit(X.url());
+            sock = socket.create_connection((url.hostname,url.port),timeout=B.HTTP_ConnectTimeoutSec);
+            try:
+                if url.scheme == "wss":
+                    sock = ssl.create_default_context().wrap_socket(sock,server_hostname=url.hostname);
+                # end
+                sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1);
+                sock.settimeout(B.HTTP_ReadTimeoutSec);
+                key = base64.b64encode(os.urandom(16)).decode();
+                lines = ["GET "+(url.path or "/")+(("?"+url.query) if url.query else "")+" HTTP/1.1",
+                         "Host: "+url.hostname+":"+str(url.port),
+                         "Upgrade: websocket", "Connection: Upgrade",
+                         "Sec-WebSocket-Key: "+key, "Sec-WebSocket-Version: 13"];
+                cookies = "; ".join(c.name+"="+c.value for c in B.httpSession.cookies);
+                if cookies:# % The login of the HTTP session
+                    lines.append("Cookie: "+cookies);
+                # end
+                sock.sendall(("\r\n".join(lines)+"\r\n\r\n").encode());
+                response = b"";
+                while not(b"\r\n\r\n" in response):
+                    data = sock.recv(4096);
+                    if not(data) or len(response) > WEBSOCKET_HANDSHAKE_MAX:
+                        raise ConnectionError("WebSocket handshake of ["+X.url()+"] failed");
+                    # end
+                    response += data;
+                # end
+                head, rest = response.split(b"\r\n\r\n",1);
+                head = head.decode("latin-1").split("\r\n");
+                headers = {h.split(":",1)[0].strip().lower():h.split(":",1)[1].strip() for h in head[1:] if ":" in h};
+                status = head[0].split(" ")[1:2];
+                if status and status[0] in WEBSOCKET_LOGIN_REQUIRED:
+                    raise LoginRequired("WebSocket handshake of ["+X.url()+"] refused without a login: "+head[0]);
+                # end
+                if not(status == ["101"]) or not(headers.get("sec-websocket-accept") == websocketAccept(key)):
+                    raise ConnectionError("WebSocket handshake of ["+X.url()+"] refused: "+head[0]);
+                # end
+            except BaseException:
+                sock.close();
+                raise;
+            # end
+            X.sock = sock;
+            X.connects += 1;
+            X.reader = threading.Thread(target=X.read, args=(sock,rest), name="websocket-"+B.targetName, daemon=True);
+            X.reader.start();
+            B.log("WebSocket transport connected to ["+X.url()+"]");
+        # end
+
+        def read(X,sock,buffer):
+            # % Reader thread of one socket: pings, close and the pushed frames
+            buffer = bytearray(buffer);
+            def recvExact(n):
+                while len(buffer) < n:
+                    try:
+                        data = sock.recv(65536);
+                    except socket.timeout:
+                        if X.sock is not sock:
+                            raise ConnectionError("closed");
+                        # end
+                        continue;
+                    # end
+                    if not(data):
+                        raise ConnectionError("closed by the server");
+                    # end
+                    buffer.extend(data);
+                # end
+                data = bytes(buffer[:n]);
+                del buffer[:n];
+                return data;
+            # end
+            try:
+                while X.sock is sock:
+                    opcode, payload = readFrame(recvExact);
+                    if opcode == WEBSOCKET_PING:
+                        with X.lock:
+                            sock.sendall(encodeFrame(WEBSOCKET_PONG,payload));
+                        # end
+                    elif opcode == WEBSOCKET_CLOSE:
+                        if not(X.closing):# % Closed by the server, answer it
+                            with X.lock:
+                                sock.sendall(encodeFrame(WEBSOCKET_CLOSE,payload[:2]));
+                            # end
+                        # end
+                        break;
+                    elif opcode in (WEBSOCKET_TEXT,WEBSOCKET_BINARY,0x0):
+                        X.framesReceived += 1;
+                    # end
+                # end
+            except (OSError,ValueError):
+                pass;
+            # end
+            with X.lock:
+                if X.sock is sock and not(X.closing):
+                    X.B.log("[warning]:WebSocket transport of ["+X.B.targetName+"] closed, reopened on the next command",level=LOG_WARNING);
+                    X.disconnect();
+                # end
+            # end
+        # end
+
+        def disconnect(X):
+            # % Called with the lock
+            sock, X.sock = X.sock, None;
+            if sock is not None:
+                try:
+                    sock.close();
+                except OSError:
+                    pass;
+                # end
+            # end
+        # end
+
+        def close(X):
+            # % Closing handshake: the server answers the close frame after the
+            # % commands sent before it (a reset socket could lose them)
+            with X.lock:
+                sock, reader = X.sock, X.reader;
+                if sock is None:
+                    return;
+                # end
+                X.closing = True;
+                try:
+                    sock.sendall(encodeFrame(WEBSOCKET_CLOSE,struct.pack("!H",1000)));
+                except OSError:
+                    pass;
+                # end
+            # end
+            if reader is not None and reader is not threading.current_thread():
+                reader.join(X.B.HTTP_ReadTimeoutSec);
+            # end
+            with X.lock:
+                if X.sock is sock:
+                    X.disconnect();
+                # end
+                X.closing = False;
+            # end
+        # end
+
+        def stats(X):
+            return {"transport":X.name, "wsConnects":X.connects, "wsFramesSent":X.framesSent, "wsFramesReceived":X.framesReceived};
+        # end
+# end
+
+
+def createServerTransport(B):
+    # % Factory of the transport of a server target
+    name = B.Server_Transport.strip().lower();
+    if name == HttpTransport.name:
+        return HttpTransport(B);
+    elif name == WebSocketTransport.name:
+        return WebSocketTransport(B,B.Server_WebSocketPort,B.Server_WebSocketPath,B.Server_WebSocketFormat);
+    # end
+    raise Exception("[error]:Unknown server transport ["+B.Server_Transport+"], use \"http\" or \"websocket\"");
+# end
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# %
+# % Classname:   TriggerCoalescer
+# % Description: Coalescing and rate limiting stage in front of the HTTP
+# % dispatcher, for the bursty triggers (CC / velocity parameterised). Per
+# % endpoint only the latest pending value is kept and the calls are limited
+# % to the endpoint rate. The edge policy is set per preset row:
+# %   "leading"  - the first value of a burst is sent straight away, the values
+# %                within the rate window are dropped.
+# %   "trailing" - the latest value is sent at the end of the rate window.
+# %   "both"     - leading and trailing: the first value straight away and the
+# %                latest value of the burst at the end of the window.
+# %   "none"     - no coalescing (every message is a call, e.g. next/prev).
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import time;
+import heapq;
+import threading;
+
+COALESCE_EDGES = ("none","leading","trailing","both");
+
+
+# ==============================================================
+# State of one endpoint
+class CoalesceSlot:
+        __slots__ = ("nextAllowed","pending","scheduled");
+
+        def __init__(S):
+            S.nextAllowed = 0.;
+            S.pending = None;# % (target, job) waiting for the trailing edge
+            S.scheduled = False;
+        # end
+# end
+
+
+# ==============================================================
+class TriggerCoalescer:
+
+    # properties
+        coalesced=0;# % Values superseded by a newer one (never sent)
+        flushed=0;# % Trailing edge calls
+    # end
+
+    # methods
+        def __init__(C,submit):
+            # % submit(target, job) - the non-blocking hand-over to the dispatcher
+            C.submit = submit;
+            C.slots = {};
+            C.timers = [];# % heap of (due, sequence, endpoint)
+            C.sequence = 0;
+            C.coalesced = 0;
+            C.flushed = 0;
+            C.running = True;
+            C.condition = threading.Condition();
+            C.thread = threading.Thread(target=C.run, name="trigger-coalescer", daemon=True);
+            C.thread.start();
+        # end
+
+        def offer(C,target,job):
+            # % Called from the control loop for the triggers with a coalescing policy
+            trigger = job[0];
+            edge = trigger.CoalesceEdge;
+            interval = trigger.CoalesceInterval;
+            endpoint = (target,trigger.HTTP_URL);
+            now = time.perf_counter();
+            sendNow = False;
+            with C.condition:
+                slot = C.slots.get(endpoint);
+                if slot is None:
+                    slot = C.slots[endpoint] = CoalesceSlot();
+                # end
+                windowOpen = now >= slot.nextAllowed and slot.pending is None;
+                if windowOpen and edge != "trailing":
+                    # % Leading edge
+                    slot.nextAllowed = now+interval;
+                    sendNow = True;
+                elif edge == "leading":
+                    C.coalesced += 1;
+                else:
+                    # % Keep only the latest value for the trailing edge
+                    if slot.pending is not None:
+                        C.coalesced += 1;
+                    # end
+                    slot.pending = (target,job);
+                    if not(slot.scheduled):
+                        if windowOpen:# % Trailing only: the window starts now
+                            slot.nextAllowed = now+interval;
+                        # end
+                        slot.scheduled = True;
+                        C.sequence += 1;
+                        heapq.heappush(C.timers,(slot.nextAllowed,C.sequence,endpoint));
+                        C.condition.notify();
+                    # end
+                # end
+            # end
+            if sendNow:
+                C.submit(target,job);
+            # end
+        # end
+
+        def run(C):
+            # % Trailing edge timer thread
+            while True:
+                due = [];
+                with C.condition:
+                    while C.running and not(C.timers and C.timers[0][0] <= time.perf_counter()):
+                        C.condition.wait(C.timers[0][0]-time.perf_counter() if C.timers else None);
+                    # end
+                    if not(C.running):
+                        return;
+                    # end
+                    now = time.perf_counter();
+                    while C.timers and C.timers[0][0] <= now:
+                        endpoint = heapq.heappop(C.timers)[2];
+                        due.append(C.takePending(endpoint,now));
+                    # end
+                # end
+                for pending in due:
+                    if pending is not None:
+                        C.flushed += 1;
+                        C.submit(*pending);
+                    # end
+                # end
+            # end
+        # end
+
+        def takePending(C,endpoint,now):
+            # % Take the pending value of an endpoint and start its next window
+            slot = C.slots[endpoint];
+            pending = slot.pending;
+            slot.pending = None;
+            slot.scheduled = False;
+            if pending is not None:
+                slot.nextAllowed = now+pending[1][0].CoalesceInterval;
+            # end
+            return pending;
+        # end
+
+        def stop(C):
+            # % Send the pending trailing values and stop the timer thread
+            with C.condition:
+                C.running = False;
+                pending = [C.takePending(endpoint,0.) for endpoint in C.slots];
+                C.timers = [];
+                C.condition.notify();
+            # end
+            C.thread.join(1.0);
+            for p in pending:
+                if p is not None:
+                    C.flushed += 1;
+                    C.submit(*p);
+                # end
+            # end
+        # end
+
+        def stats(C):
+            return {"coalesced":C.coalesced, "trailing":C.flushed};
+        # end
+    # end
+# end
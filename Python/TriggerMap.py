@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# %
+# % Description: Compiles the enabled rows of the "*_Preset_cues.csv" trigger map
+# % into an immutable lookup table keyed by (MIDI channel, message type, note/CC).
+# % The rows limited to one MIDI input ("Midi Source" column, the device name)
+# % are keyed by (MIDI channel, message type, note/CC, source).
+# % The macros ("*_Preset_macros.csv") are compiled into the same table: a macro
+# % trigger carries its steps, a sequence of the preset rows (by HTTP_URL) with
+# % optional delays, e.g. "/clear; wait 200; /nextitem; /gotoitem(3); /tlogo".
+# % Every trigger gets the priority class and the deadline of its GroupType
+# % ("Group:priority:deadline ms" list, "*" for the other groups), the optional
+# % columns "Priority" and "Deadline Ms" override them per row.
+# % The cue timeline ("*_Preset_timeline.csv") is compiled into a list of
+# % triggers sorted by their position on the transport of the DAW, in beats
+# % (MIDI clock/song position) or in "[h:]m:s.fff" (MIDI timecode). A timeline
+# % cue is a preset row or a sequence of them, as the macro steps.
+# % The read rows ("HTML get()") of the preset are also compiled by path, with
+# % or without a MIDI mapping, for the queries of the response cache.
+# % Matching an incoming MIDI message then costs a single dict lookup and the
+# % preset rows are never touched in the control loop.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import re;
+from collections import namedtuple;
+from types import MappingProxyType;
+
+from TriggerCoalescer import COALESCE_EDGES;
+
+# The compiled trigger record (one per enabled row of the preset)
+MidiTrigger = namedtuple("MidiTrigger", [
+    "HTTP_URL", "ServerAPI", "Description", "GroupType", "ActionTypeArguments",
+    "MidimsgType", "MidiChanel", "MidiNote_CC", "ExternalExecutable", "ExternalCmd", "NoteAlph", "Request",
+    "CoalesceEdge", "CoalesceInterval", "MidiSource", "Macro", "Priority", "DeadlineSec"
+]);
+
+# One step of a macro: the request (None for a delay) with its argument, or the delay in seconds
+MacroStep = namedtuple("MacroStep", ["Request", "Argument", "DelaySec", "HTTP_URL"]);
+MACRO_WAIT = re.compile(r"^wait\s+(\d+(?:\.\d*)?)\s*(ms|s)?$",re.IGNORECASE);
+MACRO_CALL = re.compile(r"^(/[^\s(]*)\s*(?:\((.*)\))?$");
+
+# The compiled cue timeline: the unit of the positions ("beats" or "seconds"),
+# the sorted positions and their (trigger, argument) cues
+Timeline = namedtuple("Timeline", ["Unit", "Positions", "Cues"]);
+TIMELINE_TIMECODE = re.compile(r"^(?:(\d+):)?(\d+):(\d+(?:\.\d*)?)$");
+EMPTY_TIMELINE = Timeline("beats",(),());
+
+# % Action type of the triggers that append the velocity to the URL
+ACTION_WITH_VELOCITY = "void action(int velocity)";
+# % Action type of the read triggers, their responses are cached
+ACTION_READ = "HTML get()";
+
+# % Priority class and deadline of the groups missing from the list
+PRIORITY_DEFAULT = (2,0.);
+
+
+def triggerKey(channel,msgType,noteCC):
+    # The lookup key of a MIDI message or a trigger row
+    return (int(channel), str(msgType), int(noteCC));
+# end
+
+def cellText(value):
+    # Empty CSV cells are imported as NaN, convert them to empty strings
+    if value is None or value != value:
+        return "";
+    # end
+    return str(value);
+# end
+
+def coalescePolicy(row,defaultRateHz):
+    # % (edge, interval in seconds) of a row. The velocity parameterised triggers
+    # % default to "both" at the default rate, the other triggers to "none".
+    HTTP_URL = cellText(row["HTTP_URL"]);
+    edge = cellText(row.get("CoalesceEdge","")).strip().lower();
+    if not(edge):
+        edge = "both" if cellText(row["ActionTypeArguments"]) == ACTION_WITH_VELOCITY else "none";
+    elif edge not in COALESCE_EDGES:
+        raise Exception("[error]:Unknown coalesce edge ["+edge+"] for trigger ["+HTTP_URL+"], use "+"/".join(COALESCE_EDGES));
+    # end
+    rateHz = cellText(row.get("RateLimitHz","")).strip();
+    try:
+        rateHz = float(rateHz) if rateHz else float(defaultRateHz);
+    except ValueError:
+        raise Exception("[error]:Invalid rate limit ["+rateHz+"] for trigger ["+HTTP_URL+"]");
+    # end
+    if edge == "none" or rateHz <= 0:
+        return ("none",0.);
+    # end
+    return (edge,1./rateHz);
+# end
+
+def parsePriorityGroups(text):
+    # % "Navigate:0:800; Edit:3:300; *:2:0" -> {group: (priority, deadline in seconds)}
+    # % (lower priorities are sent first, a deadline of 0 never expires)
+    groups = {};
+    for entry in [e.strip() for e in text.split(";") if e.strip()]:
+        try:
+            group, priority, deadlineMs = [p.strip() for p in entry.split(":")];
+            groups[group] = (int(priority),max(float(deadlineMs),0.)/1000.);
+        except ValueError:
+            raise Exception("[error]:Invalid priority group ["+entry+"], use \"Group:priority:deadline ms\"");
+        # end
+    # end
+    return groups;
+# end
+
+def priorityPolicy(row,groups):
+    # % (priority, deadline in seconds) of a row: its GroupType, overridden by the row
+    priority, deadline = groups.get(cellText(row.get("GroupType","")).strip(),groups.get("*",PRIORITY_DEFAULT));
+    rowPriority = cellText(row.get("Priority","")).strip();
+    rowDeadline = cellText(row.get("DeadlineMs","")).strip();
+    try:
+        if rowPriority:
+            priority = int(float(rowPriority));
+        # end
+        if rowDeadline:
+            deadline = max(float(rowDeadline),0.)/1000.;
+        # end
+    except ValueError:
+        raise Exception("[error]:Invalid priority/deadline ["+rowPriority+"/"+rowDeadline+"] for trigger ["+cellText(row.get("HTTP_URL",""))+"]");
+    # end
+    return (priority,deadline);
+# end
+
+def compileTriggerTable(rows,prepareRequest=None,defaultRateHz=0.,macros=(),priorityGroups=""):
+    # % Compile the trigger rows (list of dicts) into an immutable lookup table.
+    # % Duplicate MIDI mappings are rejected here, at load time, rather than
+    # % being discovered when the message arrives. The optional prepareRequest
+    # % function builds the request object of each trigger once. The compiled
+    # % macros (compileMacros) are added to the same table.
+    groups = parsePriorityGroups(priorityGroups);
+    table = {};
+    for key,trigger in macros:
+        if key in table:
+            raise Exception("[error]:Multiple MIDI triggers matching "+str(key)+": ["+
+                            table[key].HTTP_URL+"] and ["+trigger.HTTP_URL+"]");
+        # end
+        table[key] = trigger;
+    # end
+    for r in rows:
+        try:
+            key = triggerKey(r["MidiChanel"], r["MidimsgType"], r["MidiNote_CC"]);
+        except (TypeError,ValueError):
+            raise Exception("[error]:Incomplete MIDI mapping for trigger ["+cellText(r["HTTP_URL"])+"]");
+        # end
+        edge, interval = coalescePolicy(r,defaultRateHz);
+        priority, deadline = priorityPolicy(r,groups);
+        source = cellText(r.get("MidiSource","")).strip();
+        if source:
+            key = key+(source,);
+        # end
+        trigger = MidiTrigger(
+            HTTP_URL            = cellText(r["HTTP_URL"]),
+            ServerAPI           = cellText(r["ServerAPI"]),
+            Description         = cellText(r["Description"]),
+            GroupType           = cellText(r["GroupType"]),
+            ActionTypeArguments = cellText(r["ActionTypeArguments"]),
+            MidimsgType         = key[1],
+            MidiChanel          = key[0],
+            MidiNote_CC         = key[2],
+            ExternalExecutable  = cellText(r["ExternalExecutable"]),
+            ExternalCmd         = cellText(r["ExternalCmd"]),
+            NoteAlph            = cellText(r.get("NoteAlph","")),
+            # % No request for the rows that only run an external command
+            Request             = prepareRequest(cellText(r["HTTP_URL"])) if prepareRequest and cellText(r["HTTP_URL"]) else None,
+            CoalesceEdge        = edge,
+            CoalesceInterval    = interval,
+            MidiSource          = source,
+            Macro               = (),
+            Priority            = priority,
+            DeadlineSec         = deadline,
+        );
+        if key in table:
+            raise Exception("[error]:Multiple MIDI triggers matching "+str(key)+": ["+
+                            table[key].HTTP_URL+"] and ["+trigger.HTTP_URL+"]");
+        # end
+        table[key] = trigger;
+    # end
+    return MappingProxyType(table);
+# end
+
+def compileMacroSteps(name,text,presetPaths,serverURL,prepareRequest):
+    # % "/clear; wait 200; /gotoitem(3)" -> MacroStep tuple, the paths must be rows of the preset
+    steps = [];
+    for step in [s.strip() for s in text.split(";") if s.strip()]:
+        wait = MACRO_WAIT.match(step);
+        call = MACRO_CALL.match(step);
+        if wait:
+            delay = float(wait.group(1));
+            steps.append(MacroStep(None,"",delay if (wait.group(2) or "ms").lower() == "s" else delay/1000.,""));
+        elif call and call.group(1) in presetPaths:
+            URL = serverURL+call.group(1);
+            steps.append(MacroStep(prepareRequest(URL) if prepareRequest else None,(call.group(2) or "").strip(),0.,URL));
+        else:
+            raise Exception("[error]:Macro ["+name+"] step ["+step+"] is not a preset row or \"wait <ms>\"");
+        # end
+    # end
+    if not([s for s in steps if s.DelaySec == 0.]):
+        raise Exception("[error]:Macro ["+name+"] has no steps");
+    # end
+    return tuple(steps);
+# end
+
+def compileMacros(rows,presetPaths,serverURL="",prepareRequest=None,priorityGroups=""):
+    # % Compile the enabled macro rows into (key, trigger) pairs for compileTriggerTable.
+    # % presetPaths - the HTTP_URL paths of all the preset rows (enabled or not)
+    groups = parsePriorityGroups(priorityGroups);
+    macros = [];
+    for r in rows:
+        if not(cellText(r.get("MidiMapping","")).strip() == "enabled"):
+            continue;
+        # end
+        name = cellText(r.get("MacroName","")).strip();
+        try:
+            key = triggerKey(r["MidiChanel"], r["MidimsgType"], r["MidiNote_CC"]);
+        except (KeyError,TypeError,ValueError):
+            raise Exception("[error]:Incomplete MIDI mapping for macro ["+name+"]");
+        # end
+        source = cellText(r.get("MidiSource","")).strip();
+        if source:
+            key = key+(source,);
+        # end
+        priority, deadline = priorityPolicy({"GroupType":"Macro", "HTTP_URL":name},groups);
+        trigger = MidiTrigger(
+            HTTP_URL            = serverURL+"/[macro] "+name,
+            ServerAPI           = "",
+            Description         = cellText(r.get("Description","")),
+            GroupType           = "Macro",
+            ActionTypeArguments = "void action()",
+            MidimsgType         = key[1],
+            MidiChanel          = key[0],
+            MidiNote_CC         = key[2],
+            ExternalExecutable  = "",
+            ExternalCmd         = "",
+            NoteAlph            = "",
+            Request             = None,
+            CoalesceEdge        = "none",
+            CoalesceInterval    = 0.,
+            MidiSource          = source,
+            Macro               = compileMacroSteps(name,cellText(r.get("Steps","")),presetPaths,serverURL,prepareRequest),
+            Priority            = priority,
+            DeadlineSec         = deadline,
+        );
+        macros.append((key,trigger));
+    # end
+    return macros;
+# end
+
+def timelinePosition(text):
+    # % "64" / "64.5" -> ("beats", 64.5), "1:02.500" / "0:01:02.5" -> ("seconds", 62.5)
+    timecode = TIMELINE_TIMECODE.match(text);
+    if timecode:
+        return ("seconds",int(timecode.group(1) or 0)*3600.+int(timecode.group(2))*60.+float(timecode.group(3)));
+    # end
+    return ("beats",float(text));
+# end
+
+def compileTimeline(rows,presetPaths,serverURL="",prepareRequest=None,priorityGroups=""):
+    # % Compile the enabled timeline rows into a Timeline sorted by position.
+    # % A single preset row is sent as that trigger, a sequence of steps as a
+    # % macro. All the positions of a timeline have the same unit.
+    groups = parsePriorityGroups(priorityGroups);
+    priority, deadline = priorityPolicy({"GroupType":"Timeline"},groups);
+    units = set();
+    cues = [];
+    for r in rows:
+        if not(cellText(r.get("Mapping","")).strip() == "enabled"):
+            continue;
+        # end
+        text = cellText(r.get("Position","")).strip();
+        try:
+            unit, position = timelinePosition(text);
+        except ValueError:
+            raise Exception("[error]:Invalid timeline position ["+text+"], use beats (\"64.5\") or a time (\"1:02.500\")");
+        # end
+        units.add(unit);
+        steps = compileMacroSteps("timeline "+text,cellText(r.get("Cue","")),presetPaths,serverURL,prepareRequest);
+        single = steps[0] if len(steps) == 1 else None;
+        trigger = MidiTrigger(
+            HTTP_URL            = single.HTTP_URL if single else serverURL+"/[timeline] "+text,
+            ServerAPI           = "",
+            Description         = cellText(r.get("Description","")),
+            GroupType           = "Timeline",
+            ActionTypeArguments = "void action()",
+            MidimsgType         = "",
+            MidiChanel          = 0,
+            MidiNote_CC         = 0,
+            ExternalExecutable  = "",
+            ExternalCmd         = "",
+            NoteAlph            = "",
+            Request             = single.Request if single else None,
+            CoalesceEdge        = "none",
+            CoalesceInterval    = 0.,
+            MidiSource          = "",
+            Macro               = () if single else steps,
+            Priority            = priority,
+            DeadlineSec         = deadline,
+        );
+        cues.append((position,trigger,single.Argument if single else ""));
+    # end
+    if len(units) > 1:
+        raise Exception("[error]:The timeline mixes beats and times, use one unit");
+    # end
+    cues.sort(key=lambda cue: cue[0]);
+    return Timeline(units.pop() if units else "beats",tuple(c[0] for c in cues),tuple((c[1],c[2]) for c in cues));
+# end
+
+def compileReadTriggers(rows,serverURL="",prepareRequest=None):
+    # % {path: trigger} of the read rows of the preset (enabled or not)
+    table = {};
+    for r in rows:
+        path = cellText(r["HTTP_URL"]).strip();
+        if not(path) or not(cellText(r["ActionTypeArguments"]).strip() == ACTION_READ):
+            continue;
+        # end
+        table[path] = MidiTrigger(
+            HTTP_URL            = serverURL+path,
+            ServerAPI           = cellText(r["ServerAPI"]),
+            Description         = cellText(r["Description"]),
+            GroupType           = cellText(r["GroupType"]),
+            ActionTypeArguments = ACTION_READ,
+            MidimsgType         = "",
+            MidiChanel          = 0,
+            MidiNote_CC         = 0,
+            ExternalExecutable  = "",
+            ExternalCmd         = "",
+            NoteAlph            = "",
+            Request             = prepareRequest(serverURL+path) if prepareRequest else None,
+            CoalesceEdge        = "none",
+            CoalesceInterval    = 0.,
+            MidiSource          = "",
+            Macro               = (),
+            Priority            = PRIORITY_DEFAULT[0],
+            DeadlineSec         = 0.,
+        );
+    # end
+    return MappingProxyType(table);
+# end
+
+def triggerChannelTypes(table):
+    # % The (channel, type) pairs used by the table, for a cheap pre-filter
+    return frozenset((key[0],key[1]) for key in table);
+# end
+
+def hasSourceTriggers(table):
+    # % True when some of the triggers are limited to one MIDI input
+    return any(len(key) > 3 for key in table);
+# end
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# %
+# % Description: Offline end-to-end benchmark of the bridge. Scripted MIDI
+# % streams (note bursts, dense CC sweeps and mixed channels) are played
+# % through the control loop (virtual MIDI backend) with the real trigger
+# % presets, and the HTTP commands go to a local presenter stub server with a
+# % configurable response delay and error rate. Reports the events/sec, the
+# % latency percentiles and the CPU time, e.g.
+# %     python benchmark.py --preset Quelea --scenario all --delay-ms 2
+# % With --ports N the stream is spread over N virtual inputs (multi-device fan-in).
+# % With --replay FILE a recorded session (main.py --record) is played instead
+# % of the scripted streams, as fast as possible (or at its speed with --rate 1).
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import time;
+import random;
+import contextlib;
+
+from MIDI2HTTP_Bridge import MIDI2HTTP_Bridge;
+from PresenterStubServer import PresenterStubServer;
+from MidiInputBackends import VirtualMidiBackend,MultiMidiBackend,ReplayMidiBackend;
+from ServerTransport import createServerTransport;
+
+# % Benchmarked presets (configuration files relative to the repository root)
+rootPath = os.path.abspath(os.path.join(os.path.dirname(__file__),".."));
+BENCHMARK_PRESETS = {
+    "Quelea": os.path.join(rootPath,"QueleaPreset","daw2server_settingsConfiguration.ini"),
+    "OpenLP": os.path.join(rootPath,"OpenLP_Preset","daw2server_settingsConfiguration.ini"),
+};
+
+
+# ==============================================================
+# Scripted MIDI streams, lists of [[status, data1, data2, data3], timestamp_ms]
+def streamNoteBursts(B,count,rnd):
+    # % Bursts of 8 mapped notes (NoteOn + NoteOff) with a pause in between
+    notes = [key for key in B.triggerTable if key[1] == "NoteOn"];
+    packets = [];
+    t = 0;
+    while len(packets) < count:
+        for n in range(8):
+            channel, msgType, note = notes[rnd.randrange(len(notes))][:3];
+            packets.append([[0x90|(channel-1),note,100,0],t]);
+            packets.append([[0x80|(channel-1),note,0,0],t+1]);
+            t += 2;
+        # end
+        t += 250;
+    # end
+    return packets[:count];
+# end
+
+def streamCCSweep(B,count,rnd):
+    # % Dense CC automation (controllers 1, 7, 11 on the trigger channels)
+    # % interleaved with velocity sweeps of the parameterised triggers
+    channels = sorted({key[0] for key in B.triggerTable}) or [16];
+    velocityNotes = [key for key,trigger in B.triggerTable.items() if "velocity" in trigger.ActionTypeArguments];
+    packets = [];
+    t = 0;
+    value = 0;
+    while len(packets) < count:
+        for channel in channels:
+            for controller in (1,7,11):
+                packets.append([[0xB0|(channel-1),controller,value,0],t]);
+            # end
+        # end
+        if velocityNotes and value % 8 == 0:
+            channel, msgType, note = velocityNotes[(value//8) % len(velocityNotes)][:3];
+            packets.append([[0x90|(channel-1),note,max(value,1),0],t]);
+        # end
+        value = (value+1) % 128;
+        t += 1;
+    # end
+    return packets[:count];
+# end
+
+def streamMixed(B,count,rnd):
+    # % Random channels and message types, a part of them match triggers
+    keys = list(B.triggerTable);
+    packets = [];
+    t = 0;
+    while len(packets) < count:
+        r = rnd.random();
+        if r < 0.2 and keys:
+            channel, msgType, note = keys[rnd.randrange(len(keys))][:3];
+            packets.append([[0x90|(channel-1),note,rnd.randrange(1,128),0],t]);
+        elif r < 0.6:
+            packets.append([[0x90|rnd.randrange(16),rnd.randrange(128),rnd.randrange(128),0],t]);
+        elif r < 0.9:
+            packets.append([[0xB0|rnd.randrange(16),rnd.randrange(128),rnd.randrange(128),0],t]);
+        else:
+            packets.append([[0xE0|rnd.randrange(16),rnd.randrange(128),rnd.randrange(128),0],t]);
+        # end
+        t += rnd.randrange(3);
+    # end
+    return packets;
+# end
+
+BENCHMARK_SCENARIOS = {"notes":streamNoteBursts, "cc":streamCCSweep, "mixed":streamMixed};
+
+
+# ==============================================================
+def runBenchmark(preset,scenario,events,rate,delayMs,errorRate,queueSize,seed=0,quiet=True,ports=1,replay=None,transport="http"):
+    # % Run one scenario against one preset and return the results
+    stub = PresenterStubServer(preset,delayMs,errorRate,seed=seed).start();
+    output = open(os.devnull,"w") if quiet else sys.stdout;
+    try:
+        with contextlib.redirect_stdout(output):
+            B = MIDI2HTTP_Bridge(BENCHMARK_PRESETS[preset],useCache=False);
+            B.Server_Protocol = "http";
+            B.Server_IP, B.Server_ControlPort = stub.address();
+            B.Server_Transport, B.Server_WebSocketPort = transport, 0;
+            B.serverTransport = createServerTransport(B);
+            if queueSize:
+                B.Dispatch_QueueSize = queueSize;
+            # end
+            B.importMidiTriggers();
+            B.processTriggerMap();
+            if replay:# % A recorded session, at its speed when paced
+                B.midiBackend = ReplayMidiBackend(replay,realtime=rate > 0);
+                B.midi_BridgeName = ";".join(B.midiBackend.sourceNames);
+                packets = range(B.midiBackend.count);
+                ports = len(B.midiBackend.sourceNames);
+            else:
+                packets = BENCHMARK_SCENARIOS[scenario](B,events,random.Random(seed));
+            # end
+            if rate > 0 and not(replay):# % Pace the stream at the requested event rate
+                packets = [[data,i*1000./rate] for i,(data,timestamp) in enumerate(packets)];
+            # end
+
+            # % Play the stream through the control loop with the virtual backend
+            if replay:
+                pass;
+            elif ports > 1:# % Round robin over several virtual inputs
+                names = [B.midi_BridgeName+" "+str(n+1) for n in range(ports)];
+                B.midiBackend = MultiMidiBackend([(VirtualMidiBackend(name,packets[n::ports],realtime=rate > 0),
+                                                   {'interface':"virtual", 'name':name, 'is_input':1, 'is_output':0,
+                                                    'opened':0, 'device_id':n, 'handle':None})
+                                                  for n,name in enumerate(names)]);
+                B.midi_BridgeName = ";".join(names);
+            else:
+                B.midiBackend = VirtualMidiBackend(B.midi_BridgeName,packets,realtime=rate > 0);
+            # end
+            B.selectMidiDeviceInput();
+            ingest = {};
+            stopDispatch = B.stopDispatch;
+            def markIngestDone():
+                # % The control loop has read the whole stream
+                ingest["time"] = time.perf_counter()-tStart;
+                ingest["cpu"] = time.thread_time()-threadCpuStart;
+                stopDispatch();
+            # end
+            B.stopDispatch = markIngestDone;
+
+            cpuStart = time.process_time();
+            threadCpuStart = time.thread_time();
+            tStart = time.perf_counter();
+            B.runLoop();
+            totalTime = time.perf_counter()-tStart;
+            cpuTime = time.process_time()-cpuStart;
+            ingestTime = ingest["time"];
+            ingestCpu = ingest["cpu"];
+            B.logger.flush();
+        # end
+    finally:
+        stub.stop();
+        if quiet:
+            output.close();
+        # end
+    # end
+
+    stats = B.dispatcher.stats();
+    total = B.latencyStats.combined("read->response");
+    queued = B.latencyStats.combined("match->send");
+    return {
+        "preset":preset, "scenario":scenario, "events":len(packets), "ports":ports, "transport":transport,
+        "ingestEventsPerSec":len(packets)/ingestTime if ingestTime > 0 else 0.,
+        "ingestCpuUsPerEvent":ingestCpu/len(packets)*1e6 if packets else 0.,
+        "dispatchedPerSec":stats["sent"]/totalTime if totalTime > 0 else 0.,
+        "cpuTime":cpuTime, "wallTime":totalTime,
+        "submitted":stats["submitted"], "sent":stats["sent"], "failed":stats["failed"], "rejected":stats["rejected"], "evicted":stats["evicted"], "expired":stats["expired"],
+        "coalesced":B.coalescer.coalesced,
+        "stubHits":stub.totalHits(), "stubErrors":stub.errors,
+        "latency":(total.percentile(50),total.percentile(95),total.percentile(99),total.maximum),
+        "queueWait":(queued.percentile(50),queued.percentile(95),queued.percentile(99),queued.maximum),
+    };
+# end
+
+def formatResult(r):
+    lines = [
+        "["+r["preset"]+" | "+r["scenario"]+"] events:%i ports:%i transport:%s" % (r["events"],r["ports"],r["transport"]),
+        "    ingest     : %12.0f events/s   %8.2f us CPU/event" % (r["ingestEventsPerSec"],r["ingestCpuUsPerEvent"]),
+        "    dispatch   : %12.1f calls/s    submitted:%i sent:%i failed:%i rejected:%i evicted:%i expired:%i coalesced:%i" %
+            (r["dispatchedPerSec"],r["submitted"],r["sent"],r["failed"],r["rejected"],r["evicted"],r["expired"],r["coalesced"]),
+        "    read->resp : p50 %8.3f  p95 %8.3f  p99 %8.3f  max %8.3f ms" % r["latency"],
+        "    queue wait : p50 %8.3f  p95 %8.3f  p99 %8.3f  max %8.3f ms" % r["queueWait"],
+        "    CPU time   : %8.3f s of %8.3f s wall" % (r["cpuTime"],r["wallTime"]),
+    ];
+    return os.linesep.join(lines);
+# end
+
+
+if __name__ == "__main__":
+    import argparse;
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the MIDI to HTTP bridge");
+    parser.add_argument("--preset",default="all",choices=["all"]+sorted(BENCHMARK_PRESETS));
+    parser.add_argument("--scenario",default="all",choices=["all"]+sorted(BENCHMARK_SCENARIOS));
+    parser.add_argument("--events",type=int,default=5000,help="MIDI packets per scenario");
+    parser.add_argument("--rate",type=float,default=0.,help="MIDI packets per second (0 = as fast as possible)");
+    parser.add_argument("--delay-ms",type=float,default=1.,help="response delay of the stub server");
+    parser.add_argument("--error-rate",type=float,default=0.,help="fraction of stub responses with HTTP 500");
+    parser.add_argument("--queue-size",type=int,default=0,help="dispatch queue size (0 = from the preset ini)");
+    parser.add_argument("--seed",type=int,default=0);
+    parser.add_argument("--ports",type=int,default=1,help="virtual MIDI inputs the stream is spread over");
+    parser.add_argument("--replay",default=None,help="MIDI recording played instead of the scenarios");
+    parser.add_argument("--transport",default="http",choices=["http","websocket"],help="transport of the cue commands");
+    parser.add_argument("--verbose",action="store_true",help="keep the bridge log output");
+    args = parser.parse_args();
+
+    presets = sorted(BENCHMARK_PRESETS) if args.preset == "all" else [args.preset];
+    scenarios = sorted(BENCHMARK_SCENARIOS) if args.scenario == "all" else [args.scenario];
+    if args.replay:
+        scenarios = ["replay"];
+    # end
+    for preset in presets:
+        for scenario in scenarios:
+            result = runBenchmark(preset,scenario,args.events,args.rate,args.delay_ms,args.error_rate,
+                                  args.queue_size,args.seed,quiet=not(args.verbose),ports=args.ports,replay=args.replay,
+                                  transport=args.transport);
+            print(formatResult(result));
+        # end
+    # end
+# end
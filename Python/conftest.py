@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# %
+# % Description: Shared fixtures of the automated checks, run with
+# %     python -m pytest -q Python
+# % The stubBridge fixture starts the local presenter stub server (with the
+# % login of Quelea) and a headless bridge on the Quelea preset pointed at it,
+# % with its dispatch lanes running. The commandTrigger and execute fixtures
+# % pick a compiled command trigger and run one job through the dispatcher in
+# % the calling thread.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import time;
+import contextlib;
+
+import pytest;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from HttpDispatcher import DispatchLane;
+from MIDI2HTTP_Bridge import MIDI2HTTP_Bridge;
+from PresenterStubServer import PresenterStubServer;
+
+rootPath = os.path.abspath(os.path.join(os.path.dirname(__file__),".."));
+QUELEA_PRESET = os.path.join(rootPath,"QueleaPreset","daw2server_settingsConfiguration.ini");
+STUB_PASSWORD = "stub";
+
+
+@pytest.fixture
+def stubBridge():
+    stub = PresenterStubServer("Quelea",password=STUB_PASSWORD).start();
+    with contextlib.redirect_stdout(open(os.devnull,"w")) as output:
+        B = MIDI2HTTP_Bridge(QUELEA_PRESET,headless=True,useCache=False);
+        B.Server_Protocol = "http";
+        B.Server_IP, B.Server_ControlPort = stub.address();
+        B.Server_Name, B.Server_password, B.Server_CookieCache = "Quelea", STUB_PASSWORD, "";
+        B.Reload_PollSec, B.Metrics_Port = 0, 0;
+        B.importMidiTriggers();
+        B.processTriggerMap();
+        B.startDispatch();
+        try:
+            yield stub, B;
+        finally:
+            B.stopDispatch();
+            B.logger.stop();
+            stub.stop();
+            output.close();
+        # end
+    # end
+# end
+
+@pytest.fixture
+def commandTrigger():
+    def commandTrigger(B,path):
+        return next(trigger for trigger in B.triggerTable.values()
+                    if trigger.Request is not None and not(trigger.Macro) and trigger.HTTP_URL.endswith(path));
+    # end
+    return commandTrigger;
+# end
+
+@pytest.fixture
+def execute():
+    def execute(B,trigger,argument=""):
+        # % One job through the dispatcher, in the calling thread
+        D = B.dispatcher;
+        now = time.perf_counter();
+        D.execute(DispatchLane(D,B.targetName,1),(trigger,argument,[0.,now,now,now,0.,0.]));
+    # end
+    return execute;
+# end
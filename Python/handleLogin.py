@@ -1,45 +1,117 @@
 # %
 # % Description: Ths functions handles the authantication.
-# % Ideally the function will be able to auto-authenticate the process,
-# % however at the moment it will rely on the user to manually input the
-# % password in the web browser.
-# % 
+# % The password form of the server is posted with "Server_password" on the
+# % pooled HTTP session, the session cookies are kept (and optionally cached
+# % in "Server_CookieCache" for the next start). Only when there is no
+# % password (or it is refused) the login page is opened in the web browser,
+# % without waiting: the connection supervisor notices the login later.
+# %
 # % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
 # %
 
-# Library for HTTP requests
-import requests;
-#  webbrowser module provides a high-level interface to open a web page 
-import webbrowser;
-# Import the time library
+import re;
+import os;
+import json;
 import time;
+#  webbrowser module provides a high-level interface to open a web page
+import webbrowser;
+import requests;
+
+from BridgeLogger import LOG_WARNING;
+
+# % The login page of the server asks for the password with this input
+LOGIN_PASSWORD_INPUT = "<input name=\"password\">";
+LOGIN_FORM_ACTION = re.compile(r"<form[^>]*action=\"([^\"]*)\"",re.IGNORECASE);
 
 
+def isLoginPage(response):
+    # % A response of the server (not the [] of a failed connection test) asking for the password
+    return isinstance(response,requests.Response) and LOGIN_PASSWORD_INPUT in response.text;
+# end
+
+def postLogin(B,HTML):
+    # % Post the password form (to the form action, the root by default)
+    action = LOGIN_FORM_ACTION.search(HTML);
+    URL = B.get_serverURL()+"/"+(action.group(1).lstrip("/") if action else "");
+    try:
+        B.httpSession.post(URL,data={"password":B.Server_password},timeout=B.httpTimeout,allow_redirects=False);
+        # % Check with a fresh page that the password was accepted
+        connectionOK, response = B.testConnection(quiet=True);
+        return connectionOK and not(isLoginPage(response));
+    except:
+        return False;
+    # end
+# end
+
+def loadCookieCache(B):
+    # % Restore the session cookies of the last run
+    if not(B.Server_CookieCache) or not(os.path.isfile(B.Server_CookieCache)):
+        return;
+    # end
+    try:
+        with open(B.Server_CookieCache) as file:
+            for cookie in json.load(file):
+                B.httpSession.cookies.set(**cookie);
+            # end
+        # end
+    except Exception as err:
+        B.log("[warning]:Cookie cache ["+B.Server_CookieCache+"] not loaded: "+str(err),level=LOG_WARNING);
+    # end
+# end
+
+def saveCookieCache(B):
+    if not(B.Server_CookieCache):
+        return;
+    # end
+    cookies = [{"name":c.name, "value":c.value, "domain":c.domain, "path":c.path} for c in B.httpSession.cookies];
+    try:
+        with open(B.Server_CookieCache,"w") as file:
+            json.dump(cookies,file);
+        # end
+    except Exception as err:
+        B.log("[warning]:Cookie cache ["+B.Server_CookieCache+"] not saved: "+str(err),level=LOG_WARNING);
+    # end
+# end
+
+def loginAuthenticated(B):
+    B.log("Login authenticated!");
+    B.Server_loggedIN = True;
+    B.Server_loginTime = time.monotonic();
+    B.loginBrowserOpened = False;
+    saveCookieCache(B);
+    # % A WebSocket transport opens again with the new session cookie
+    if B.serverTransport is not None:
+        B.serverTransport.close();
+    # end
+# end
 
 def handleLogin(B):
     # If the server name is Quelea
-    if (B.Server_Name == "Quelea"):  
+    if (B.Server_Name == "Quelea"):
         # Get a test response
-        # response = requests.get(B.get_serverURL()+'/'+'password='+B.Server_password);
-        response = B.testConnection()[1];
-        # Get the response and check if it is HTML page asking for user inputed password 
-        HTML = response.text;
-        if "<input name=\"password\">" in HTML:
-            # %         RM.Method = matlab.net.http.RequestMethod.POST;
-            B.log("Opening ["+B.get_serverURL()+"] in the default web brouwer to request password");        
-            webbrowser.open(B.get_serverURL(), new=2)
-            while True:
-                response = B.testConnection()[1];#%response = send(matlab.net.http.RequestMessage,B.get_serverURL());
-                HTML = response.text;              
-                if not("<input name=\"password\">" in HTML):
-                    B.log("Login authenticated!");
-                    break;
-                # end
-                B.log('Waiting for password...');
-                time.sleep(3);
-            # end   
-        else:
-            B.log("Login authenticated!");
+        connectionOK, response = B.testConnection(quiet=True);
+        if not(connectionOK):# % Not logged in, the supervisor tries again when the server answers
+            B.log("[warning]:Login to ["+B.get_serverURL()+"] failed, the server does not answer",level=LOG_WARNING);
+            return;
+        # end
+        # Get the response and check if it is HTML page asking for user inputed password
+        if not(isLoginPage(response)):
+            loginAuthenticated(B);
+            return;
+        # end
+        if B.Server_password and postLogin(B,response.text):
+            loginAuthenticated(B);
+            return;
+        # end
+        B.log("[warning]:Automatic login to ["+B.get_serverURL()+"] failed, check Server_password",level=LOG_WARNING);
+        # % Fallback: the user types the password in the web browser, once
+        if not(B.loginBrowserOpened):
+            B.log("Opening ["+B.get_serverURL()+"] in the default web brouwer to request password");
+            webbrowser.open(B.get_serverURL(), new=2);
+            B.loginBrowserOpened = True;
         # end
+    else:
+        # % No login needed
+        B.Server_loggedIN = True;
     # end
 # end
@@ -3,25 +3,49 @@
 # % Description: This is the main script file that instantiates the MIDI2HTTP_Bridge class
 # % initializes the process configuration and runs the control loop.
 # % 
+# % Options:
+# %   --headless        No splash screen or file dialogs (tkinter is not imported)
+# %   --config FILE     Configuration file (default: daw2server_settingsConfiguration.ini)
+# %   --startup-report  Print the startup time report before running the loop
+# %   --no-preset-cache Always rebuild the configuration and the triggers from the files
+# %   --record FILE     Record the MIDI input to FILE (replay it with --replay)
+# %   --replay FILE     Replay a recording in place of the MIDI input (--replay-fast: as fast as possible)
+# % 
 # % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
 # %
 
-from operator import truediv;
-from MIDI2HTTP_Bridge import MIDI2HTTP_Bridge;
+from ExtraFunctions import StartupProfile;
+startup = StartupProfile();
+
+import argparse;
 import os;
-from tkinter import *;
 
+parser = argparse.ArgumentParser(description="MIDI to HTTP bridge for DAW and presentation software");
+parser.add_argument("--headless",action="store_true",help="no splash screen or file dialogs");
+parser.add_argument("--config",default=None,help="configuration file");
+parser.add_argument("--startup-report",action="store_true",help="print the startup time report");
+parser.add_argument("--no-preset-cache",action="store_true",help="do not use the compiled preset cache");
+parser.add_argument("--record",default=None,help="record the MIDI input to this file");
+parser.add_argument("--replay",default=None,help="replay a MIDI recording in place of the MIDI input");
+parser.add_argument("--replay-fast",action="store_true",help="replay as fast as possible (not at the original speed)");
+args = parser.parse_args();
+
+from MIDI2HTTP_Bridge import MIDI2HTTP_Bridge;
+startup.mark("import bridge");
 
-# Clearing the Screen
-# posix is os name for linux or mac
-if(os.name == 'posix'):
-   os.system('clear')
-# else screen will be cleared for windows
-else:
-   os.system('cls')
+
+if not(args.headless):
+   # Clearing the Screen
+   # posix is os name for linux or mac
+   if(os.name == 'posix'):
+      os.system('clear')
+   # else screen will be cleared for windows
+   else:
+      os.system('cls')
 
 
 def showSplashScreen():
+    from tkinter import Tk;
     splash_screen =Tk();
     splash_screen.title("Splash screen");
     splash_screen.geometry("512x512");
@@ -29,31 +53,62 @@ def showSplashScreen():
     splash_screen.overrideredirect(True);
 
 
-showSplashScreen();
+if not(args.headless):
+    showSplashScreen();
+    startup.mark("splash screen");
 
 # %% Logging
 # % diary on;
 # % diary logs.txt;
 
 # %% Construct
-B = MIDI2HTTP_Bridge();
+B = MIDI2HTTP_Bridge(args.config,headless=args.headless,useCache=not(args.no_preset_cache));
+startup.mark("configuration");
+
+# %% Record the MIDI input or replay a recording (the inputs of the recording)
+if args.record:
+    B.MIDI_RecordFile = os.path.abspath(args.record);
+if args.replay:
+    from MidiInputBackends import ReplayMidiBackend;
+    B.midiBackend = ReplayMidiBackend(os.path.abspath(args.replay),realtime=not(args.replay_fast));
+    B.midi_BridgeName = ";".join(B.midiBackend.sourceNames);
 
 # %% Get Available midi devices and set the midi device bridge
 B.selectMidiDeviceInput();
+startup.mark("MIDI device");
 
 # % Matlab how to test with CPU useage.
-B.establishServerConnection();
+# % (the main server and the "[target NAME]" servers of the configuration)
+for T in B.targets:
+    T.establishServerConnection();
+# end
+startup.mark("server connection");
 
 # Handle User Authentication
-B.handleLogin_();
+for T in B.targets:
+    T.handleLogin_();
+# end
+startup.mark("login");
 
 # %% Setup the MIDI to HTTP cue/trigger map
-B.importMidiTriggers();
+for T in B.targets:
+    T.importMidiTriggers();
+# end
+startup.mark("import triggers");
 
 # %% Prepare the HTTP calls
-B.processTriggerMap();
+for T in B.targets:
+    T.processTriggerMap();
+# end
+startup.mark("process triggers");
 B.log(B);
 
+if args.startup_report:
+    B.log(startup.report());
+    if B.presetCache is not None:
+        B.log("Preset cache: %s",B.presetCache.stats());
+
+
 # %% Run the main process loop
 B.runLoop();
 
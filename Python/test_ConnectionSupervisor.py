@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the connection supervisor: a failure degrades the
+# % connection, the failure threshold opens the circuit breaker and only a
+# % recovery from down counts as a reconnect.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from ConnectionSupervisor import ConnectionSupervisor,STATE_CONNECTED,STATE_DEGRADED,STATE_DOWN;
+
+
+class SupervisedBridge:
+        def log(B,*args,**kwargs):
+            pass;
+        # end
+
+        def get_serverURL(B):
+            return "http://127.0.0.1:0";
+        # end
+
+        def onServerConnected(B):
+            pass;
+        # end
+
+        def onServerDown(B):
+            pass;
+        # end
+# end
+
+def test_circuit_breaker():
+    S = ConnectionSupervisor(SupervisedBridge(),failureThreshold=2);
+    S.setState(STATE_CONNECTED);
+    S.reportFailure();
+    assert S.state == STATE_DEGRADED and S.allowRequest();
+    S.reportSuccess();# % Recovered from degraded, not a reconnect
+    assert S.state == STATE_CONNECTED and S.reconnects == 0;
+    S.reportFailure();
+    S.reportFailure();
+    assert S.state == STATE_DOWN;
+    assert not(S.allowRequest()) and S.rejected == 1;
+    S.reportSuccess();
+    assert S.state == STATE_CONNECTED and S.reconnects == 1;
+# end
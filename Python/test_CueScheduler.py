@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the timeline scheduling: the transport position
+# % from the MIDI clock, the cues sent ahead by the latency of their endpoint
+# % (capped), the cues later than the tolerance skipped and counted.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import threading;
+
+import pytest;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from CueScheduler import CueScheduler,MidiTransport,MIDI_START,MIDI_CLOCK,MIDI_SONG_POSITION,MIDI_STOP;
+from TriggerMap import compileTimeline;
+
+# % Match->response latency of the endpoints [s]
+LATENCY = {"/slow":0.3, "/fast":0.01};
+
+
+class FakeTransport:
+        # % A transport at a set position, 120 bpm
+        def __init__(X):
+            X.changed = threading.Event();
+            X.generation = 0;
+            X.beat = None;
+        # end
+
+        def position(X,unit,t):
+            return None if X.beat is None else (X.beat,0.5);
+        # end
+
+        def tempo(X):
+            return 120.;
+        # end
+# end
+
+class FakeLatencyStats:
+        def estimate(E,URL,default):
+            return LATENCY.get(URL,default);
+        # end
+# end
+
+class FakeDispatcher:
+        def __init__(D):
+            D.submitted = [];
+        # end
+
+        def submit(D,target,job):
+            D.submitted.append(job[0].HTTP_URL+job[1]);
+        # end
+# end
+
+class ScheduledBridge:
+        targetName = "Quelea";
+
+        def __init__(B,rows):
+            B.targets = [B];
+            B.timeline = compileTimeline(rows,{"/slow","/fast","/gotoitem"});
+            B.latencyStats = FakeLatencyStats();
+            B.dispatcher = FakeDispatcher();
+            B.warnings = [];
+        # end
+
+        def log(B,msg,*args,level=None,**fields):
+            if msg.startswith("[warning]"):
+                B.warnings.append(msg % args);
+            # end
+        # end
+# end
+
+def timelineRow(position,cue):
+    return {"Position":position, "Mapping":"enabled", "Description":"", "Cue":cue};
+# end
+
+@pytest.fixture
+def scheduler():
+    B = ScheduledBridge([timelineRow("5","/fast"),timelineRow("4","/slow"),timelineRow("6","/gotoitem(2)")]);
+    S = CueScheduler(B,FakeTransport(),leadMaxSec=0.2,lateSec=0.25,defaultLatencySec=0.02);
+    return S, B;
+# end
+
+def test_cues_sent_ahead_by_the_latency(scheduler):
+    S, B = scheduler;
+    S.pollSec = 1.;
+    assert S.step(0.) == 1.;# % Stopped
+    S.transport.beat = 3.5;# % 0.25 s before the slow cue, its lead is capped at 0.2 s
+    assert S.step(0.) == pytest.approx(0.05);
+    assert B.dispatcher.submitted == [];
+    S.transport.beat = 3.7;
+    S.step(0.);
+    assert B.dispatcher.submitted == ["/slow"];
+    S.transport.beat = 4.97;# % 15 ms before the fast cue, its lead is 10 ms
+    S.step(0.);
+    assert B.dispatcher.submitted == ["/slow"];
+    S.transport.beat = 4.99;
+    S.step(0.);
+    assert B.dispatcher.submitted == ["/slow","/fast"];
+    assert S.stats() == {"fired":2, "missed":0, "tempoBPM":120.};
+# end
+
+def test_late_cues_skipped(scheduler):
+    S, B = scheduler;
+    S.transport.beat = 3.;
+    S.step(0.);
+    # % The scheduler fell behind: the slow cue is 0.5 s late, the fast one on time
+    S.transport.beat = 5.;
+    S.step(0.);
+    assert B.dispatcher.submitted == ["/fast"];
+    assert S.missed == 1 and B.warnings == ["[warning]:Timeline cue [/slow] at 4 missed by 500 ms"];
+    # % A jump back resumes the timeline from the new position
+    S.transport.generation += 1;
+    S.transport.beat = 3.9;
+    S.step(0.);
+    assert B.dispatcher.submitted == ["/fast","/slow"];
+    S.transport.generation += 1;
+    S.transport.beat = 6.4;# % 0.2 s after the last cue, within the tolerance: still sent
+    S.step(0.);
+    assert B.dispatcher.submitted == ["/fast","/slow","/gotoitem2"];
+    assert S.missed == 1;
+# end
+
+def test_transport_clock_position():
+    X = MidiTransport();
+    # % Start then 25 ticks 20 ms apart (125 bpm), read at the time of the last tick
+    packets = [[[MIDI_START,0,0,0],0]]+[[[MIDI_CLOCK,0,0,0],n*20] for n in range(25)];
+    X.feed(packets,480,10.);
+    assert X.playing and X.generation == 1;
+    assert X.tempo() == pytest.approx(125.);
+    assert X.position("beats",10.) == pytest.approx((1.,0.48));
+    # % Extrapolated between two ticks, not past the next one
+    assert X.position("beats",10.01)[0] == pytest.approx(1.+0.5/24);
+    assert X.position("beats",11.)[0] == pytest.approx(1.+1/24);
+    # % Song position (16th notes) then a tick: beat 4
+    X.feed([[[MIDI_SONG_POSITION,16,0,0],500],[[MIDI_CLOCK,0,0,0],500]],500,11.);
+    assert X.generation == 2 and X.position("beats",11.)[0] == pytest.approx(4.);
+    X.feed([[[MIDI_STOP,0,0,0],520]],520,11.02);
+    assert X.position("beats",11.02) is None;
+# end
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the launcher of the External Executable/Cmd: the
+# % placeholders of the MIDI message and of the cached read responses, the
+# % timeout of a script in the persistent interpreter and in a new process.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+from collections import namedtuple;
+
+import pytest;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from ExternalLauncher import ExternalLauncher;
+from MidiMessage import MidiMessage;
+
+# % The trigger fields used by the launcher
+LaunchedTrigger = namedtuple("LaunchedTrigger",["ExternalExecutable","ExternalCmd"]);
+
+ECHO_SCRIPT = "import sys; print(' | '.join(sys.argv[1:]));";
+SLEEP_SCRIPT = "import time; time.sleep(5);";
+
+
+class RecordingLog:
+        def __init__(R):
+            R.lines = [];
+        # end
+
+        def __call__(R,msg,*args,**kwargs):
+            R.lines.append(msg % args if args else msg);
+        # end
+# end
+
+def launchAll(baseDir,jobs,pythonWorkers=1,timeoutSec=10.):
+    # % Run the jobs, stop() waits for the queued commands
+    log = RecordingLog();
+    X = ExternalLauncher(log,str(baseDir),maxConcurrent=1,timeoutSec=timeoutSec,pythonWorkers=pythonWorkers,
+                         cacheText=lambda path: {"/lyrics":"Amazing grace"}.get(path,""));
+    for trigger,midi in jobs:
+        assert X.launch(trigger,midi);
+    # end
+    X.stop(timeout=10.);
+    return X.stats(), log.lines;
+# end
+
+@pytest.mark.parametrize("pythonWorkers",[1,0])
+def test_placeholders(tmp_path,pythonWorkers):
+    (tmp_path/"echo.py").write_text(ECHO_SCRIPT);
+    trigger = LaunchedTrigger("echo.py","ch={channel} note={note} vel={velocity} \"{cache:/lyrics}\" {cache:/none}");
+    stats, lines = launchAll(tmp_path,[(trigger,MidiMessage(0x92,3,"NoteOn",60,100,0))],pythonWorkers);
+    assert stats == {"launched":1, "failed":0, "timedOut":0, "dropped":0};
+    # % The cached text is one argument, without quoting (the output is stripped)
+    assert lines[-1].endswith(os.linesep+"ch=3 | note=60 | vel=100 | Amazing grace |");
+    assert "exit:0" in lines[-1];
+# end
+
+@pytest.mark.parametrize("pythonWorkers",[1,0])
+def test_timeout(tmp_path,pythonWorkers):
+    (tmp_path/"sleep.py").write_text(SLEEP_SCRIPT);
+    (tmp_path/"echo.py").write_text(ECHO_SCRIPT);
+    midi = MidiMessage(0x90,1,"NoteOn",60,100,0);
+    stats, lines = launchAll(tmp_path,[(LaunchedTrigger("sleep.py",""),midi),
+                                       (LaunchedTrigger("echo.py","after"),midi)],pythonWorkers,timeoutSec=0.5);
+    assert stats == {"launched":1, "failed":0, "timedOut":1, "dropped":0};
+    assert "timed out after 0.5 s" in lines[0];
+    # % The killed interpreter is replaced for the next script
+    assert lines[1].endswith(os.linesep+"after");
+# end
+
+def test_failed_exit_code(tmp_path):
+    (tmp_path/"fail.py").write_text("import sys; sys.exit(3);");
+    stats, lines = launchAll(tmp_path,[(LaunchedTrigger("fail.py",""),MidiMessage(0x90,1,"NoteOn",60,100,0))]);
+    assert stats == {"launched":1, "failed":1, "timedOut":0, "dropped":0};
+    assert "exit:3" in lines[0];
+# end
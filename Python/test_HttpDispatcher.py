@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the dispatch stage: the priority lanes (urgent jobs
+# % first, the least urgent dropped when full) and the rejected/evicted counts
+# % on their own; the deadlines of the cues and the order of the macro steps
+# % driven through the dispatcher against the presenter stub (stubBridge
+# % fixture of conftest.py).
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import time;
+from collections import namedtuple;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from HttpDispatcher import HttpDispatcher,DispatchLane;
+from TriggerMap import compileMacros;
+
+# % The trigger fields used by the submit of the dispatcher
+SubmittedTrigger = namedtuple("SubmittedTrigger",["HTTP_URL","Macro","Priority"]);
+
+
+class RecordingDispatcher:
+        def __init__(D):
+            D.executed = [];
+        # end
+
+        def execute(D,L,job):
+            D.executed.append(job);
+        # end
+# end
+
+def test_lane_priority_and_eviction():
+    D = RecordingDispatcher();
+    L = DispatchLane(D,"Quelea",3);
+    assert L.put(2,"bulk 1") is None;
+    assert L.put(0,"next") is None;
+    assert L.put(2,"bulk 2") is None;
+    assert L.put(2,"bulk 3") == "bulk 3";# % Full, not more urgent than the queued
+    assert L.put(1,"chord") == "bulk 2";# % The least urgent and newest makes room
+    L.close();# % A full lane still stops once drained
+    L.thread.start();
+    L.thread.join(2.0);
+    assert not(L.thread.is_alive());
+    assert D.executed == ["next","chord","bulk 1"];
+# end
+
+class DispatchedBridge:
+        targetName = "Quelea";
+        supervisor = None;
+
+        def __init__(B):
+            B.targets = [B];
+            B.warnings = [];
+        # end
+
+        def log(B,msg,*args,**kwargs):
+            B.warnings.append(kwargs.get("reason"));
+        # end
+# end
+
+def test_rejected_and_evicted_counted():
+    B = DispatchedBridge();
+    D = HttpDispatcher(B,queueSize=2);
+    L = D.lanes["Quelea"] = DispatchLane(D,"Quelea",2);# % Not started, nothing is sent
+    assert D.submit("Quelea",(SubmittedTrigger("/bulk",(),2),"1",None));
+    assert D.submit("Quelea",(SubmittedTrigger("/bulk",(),2),"2",None));
+    assert not(D.submit("Quelea",(SubmittedTrigger("/bulk",(),2),"3",None)));
+    assert D.submit("Quelea",(SubmittedTrigger("/next",(),0),"",None));
+    assert (D.submitted,D.rejected,D.evicted) == (3,1,1);
+    assert (L.rejected,L.evicted) == (1,1);
+    assert B.warnings == ["rejected","evicted"];
+    assert [job[1] for priority,sequence,job in sorted(L.heap)] == ["","1"];
+# end
+
+def test_expired_cue_dropped(stubBridge,commandTrigger):
+    stub, B = stubBridge;
+    B.handleLogin_();
+    D = B.dispatcher;
+    trigger = commandTrigger(B,"/next")._replace(DeadlineSec=0.5);
+    now = time.perf_counter();
+    # % Read 1 s ago: past the deadline, dropped instead of sent late
+    D.execute(DispatchLane(D,B.targetName,1),(trigger,"",[0.,now-1.,now-1.,now-1.,0.,0.]));
+    assert D.expired == 1 and "/next" not in stub.hits;
+    D.execute(DispatchLane(D,B.targetName,1),(trigger,"",[0.,now,now,now,0.,0.]));
+    assert D.expired == 1 and stub.hits["/next"] == 1;
+# end
+
+def recordOrder(stub):
+    # % The paths in the order the stub received them
+    order = [];
+    count = stub.count;
+    def recordingCount(path):
+        order.append(path);
+        count(path);
+    # end
+    stub.count = recordingCount;
+    return order;
+# end
+
+def test_macro_step_order(stubBridge,execute):
+    stub, B = stubBridge;
+    B.handleLogin_();
+    order = recordOrder(stub);
+    row = {"MacroName":"Next song", "MidiMapping":"enabled", "MidimsgType":"NoteOn", "MidiChanel":"16",
+           "MidiNote_CC":"10", "Steps":"/clear; wait 100; /nextitem; /gotoitem(3); /tlogo"};
+    key, trigger = compileMacros([row],{"/clear","/nextitem","/gotoitem","/tlogo"},
+                                 B.get_serverURL(),B.prepareHttpRequest)[0];
+    tStart = time.perf_counter();
+    execute(B,trigger);
+    assert time.perf_counter()-tStart >= 0.1;
+    assert order == ["/clear","/nextitem","/gotoitem3","/tlogo"];
+    assert B.dispatcher.statusCounts.get((B.targetName,"200")) == 4;
+# end
+
+def test_macro_ends_on_server_error(stubBridge,execute):
+    stub, B = stubBridge;
+    B.handleLogin_();
+    order = recordOrder(stub);
+    row = {"MacroName":"Song start", "MidiMapping":"enabled", "MidimsgType":"NoteOn", "MidiChanel":"16",
+           "MidiNote_CC":"11", "Steps":"/clear; /nextitem"};
+    key, trigger = compileMacros([row],{"/clear","/nextitem"},B.get_serverURL(),B.prepareHttpRequest)[0];
+    stub.errorRate = 1.;
+    execute(B,trigger);
+    assert order == ["/clear"];
+    assert B.dispatcher.statusCounts.get((B.targetName,"500")) == 1;
+# end
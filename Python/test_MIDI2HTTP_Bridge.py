@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the bridge with several server targets: a MIDI
+# % message matching the trigger of both targets is sent to both presenter
+# % stubs, each target on its own dispatch lane (a slow target does not hold
+# % the other back).
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import time;
+import contextlib;
+
+import pytest;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from MIDI2HTTP_Bridge import MIDI2HTTP_Bridge;
+from MidiMessage import MidiMessage;
+from PresenterStubServer import PresenterStubServer;
+
+rootPath = os.path.abspath(os.path.join(os.path.dirname(__file__),".."));
+QUELEA_PRESET = os.path.join(rootPath,"QueleaPreset","daw2server_settingsConfiguration.ini");
+MONITOR_DELAY_MS = 300;
+
+
+@pytest.fixture
+def fanOutBridge(tmp_path):
+    # % The main target and a slow "Monitor" target, both on the Quelea preset
+    main = PresenterStubServer("Quelea").start();
+    monitor = PresenterStubServer("Quelea",delayMs=MONITOR_DELAY_MS).start();
+    configuration = str(tmp_path/"daw2server_settingsConfiguration.ini");
+    with open(QUELEA_PRESET) as file:
+        text = file.read();
+    # end
+    with open(configuration,"w") as file:
+        file.write(text+"\n[target Monitor]\n"+
+                   "Server_Name=\"Monitor\"\n"+
+                   "midi_HttpProtocolPreset=\"./QueleaPreset/Reaper_Quelea_Preset_cues.csv\"\n"+
+                   "Server_IP=\"%s\"\nServer_ControlPort=%i\nServer_password=\"\"\n" % monitor.address());
+    # end
+    with contextlib.redirect_stdout(open(os.devnull,"w")) as output:
+        B = MIDI2HTTP_Bridge(configuration,headless=True,useCache=False);
+        B.Server_IP, B.Server_ControlPort = main.address();
+        B.Server_password, B.Server_CookieCache = "", "";
+        B.Reload_PollSec, B.Metrics_Port = 0, 0;
+        for T in B.targets:
+            T.importMidiTriggers();
+            T.processTriggerMap();
+        # end
+        B.startDispatch();
+        try:
+            yield main, monitor, B;
+        finally:
+            B.stopDispatch();
+            B.logger.stop();
+            main.stop();
+            monitor.stop();
+            output.close();
+        # end
+    # end
+# end
+
+def waitFor(condition,timeout=2.):
+    deadline = time.monotonic()+timeout;
+    while not(condition()) and time.monotonic() < deadline:
+        time.sleep(0.005);
+    # end
+    return condition();
+# end
+
+def test_fan_out_to_all_targets(fanOutBridge):
+    main, monitor, B = fanOutBridge;
+    assert [T.targetName for T in B.targets] == ["Quelea","Monitor"];
+    key, trigger = next((key,trigger) for key,trigger in B.triggerTable.items()
+                        if trigger.HTTP_URL.endswith("/next") and trigger.CoalesceEdge == "none" and not(trigger.ExternalExecutable));
+    assert key in B.targets[1].triggerTable;
+    channel, msgType, note = key[:3];
+    B.handleMidiCallback(MidiMessage(0x90+channel-1,channel,msgType,note,100,0));
+    D = B.dispatcher;
+    # % The main target answers while the monitor is still busy
+    assert waitFor(lambda: D.statusSnapshot().get(("Quelea","200")) == 1);
+    assert D.statusSnapshot().get(("Monitor","200")) is None;
+    assert waitFor(lambda: D.statusSnapshot().get(("Monitor","200")) == 1);
+    assert main.hits == {"/next":1} and monitor.hits == {"/next":1};
+    assert B.midiMatched == 1 and D.failed == 0;
+# end
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the metrics endpoint: the counters of the stages in
+# % the Prometheus text format after a command sent to the presenter stub
+# % (stubBridge fixture of conftest.py), and the escaping of the labels.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import http.client;
+
+import pytest;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from MetricsServer import MetricsServer,labelText,METRICS_PREFIX;
+
+
+@pytest.fixture
+def metricsServer(stubBridge):
+    stub, B = stubBridge;
+    M = MetricsServer(B,"127.0.0.1",0).start();
+    try:
+        yield stub, B, M;
+    finally:
+        M.stop();
+    # end
+# end
+
+def scrape(M,path="/metrics"):
+    connection = http.client.HTTPConnection(*M.address(),timeout=5);
+    try:
+        connection.request("GET",path);
+        response = connection.getresponse();
+        return response.status, response.getheader("Content-Type"), response.read().decode();
+    finally:
+        connection.close();
+    # end
+# end
+
+def samples(text):
+    # % {"name{labels}": value} of the sample lines
+    return {line.rsplit(" ",1)[0]:float(line.rsplit(" ",1)[1]) for line in text.splitlines() if not(line.startswith("#"))};
+# end
+
+def test_metrics_after_a_command(metricsServer,commandTrigger,execute):
+    stub, B, M = metricsServer;
+    B.handleLogin_();
+    execute(B,commandTrigger(B,"/next"));
+    B.midiMatched = 1;
+    status, contentType, text = scrape(M);
+    assert status == 200 and contentType.startswith("text/plain; version=0.0.4");
+    assert "# TYPE "+METRICS_PREFIX+"http_requests_total counter" in text;
+    values = samples(text);
+    assert values[METRICS_PREFIX+"http_requests_total{target=\"Quelea\",status=\"200\"}"] == 1.;
+    assert values[METRICS_PREFIX+"midi_messages_total{result=\"matched\"}"] == 1.;
+    assert values[METRICS_PREFIX+"dispatch_reauth_retries_total"] == 0.;
+    assert values[METRICS_PREFIX+"cache_requests_total{result=\"misses\"}"] == 0.;
+    # % One sample in the histograms of the sent trigger
+    trigger = [name for name in values if name.startswith(METRICS_PREFIX+"latency_seconds_count{")];
+    assert trigger and all(values[name] == 1. for name in trigger);
+    assert all("/next" in name for name in trigger);
+    assert M.scrapes == 1;
+# end
+
+def test_metrics_paths(metricsServer):
+    stub, B, M = metricsServer;
+    assert scrape(M,"/")[0] == 200;
+    assert scrape(M,"/other")[0] == 404;
+# end
+
+def test_label_escaping():
+    assert labelText({}) == "";
+    assert labelText({"trigger":"/say \"hi\"\\\n","le":0.5}) == "{trigger=\"/say \\\"hi\\\"\\\\\\n\",le=\"0.5\"}";
+# end
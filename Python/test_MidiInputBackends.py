@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the MIDI input fan-in: every packet is tagged with
+# % the index of its input in the spare 4th byte, the running status of each
+# % input is expanded on its own and a read is merged in time order.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import time;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from MidiInputBackends import MultiMidiBackend,VirtualMidiBackend;
+from MidiMessage import MidiDecoder;
+
+
+def readAll(M,timeout=2.):
+    packets = [];
+    deadline = time.monotonic()+timeout;
+    while not(M.finished()) and time.monotonic() < deadline:
+        time.sleep(0.01);
+        packets.extend(M.read(64));
+    # end
+    return packets;
+# end
+
+def test_fan_in_source_tagging():
+    # % The packets of both inputs are queued before the first read
+    keys = [[[0x90,60,100,0],0],
+            [[61,90,0,0],1]];# % Running status of the keys input
+    pads = [[[0x99,36,127,0],0],
+            [[38,80,0,0],1],
+            [[0xB9,7,64,0],2]];
+    backend = VirtualMidiBackend("Keys;Pads",realtime=False);
+    M = MultiMidiBackend([(VirtualMidiBackend("Keys",keys,realtime=False),backend.listDevices()[0]),
+                          (VirtualMidiBackend("Pads",pads,realtime=False),backend.listDevices()[1])]);
+    M.open();
+    try:
+        time.sleep(0.05);
+        packets = readAll(M);
+    finally:
+        M.close();
+    # end
+    assert sorted(data for data,timestamp in packets) == sorted([
+        [0x90,60,100,0],[0x90,61,90,0],
+        [0x99,36,127,1],[0x99,38,80,1],[0xB9,7,64,1]]);
+    # % Merged in time order within the read
+    assert [timestamp for data,timestamp in packets] == sorted(timestamp for data,timestamp in packets);
+    # % The decoded messages keep the source input
+    messages = MidiDecoder().decodeBatch(packets);
+    assert {(m.Source,m.Channel,m.Type) for m in messages} == {(0,1,"NoteOn"),(1,10,"NoteOn"),(1,10,"ControlChange")};
+# end
+
+def test_fan_in_finished_after_all_inputs():
+    quick = [[[0x90,60,100,0],0]];
+    slow = [[[0x90,62,100,0],0],[[0x90,64,100,0],150]];
+    M = MultiMidiBackend([(VirtualMidiBackend("Quick",quick,realtime=False),{'device_id':0}),
+                          (VirtualMidiBackend("Slow",slow,realtime=True),{'device_id':1})]);
+    M.open();
+    try:
+        time.sleep(0.05);
+        assert not(M.finished());# % The slow input is still playing
+        packets = M.read(64);
+        packets.extend(readAll(M));
+    finally:
+        M.close();
+    # end
+    assert M.finished();
+    assert [data[1] for data,timestamp in packets] == [60,62,64];
+# end
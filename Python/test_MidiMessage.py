@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the MIDI decoder: the running status, the system
+# % real-time/common messages, the pitch bend and the accept filter.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from MidiMessage import MidiDecoder;
+
+
+def test_decoder_running_status():
+    D = MidiDecoder();
+    messages = D.decodeBatch([[[0x91,60,100,0],0],
+                              [[0xF8,0,0,0],1],# % Real-time, the running status is kept
+                              [[62,90,0,0],2],
+                              [[64,0,0,0],3]]);# % Velocity 0 is a NoteOff
+    assert [(m.Channel,m.Type,m.Note_CC,m.Velocity) for m in messages] == \
+           [(2,"NoteOn",60,100),(2,"NoteOn",62,90),(2,"NoteOff",64,0)];
+    # % Kept between the reads, cancelled by a system common message
+    assert D.decode([[65,70,0,0],4]).Note_CC == 65;
+    assert D.decodeBatch([[[0xF2,0,0,0],5],[[66,70,0,0],6]]) == [];
+# end
+
+def test_decoder_pitch_bend_and_filter():
+    D = MidiDecoder();
+    bend = D.decode([[0xE0,0x01,0x40,0],0]);
+    assert (bend.Type,bend.Note_CC,bend.Velocity) == ("PitchBend",0,(0x40 << 7) | 0x01);
+    assert D.decodeBatch([[[0xB0,7,10,0],0],[[0x90,60,1,0],1]],acceptFilter={(1,"NoteOn")})[0].Type == "NoteOn";
+# end
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the record-and-replay of the MIDI input: the binary
+# % records read back from the memory mapped file, the replay backend at the
+# % recorded timing and per recorded input, an interrupted recording.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import time;
+
+import pytest;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from MidiRecorder import MidiRecorder,MidiRecording,MIDI_RECORD;
+from MidiInputBackends import ReplayMidiBackend;
+
+# % Two reads of the fan-in: (read time after the start [s], packets)
+READS = [(0.0, [[[0x90,60,100,0],1000],[[0xB0,7,64,1],1001]]),
+         (0.1, [[[0x80,60,0,0],1100]])];
+
+
+def record(filePath,chunkBytes=16):
+    # % A small chunk size: the writer thread gets several chunks
+    R = MidiRecorder(str(filePath),["Keys","Pads"],chunkBytes=chunkBytes).start();
+    for readTime, packets in READS:
+        R.write(packets,R.t0+readTime);
+    # end
+    R.close();
+    return R;
+# end
+
+def replay(M,timeout=2.):
+    M.open(None);
+    packets = [];
+    deadline = time.monotonic()+timeout;
+    while not(M.finished()) and time.monotonic() < deadline:
+        time.sleep(0.005);
+        packets.extend(M.read(64));
+    # end
+    return packets;
+# end
+
+def test_record_round_trip(tmp_path):
+    filePath = tmp_path/"session.midirec";
+    assert record(filePath).records == 3;
+    P = MidiRecording(str(filePath));
+    try:
+        assert P.sourceNames == ["Keys","Pads"] and P.count == 3;
+        assert abs(P.startTime-time.time()) < 60.;
+        records = list(P.records());
+        assert [r[1:] for r in records] == [(1000,0x90,60,100,0),(1001,0xB0,7,64,1),(1100,0x80,60,0,0)];
+        # % Read times in microseconds since the start
+        assert records[0][0] == records[1][0] == 0 and abs(records[2][0]-100000) <= 1;
+    finally:
+        P.close();
+    # end
+# end
+
+def test_replay_timing(tmp_path):
+    filePath = tmp_path/"session.midirec";
+    record(filePath);
+    tStart = time.perf_counter();
+    packets = replay(ReplayMidiBackend(str(filePath),realtime=True));
+    assert time.perf_counter()-tStart >= 0.1;
+    # % The timestamps keep their distance from the first packet
+    assert packets == [[[0x90,60,100,0],0],[[0xB0,7,64,1],1],[[0x80,60,0,0],100]];
+# end
+
+def test_replay_per_input(tmp_path):
+    filePath = tmp_path/"session.midirec";
+    record(filePath);
+    M = ReplayMidiBackend(str(filePath),realtime=False);
+    devices = M.listDevices();
+    assert [device['name'] for device in devices] == ["Keys","Pads"];
+    pads = replay(M.portBackend(devices[1]));
+    assert [data for data,timestamp in pads] == [[0xB0,7,64,1]];
+    assert [data for data,timestamp in replay(M)] == [data for readTime,packets in READS for data,timestamp in packets];
+# end
+
+def test_interrupted_recording(tmp_path):
+    filePath = tmp_path/"session.midirec";
+    record(filePath);
+    with open(filePath,"ab") as file:
+        file.write(b"\x01"*(MIDI_RECORD.size-1));# % A partial last record
+    # end
+    P = MidiRecording(str(filePath));
+    assert P.count == 3;
+    P.close();
+    other = tmp_path/"other.bin";
+    other.write_bytes(b"not a recording");
+    with pytest.raises(Exception,match="is not a MIDI recording"):
+        MidiRecording(str(other));
+    # end
+# end
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the presenter stub server of the offline benchmark:
+# % the login of Quelea (307 -> password form -> session cookie, expire()),
+# % the ETag revalidation of the canned answers and the error rate.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import http.client;
+
+import pytest;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from PresenterStubServer import PresenterStubServer;
+
+
+@pytest.fixture
+def stub():
+    S = PresenterStubServer("Quelea",password="stub").start();
+    try:
+        yield S;
+    finally:
+        S.stop();
+    # end
+# end
+
+def request(S,method,path,body=None,headers={}):
+    connection = http.client.HTTPConnection(*S.address(),timeout=5);
+    try:
+        connection.request(method,path,body,headers);
+        response = connection.getresponse();
+        return response.status, dict(response.getheaders()), response.read();
+    finally:
+        connection.close();
+    # end
+# end
+
+def test_login_and_expiry(stub):
+    assert request(stub,"GET","/next")[0] == 307;
+    status, headers, body = request(stub,"GET","/");
+    assert status == 200 and b"password" in body;
+    status, headers, body = request(stub,"POST","/","password=stub",
+                                    {"Content-Type":"application/x-www-form-urlencoded"});
+    cookie = headers["Set-Cookie"].split(";")[0];
+    assert cookie == "session=1";
+    assert request(stub,"GET","/next",headers={"Cookie":cookie})[0] == 200;
+    # % Only the last issued session is valid
+    stub.expire();
+    assert request(stub,"GET","/next",headers={"Cookie":cookie})[0] == 307;
+    assert stub.hits["/next"] == 3;
+# end
+
+def test_wrong_password(stub):
+    status, headers, body = request(stub,"POST","/","password=wrong");
+    assert status == 200 and "Set-Cookie" not in headers and stub.sessions == 0;
+# end
+
+def test_etag_revalidation():
+    S = PresenterStubServer("Quelea").start();
+    try:
+        status, headers, body = request(S,"GET","/lyrics");
+        assert status == 200 and body.startswith(b"<p>Amazing grace");
+        assert request(S,"GET","/lyrics",headers={"If-None-Match":headers["ETag"]})[0] == 304;
+        assert request(S,"GET","/lyrics",headers={"If-None-Match":"\"other\""})[0] == 200;
+        assert S.notModified == 1;
+        # % The commands get a plain "OK", without an ETag
+        status, headers, body = request(S,"GET","/next");
+        assert (status,body) == (200,b"OK") and "ETag" not in headers;
+    finally:
+        S.stop();
+    # end
+# end
+
+def test_error_rate():
+    S = PresenterStubServer("OpenLP",errorRate=1.).start();
+    try:
+        assert request(S,"GET","/api/poll")[0] == 500;
+        assert S.errors == 1 and S.totalHits() == 1;
+    finally:
+        S.stop();
+    # end
+# end
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the preset cache: a miss builds and stores the
+# % entry, a warm start hits it without the build, an edited source file or a
+# % corrupt cache file rebuilds it. A second bridge on the same configuration
+# % starts from the cache.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import shutil;
+import contextlib;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from PresetCache import PresetCache,cachePath;
+from MIDI2HTTP_Bridge import MIDI2HTTP_Bridge;
+
+rootPath = os.path.abspath(os.path.join(os.path.dirname(__file__),".."));
+QUELEA_PRESET = os.path.join(rootPath,"QueleaPreset","daw2server_settingsConfiguration.ini");
+
+
+class RecordingBuild:
+        def __init__(R):
+            R.calls = 0;
+        # end
+
+        def __call__(R,sourcePath):
+            R.calls += 1;
+            with open(sourcePath) as file:
+                return file.read().splitlines();
+            # end
+        # end
+# end
+
+def ignoreLog(msg,*args,**kwargs):
+    pass;
+# end
+
+def test_hit_miss_and_invalidation(tmp_path):
+    source = tmp_path/"cues.csv";
+    source.write_text("HTTP_URL\n/next\n");
+    filePath = cachePath(str(tmp_path/"settings.ini"));
+    assert filePath == str(tmp_path/"settings.presetcache");
+    build = RecordingBuild();
+    C = PresetCache(filePath,ignoreLog);
+    assert C.load("preset",str(source),build) == ["HTTP_URL","/next"];
+    assert C.load("preset",str(source),build) == ["HTTP_URL","/next"];
+    assert C.stats() == {"hits":1, "misses":1} and build.calls == 1;
+    # % Warm start: loaded from the cache file, without the build
+    C = PresetCache(filePath,ignoreLog);
+    assert C.load("preset",str(source),build) == ["HTTP_URL","/next"];
+    assert C.stats() == {"hits":1, "misses":0} and build.calls == 1;
+    # % An edited source is rebuilt, the kind is part of the key
+    source.write_text("HTTP_URL\n/prev\n");
+    assert C.load("preset",str(source),build) == ["HTTP_URL","/prev"];
+    assert C.load("macros",str(source),build) == ["HTTP_URL","/prev"];
+    assert C.stats() == {"hits":1, "misses":2} and build.calls == 3;
+    assert PresetCache(filePath,ignoreLog).load("preset",str(source),build) == ["HTTP_URL","/prev"];
+    assert build.calls == 3;
+# end
+
+def test_corrupt_cache_rebuilt(tmp_path):
+    source = tmp_path/"cues.csv";
+    source.write_text("HTTP_URL\n/next\n");
+    filePath = cachePath(str(tmp_path/"settings.ini"));
+    with open(filePath,"wb") as file:
+        file.write(b"not a pickle");
+    # end
+    warnings = [];
+    build = RecordingBuild();
+    C = PresetCache(filePath,lambda msg,*args,**kwargs: warnings.append(msg));
+    assert len(warnings) == 1 and "not loaded" in warnings[0];
+    assert C.load("preset",str(source),build) == ["HTTP_URL","/next"];
+    assert PresetCache(filePath,ignoreLog).load("preset",str(source),build) == ["HTTP_URL","/next"];
+    assert build.calls == 1;
+# end
+
+def test_bridge_warm_start(tmp_path):
+    configuration = str(tmp_path/"daw2server_settingsConfiguration.ini");
+    shutil.copy(QUELEA_PRESET,configuration);
+    stats = [];
+    with contextlib.redirect_stdout(open(os.devnull,"w")) as output:
+        for start in range(2):
+            B = MIDI2HTTP_Bridge(configuration,headless=True,useCache=True);
+            B.importMidiTriggers();
+            B.processTriggerMap();
+            stats.append(B.presetCache.stats());
+            triggers = dict(B.triggerTable);
+            B.logger.stop();
+        # end
+        output.close();
+    # end
+    assert stats[0]["hits"] == 0 and stats[0]["misses"] > 0;
+    assert stats[1] == {"hits":stats[0]["misses"], "misses":0};
+    assert os.path.isfile(cachePath(configuration)) and triggers;
+# end
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the hot reload of the configuration file: the live
+# % settings are applied while running, the restart-only ones are reported
+# % and kept, an invalid file keeps the current settings.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import time;
+import shutil;
+import contextlib;
+
+import pytest;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from MIDI2HTTP_Bridge import MIDI2HTTP_Bridge;
+from PresetWatcher import PresetWatcher;
+
+rootPath = os.path.abspath(os.path.join(os.path.dirname(__file__),".."));
+QUELEA_PRESET = os.path.join(rootPath,"QueleaPreset","daw2server_settingsConfiguration.ini");
+
+
+@pytest.fixture
+def watchedBridge(tmp_path):
+    # % A bridge on a copy of the Quelea configuration (the presets stay in the repository)
+    configuration = str(tmp_path/"daw2server_settingsConfiguration.ini");
+    shutil.copy(QUELEA_PRESET,configuration);
+    with contextlib.redirect_stdout(open(os.devnull,"w")) as output:
+        B = MIDI2HTTP_Bridge(configuration,headless=True,useCache=False);
+        B.importMidiTriggers();
+        B.processTriggerMap();
+        warnings = [];
+        log = B.log;
+        def recordingLog(msg,*args,**kwargs):
+            if msg.startswith("[warning]"):
+                warnings.append(msg);
+            # end
+            log(msg,*args,**kwargs);
+        # end
+        B.log = recordingLog;
+        try:
+            yield B, PresetWatcher(B,pollSec=0.02), warnings;
+        finally:
+            B.logger.stop();
+            output.close();
+        # end
+    # end
+# end
+
+def editConfiguration(B,old,new):
+    with open(B.configuration_filepath) as file:
+        text = file.read();
+    # end
+    assert old in text;
+    with open(B.configuration_filepath,"w") as file:
+        file.write(text.replace(old,new,1));
+    # end
+# end
+
+def test_live_settings_applied(watchedBridge):
+    B, W, warnings = watchedBridge;
+    editConfiguration(B,'Log_Level="info"','Log_Level="debug"');
+    editConfiguration(B,"HTTP_ReadTimeoutSec=2.0","HTTP_ReadTimeoutSec=3.5");
+    W.start();
+    try:
+        deadline = time.monotonic()+2.;
+        while W.reloads == 0 and time.monotonic() < deadline:
+            time.sleep(0.01);
+        # end
+    finally:
+        W.stop();
+    # end
+    assert W.stats() == {"reloads":1, "errors":0};
+    assert B.Log_Level == "debug";
+    assert B.httpTimeout == (0.5,3.5);
+    assert warnings == [];
+# end
+
+def test_restart_only_settings_kept(watchedBridge):
+    B, W, warnings = watchedBridge;
+    editConfiguration(B,"Dispatch_QueueSize=64","Dispatch_QueueSize=8");
+    editConfiguration(B,"Schedule_LateMs=250","Schedule_LateMs=100");
+    assert not(W.reloadConfiguration(B));# % No trigger setting changed
+    assert B.Dispatch_QueueSize == 64;
+    assert B.Schedule_LateMs == 100;
+    assert warnings == ["[warning]:Property [Dispatch_QueueSize] changed, it applies after a restart"];
+    # % A new server address recompiles the trigger requests
+    editConfiguration(B,"Server_ControlPort=1112","Server_ControlPort=1113");
+    assert W.reloadConfiguration(B);
+    assert B.Server_ControlPort == 1113;
+# end
+
+def test_invalid_configuration_kept(watchedBridge):
+    B, W, warnings = watchedBridge;
+    editConfiguration(B,'Log_Level="info"','Log_Level="debug"');
+    editConfiguration(B,"Dispatch_QueueSize=64","Dispatch_QueueSize=many");
+    assert not(W.reloadConfiguration(B));
+    assert B.Log_Level == "info";
+    assert W.stats() == {"reloads":0, "errors":1};
+    assert len(warnings) == 1 and "not reloaded" in warnings[0] and "Dispatch_QueueSize" in warnings[0];
+# end
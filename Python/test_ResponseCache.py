@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the response cache of the read triggers: the TTL,
+# % the revalidation (304), the LRU eviction, the invalidation by a command,
+# % the error responses left uncached; then the reads of the presenter stub
+# % through the dispatcher, with the circuit breaker open, and the /cache
+# % query (stubBridge fixture of conftest.py).
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import json;
+
+import pytest;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from ResponseCache import ResponseCache,cacheQuery;
+from ConnectionSupervisor import ConnectionSupervisor,STATE_DOWN;
+
+
+class FakeResponse:
+        def __init__(R,status_code,content=b"",headers={}):
+            R.status_code = status_code;
+            R.content = content;
+            R.headers = headers;
+        # end
+# end
+
+class RecordingSend:
+        # % The server: answers from a list, records the headers of the requests
+        def __init__(R,*responses):
+            R.responses = list(responses);
+            R.requests = [];
+        # end
+
+        def __call__(R,headers):
+            R.requests.append(headers);
+            response = R.responses.pop(0);
+            if isinstance(response,Exception):
+                raise response;
+            # end
+            return response;
+        # end
+# end
+
+def expire(C,key):
+    # % Age the entry past the TTL
+    C.entries[key].fetchedAt -= C.ttlSec;
+# end
+
+def test_ttl_and_revalidation():
+    C = ResponseCache(maxEntries=4,ttlSec=2.);
+    key = ("Quelea","/lyrics");
+    send = RecordingSend(FakeResponse(200,b"Amazing grace",{"ETag":"\"v1\"","Content-Type":"text/html"}),
+                         FakeResponse(304),
+                         FakeResponse(200,b"How sweet the sound",{"ETag":"\"v2\""}));
+    entry = C.fetch(key,send);
+    assert (entry.status,entry.text(),entry.contentType) == (200,"Amazing grace","text/html");
+    assert C.fetch(key,send) is entry;# % Fresh
+    expire(C,key);
+    assert C.fetch(key,send) is entry and C.fresh(entry);# % Unchanged: 304
+    C.invalidate("Quelea");
+    assert C.fetch(key,send).text() == "How sweet the sound";
+    assert send.requests == [{},{"If-None-Match":"\"v1\""},{"If-None-Match":"\"v1\""}];
+    assert C.stats() == {"entries":1, "hits":1, "misses":2, "revalidated":1, "evicted":0};
+    assert C.text("/lyrics") == "How sweet the sound" and C.text("/chords") == "";
+# end
+
+def test_lru_eviction():
+    C = ResponseCache(maxEntries=2,ttlSec=2.);
+    for path in ["/lyrics","/chords"]:
+        C.fetch(("Quelea",path),RecordingSend(FakeResponse(200,path.encode())));
+    # end
+    C.fetch(("Quelea","/lyrics"),None);# % A hit, now the most recently used
+    C.fetch(("Quelea","/status"),RecordingSend(FakeResponse(200,b"Lyrics")));
+    assert list(C.entries) == [("Quelea","/lyrics"),("Quelea","/status")];
+    assert C.evicted == 1 and not(("Quelea","/chords") in C.fetchLocks);
+    # % Another target is not invalidated
+    C.invalidate("Monitor");
+    assert all(C.fresh(entry) for entry in C.entries.values());
+# end
+
+def test_errors_not_cached():
+    C = ResponseCache(maxEntries=2,ttlSec=2.);
+    key = ("Quelea","/lyrics");
+    assert C.fetch(key,RecordingSend(FakeResponse(500,b"stub error"))).status == 500;
+    with pytest.raises(ConnectionError):
+        C.fetch(key,RecordingSend(ConnectionError("refused")));
+    # end
+    assert not(C.entries) and not(C.fetchLocks);
+    # % Disabled cache: every read is sent
+    C = ResponseCache(maxEntries=0);
+    send = RecordingSend(FakeResponse(200,b"1"),FakeResponse(200,b"2"));
+    assert C.fetch(key,send).text() == "1" and C.fetch(key,send).text() == "2";
+# end
+
+def test_reads_through_the_dispatcher(stubBridge,commandTrigger,execute):
+    stub, B = stubBridge;
+    B.handleLogin_();
+    D = B.dispatcher;
+    trigger = B.readTriggers["/lyrics"];
+    assert D.fetch(B,trigger,"/lyrics").text().startswith("<p>Amazing grace");
+    assert D.fetch(B,trigger,"/lyrics").status == 200;
+    assert stub.hits["/lyrics"] == 1;
+    # % A command marks the responses stale: revalidated (304) on the next read
+    execute(B,commandTrigger(B,"/next"));
+    assert D.fetch(B,trigger,"/lyrics").status == 200;
+    assert stub.hits["/lyrics"] == 2 and stub.notModified == 1;
+    assert B.responseCache.stats()["revalidated"] == 1;
+    # % The query endpoint of the metrics server
+    status, contentType, body, headers = cacheQuery(B,"/cache?path=/lyrics");
+    assert status == 200 and body.startswith(b"<p>Amazing grace") and "Age" in headers;
+    status, contentType, body, headers = cacheQuery(B,"/cache");
+    index = json.loads(body);
+    assert [entry["path"] for entry in index["entries"]] == ["/lyrics"];
+    assert "/lyrics" in index["readPaths"][B.targetName];
+    assert cacheQuery(B,"/cache?path=/none")[0] == 404;
+    assert cacheQuery(B,"/cache?path=/lyrics&target=Other")[0] == 404;
+# end
+
+def test_reads_while_the_server_is_down(stubBridge):
+    stub, B = stubBridge;
+    B.handleLogin_();
+    D = B.dispatcher;
+    D.fetch(B,B.readTriggers["/lyrics"],"/lyrics");
+    # % Circuit open: the last response, no request to the server
+    B.supervisor = ConnectionSupervisor(B,failureThreshold=1);
+    B.supervisor.state = STATE_DOWN;
+    try:
+        B.responseCache.invalidate(B.targetName);
+        assert D.fetch(B,B.readTriggers["/lyrics"],"/lyrics").text().startswith("<p>Amazing grace");
+        with pytest.raises(ConnectionError,match="is down"):
+            D.fetch(B,B.readTriggers["/chords"],"/chords");
+        # end
+        assert cacheQuery(B,"/cache?path=/chords")[0] == 502;
+        assert stub.hits["/lyrics"] == 1 and not("/chords" in stub.hits);
+        assert B.supervisor.rejected == 3;
+    finally:
+        B.supervisor = None;
+    # end
+# end
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the command transports: the WebSocket frames
+# % (masking, the extended lengths), the handshake key, and the WebSocket
+# % transport against the presenter stub (stubBridge fixture of conftest.py):
+# % a refused handshake logs in again, the frames are counted as sent.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import io;
+
+import pytest;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from ServerTransport import createServerTransport,encodeFrame,readFrame,websocketAccept,WEBSOCKET_TEXT,WEBSOCKET_CLOSE;
+
+
+def test_handshake_accept():
+    # % The example of RFC 6455
+    assert websocketAccept("dGhlIHNhbXBsZSBub25jZQ==") == "s3pPLMBiTxaQ9kYGzzhZRbK+xOo=";
+# end
+
+@pytest.mark.parametrize("length",[0,5,125,126,65535,65536])
+@pytest.mark.parametrize("mask",[True,False])
+def test_frame_round_trip(length,mask):
+    payload = bytes(n % 251 for n in range(length));
+    frame = encodeFrame(WEBSOCKET_TEXT,payload,mask=mask);
+    assert frame[0] == 0x80 | WEBSOCKET_TEXT and bool(frame[1] & 0x80) == mask;
+    if mask and length:
+        assert not(payload in frame);
+    # end
+    stream = io.BytesIO(frame);
+    assert readFrame(stream.read) == (WEBSOCKET_TEXT,payload);
+    assert stream.read() == b"";
+    assert readFrame(io.BytesIO(encodeFrame(WEBSOCKET_CLOSE,b"\x03\xe8")).read) == (WEBSOCKET_CLOSE,b"\x03\xe8");
+# end
+
+def test_websocket_relogin_after_expiry(stubBridge,commandTrigger,execute):
+    stub, B = stubBridge;
+    B.Server_Transport, B.Server_WebSocketPort = "websocket", 0;
+    B.serverTransport = createServerTransport(B);
+    trigger = commandTrigger(B,"/next");
+    D = B.dispatcher;
+    # % Refused handshake without a login: logged in and resent
+    execute(B,trigger);
+    assert D.reauthRetries == 1 and stub.websockets == 1;
+    # % A new login reopens the socket with the new session cookie
+    stub.expire();
+    B.Server_loggedIN = False;
+    B.handleLogin_();
+    execute(B,trigger);
+    assert stub.websockets == 2 and D.failed == 0;
+    B.serverTransport.close();
+    assert stub.hits["/next"] == 2;
+    # % The frames are counted as sent, not as answered, and kept out of the latency estimate
+    assert D.statusSnapshot().get((B.targetName,"sent")) == 2;
+    assert D.statusSnapshot().get((B.targetName,"200")) is None;
+    assert B.latencyStats.estimate(trigger.HTTP_URL,-1.) == -1.;
+# end
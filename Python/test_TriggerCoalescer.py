@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the per-endpoint coalescer: a burst of one trigger
+# % sends its first, its last or both values, depending on the edge.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+import time;
+from collections import namedtuple;
+
+import pytest;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from TriggerCoalescer import TriggerCoalescer;
+
+# % The trigger fields used by the coalescer
+CoalescedTrigger = namedtuple("CoalescedTrigger",["HTTP_URL","CoalesceEdge","CoalesceInterval"]);
+
+
+def coalesce(edge,values,interval=0.05):
+    sent = [];
+    C = TriggerCoalescer(lambda target,job: sent.append(job[1]));
+    trigger = CoalescedTrigger("/cc",edge,interval);
+    for value in values:
+        C.offer("Quelea",(trigger,value,None));
+    # end
+    time.sleep(interval*3);
+    C.stop();
+    return sent, C;
+# end
+
+@pytest.mark.parametrize("edge,expected,coalesced",[
+    ("leading",["1"],2),
+    ("trailing",["3"],2),
+    ("both",["1","3"],1),
+])
+def test_coalescer_edges(edge,expected,coalesced):
+    sent, C = coalesce(edge,["1","2","3"]);
+    assert sent == expected;
+    assert C.coalesced == coalesced;
+# end
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the compiled trigger map: the lookup table keyed by
+# % (MIDI channel, message type, note/CC), the rows limited to one MIDI input,
+# % the macro steps and the rejection of the duplicate MIDI mappings at load
+# % time.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+
+import pytest;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+from TriggerMap import compileTriggerTable,compileMacros,triggerKey,triggerChannelTypes,hasSourceTriggers,MacroStep;
+
+
+def triggerRow(HTTP_URL,channel,msgType,noteCC,**columns):
+    # % One enabled row of the preset, as imported from the CSV (empty cells are NaN)
+    row = {"HTTP_URL":HTTP_URL, "ServerAPI":"Quelea", "Description":float("nan"), "GroupType":"Navigate",
+           "ActionTypeArguments":"void action()", "MidimsgType":msgType, "MidiChanel":channel,
+           "MidiNote_CC":noteCC, "ExternalExecutable":float("nan"), "ExternalCmd":float("nan")};
+    row.update(columns);
+    return row;
+# end
+
+def test_compile_lookup():
+    rows = [triggerRow("/next",1,"NoteOn",60.0),
+            triggerRow("/prev",1,"NoteOn",61),
+            triggerRow("/section",2,"ControlChange","7",ActionTypeArguments="void action(int velocity)")];
+    table = compileTriggerTable(rows,prepareRequest=lambda URL: "GET "+URL);
+    assert len(table) == 3;
+    # % The CSV floats/strings and the decoded messages give the same key
+    trigger = table[triggerKey(1,"NoteOn",60)];
+    assert (trigger.HTTP_URL,trigger.Request,trigger.Description) == ("/next","GET /next","");
+    assert table[(2,"ControlChange",7)].ActionTypeArguments == "void action(int velocity)";
+    assert triggerKey(1,"NoteOn",62) not in table;
+    assert triggerChannelTypes(table) == {(1,"NoteOn"),(2,"ControlChange")};
+    # % Immutable once compiled
+    with pytest.raises(TypeError):
+        table[(3,"NoteOn",1)] = trigger;
+    # end
+# end
+
+def test_duplicate_mapping_rejected():
+    rows = [triggerRow("/next",1,"NoteOn",60),
+            triggerRow("/blank",1,"NoteOn",60.0)];
+    with pytest.raises(Exception,match=r"Multiple MIDI triggers matching \(1, 'NoteOn', 60\).*\[/next\] and \[/blank\]"):
+        compileTriggerTable(rows);
+    # end
+# end
+
+def test_incomplete_mapping_rejected():
+    with pytest.raises(Exception,match=r"Incomplete MIDI mapping for trigger \[/next\]"):
+        compileTriggerTable([triggerRow("/next",1,"NoteOn",float("nan"))]);
+    # end
+# end
+
+def test_source_keyed_triggers():
+    rows = [triggerRow("/next",1,"NoteOn",60),
+            triggerRow("/blank",1,"NoteOn",60,MidiSource=" Pads "),# % Same note, only from the pads
+            triggerRow("/logo",1,"NoteOn",61,MidiSource=float("nan"))];
+    table = compileTriggerTable(rows);
+    assert table[(1,"NoteOn",60)].HTTP_URL == "/next";
+    assert table[(1,"NoteOn",60,"Pads")].HTTP_URL == "/blank";
+    assert table[(1,"NoteOn",61)].MidiSource == "";
+    assert hasSourceTriggers(table) and not(hasSourceTriggers(compileTriggerTable(rows[:1])));
+    assert triggerChannelTypes(table) == {(1,"NoteOn")};
+# end
+
+def macroRow(name,channel,noteCC,steps,mapping="enabled"):
+    # % One row of the macro preset, as read from the CSV (strings)
+    return {"MacroName":name, "MidiMapping":mapping, "Description":"", "MidimsgType":"NoteOn",
+            "MidiChanel":str(channel), "MidiNote_CC":str(noteCC), "MidiSource":"", "Steps":steps};
+# end
+
+PRESET_PATHS = {"/clear","/nextitem","/gotoitem","/tlogo"};
+
+def test_compile_macros():
+    macros = compileMacros([macroRow("Next song",16,10,"/clear; wait 50; /nextitem; wait 0.2 s; /gotoitem( 3 )"),
+                            macroRow("Unused",16,11,"/tlogo",mapping="disabled")],
+                           PRESET_PATHS,"http://stub",prepareRequest=lambda URL: "GET "+URL,
+                           priorityGroups="Macro:1:800; *:2:0");
+    assert len(macros) == 1;
+    key, trigger = macros[0];
+    assert key == (16,"NoteOn",10);
+    assert (trigger.HTTP_URL,trigger.GroupType,trigger.Priority,trigger.DeadlineSec) == ("http://stub/[macro] Next song","Macro",1,0.8);
+    # % The steps in the order of the row
+    assert trigger.Macro == (MacroStep("GET http://stub/clear","",0.,"http://stub/clear"),
+                             MacroStep(None,"",0.05,""),
+                             MacroStep("GET http://stub/nextitem","",0.,"http://stub/nextitem"),
+                             MacroStep(None,"",0.2,""),
+                             MacroStep("GET http://stub/gotoitem","3",0.,"http://stub/gotoitem"));
+    # % In the lookup table with the trigger rows
+    table = compileTriggerTable([triggerRow("/next",16,"NoteOn",8)],macros=macros);
+    assert table[(16,"NoteOn",10)] is trigger;
+    with pytest.raises(Exception,match=r"Multiple MIDI triggers matching \(16, 'NoteOn', 10\)"):
+        compileTriggerTable([triggerRow("/next",16,"NoteOn",10)],macros=macros);
+    # end
+# end
+
+@pytest.mark.parametrize("steps,error",[
+    ("/clear; /unknown",r"step \[/unknown\] is not a preset row"),
+    ("/clear; wait soon",r"step \[wait soon\] is not a preset row"),
+    ("wait 100",r"has no steps"),
+])
+def test_invalid_macro_rejected(steps,error):
+    with pytest.raises(Exception,match=r"Macro \[Broken\] "+error):
+        compileMacros([macroRow("Broken",16,12,steps)],PRESET_PATHS);
+    # end
+# end
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# %
+# % Description: Checks of the programmatic login against the presenter stub
+# % (stubBridge fixture of conftest.py): the prepared requests carry the
+# % session cookie, an expired login (307) is renewed and the command resent.
+# %
+# % Author: JessyJP (2020) % License: GPLv3 @ LICENCE.md
+# %
+
+import os, sys;
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)));
+
+
+def test_relogin_after_expiry(stubBridge,commandTrigger,execute):
+    stub, B = stubBridge;
+    trigger = commandTrigger(B,"/next");
+    D = B.dispatcher;
+    # % Prepared before the login: the cookie of the session is sent
+    B.handleLogin_();
+    assert B.Server_loggedIN;
+    execute(B,trigger);
+    assert D.statusCounts.get((B.targetName,"200")) == 1;
+    # % The login expires: 307, a new login and the command resent once
+    stub.expire();
+    execute(B,trigger);
+    assert D.statusCounts.get((B.targetName,"307")) == 1;
+    assert D.reauthRetries == 1;
+    assert D.statusCounts.get((B.targetName,"200")) == 2;
+    assert stub.hits["/next"] == 3;
+    # % The next command goes through with the new session
+    execute(B,trigger);
+    assert D.statusCounts.get((B.targetName,"200")) == 3 and D.failed == 0;
+# end